@@ -19,22 +19,24 @@
 
 from django.conf import settings
 from django.shortcuts import get_object_or_404
+from rest_framework import filters
 from rest_framework import permissions
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 from rest_framework.serializers import HyperlinkedIdentityField
+from rest_framework.settings import api_settings
 
 
-class LinkHeaderPagination(PageNumberPagination):
-    """Provide pagination based on rfc5988.
+class LinkHeaderMixin(object):
+    """Provide pagination links based on rfc5988.
 
     This is the Link header, similar to how GitHub does it. See:
 
        https://tools.ietf.org/html/rfc5988#section-5
        https://developer.github.com/guides/traversing-with-pagination
     """
-    page_size = max_page_size = settings.REST_RESULTS_PER_PAGE
-    page_size_query_param = 'per_page'
 
     def get_paginated_response(self, data):
         next_url = self.get_next_link()
@@ -52,6 +54,97 @@ class LinkHeaderPagination(PageNumberPagination):
         return Response(data, headers=headers)
 
 
+class LinkHeaderCursorPagination(LinkHeaderMixin, CursorPagination):
+    """Provide keyset pagination, ordered by ID.
+
+    Pages are fetched using an opaque cursor identifying the last row of
+    the previous page, rather than a page number, so there's no need to
+    count the rows or skip over those of earlier pages. As IDs only ever
+    increase, rows added while paging end up on the last page instead of
+    shifting the contents of every page.
+    """
+    page_size = max_page_size = settings.REST_RESULTS_PER_PAGE
+    page_size_query_param = 'per_page'
+    ordering = 'id'
+
+    def get_page_size(self, request):
+        # CursorPagination ignores page_size_query_param before DRF 3.7
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_ordering(self, request, queryset, view):
+        # the cursor needs a unique, indexed column, so rather than
+        # silently ignoring a requested order, reject it
+        if request.query_params.get(api_settings.ORDERING_PARAM):
+            raise ValidationError({api_settings.ORDERING_PARAM: [
+                'Ordering is not supported with cursor pagination.']})
+
+        return (self.ordering,)
+
+
+class LinkHeaderPagination(LinkHeaderMixin, PageNumberPagination):
+    """Provide page number pagination, or cursor pagination if requested.
+
+    Cursor pagination, using :class:`LinkHeaderCursorPagination`, is used
+    if the request has a ``cursor`` parameter. This may be empty to fetch
+    the first page.
+    """
+    page_size = max_page_size = settings.REST_RESULTS_PER_PAGE
+    page_size_query_param = 'per_page'
+    cursor_query_param = 'cursor'
+    cursor_pagination = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_query_param in request.query_params:
+            self.cursor_pagination = LinkHeaderCursorPagination()
+            return self.cursor_pagination.paginate_queryset(
+                queryset, request, view)
+
+        return super(LinkHeaderPagination, self).paginate_queryset(
+            queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_pagination is not None:
+            return self.cursor_pagination.get_paginated_response(data)
+
+        return super(LinkHeaderPagination, self).get_paginated_response(data)
+
+    def to_html(self):
+        if self.cursor_pagination is not None:
+            return self.cursor_pagination.to_html()
+
+        return super(LinkHeaderPagination, self).to_html()
+
+
+class OrderingFilter(filters.OrderingFilter):
+    """Order by fields which don't share the name used in the API.
+
+    Views can set ``ordering_map`` to map names in ``ordering_fields`` to
+    the model fields used to order by them.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        ordering = self.get_ordering(request, queryset, view)
+        if not ordering:
+            return queryset
+
+        ordering_map = getattr(view, 'ordering_map', {})
+        orders = []
+        for term in ordering:
+            name = term.lstrip('-')
+            if name in ordering_map:
+                term = term[:len(term) - len(name)] + ordering_map[name]
+            orders.append(term)
+
+        return queryset.order_by(*orders)
+
+
 class PatchworkPermission(permissions.BasePermission):
     """This permission works for Project and Patch model objects"""
     def has_object_permission(self, request, view, obj):
@@ -18,6 +18,8 @@
 # Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 
 from django.core.exceptions import ValidationError
+from django_filters import CharFilter
+from django_filters import ChoiceFilter
 from django_filters import FilterSet
 from django_filters import IsoDateTimeFilter
 from django_filters import ModelChoiceFilter
@@ -28,10 +30,12 @@ from patchwork.models import Bundle
 from patchwork.models import Check
 from patchwork.models import CoverLetter
 from patchwork.models import Event
+from patchwork.models import parse_lines_range
 from patchwork.models import Patch
 from patchwork.models import Project
 from patchwork.models import Series
 from patchwork.models import State
+from patchwork.search import search_submissions
 
 
 class TimestampMixin(FilterSet):
@@ -78,7 +82,53 @@ class SeriesFilter(ProjectMixin, TimestampMixin, FilterSet):
         fields = ('submitter', 'project')
 
 
-class CoverLetterFilter(ProjectMixin, TimestampMixin, FilterSet):
+class SearchFilter(CharFilter):
+    """Filter submissions using full-text search.
+
+    Results are ordered with the best matches first, unless another
+    order is requested.
+    """
+
+    def filter(self, qs, value):
+        if not value or not value.strip():
+            return qs
+        return search_submissions(qs, value).order_by('-search_rank', 'id')
+
+
+class PathFilter(CharFilter):
+    """Filter patches by the files they change.
+
+    The value is the path of a file, or of a directory to match any
+    file below it.
+    """
+
+    def filter(self, qs, value):
+        if not value or not value.strip('/. '):
+            return qs
+        return qs.touching(value)
+
+
+class LinesFilter(CharFilter):
+    """Filter patches by the number of lines they add and remove.
+
+    The value is a minimum, like ``1000``, a range, like ``10-100``, or a
+    maximum, like ``-10``.
+    """
+
+    def filter(self, qs, value):
+        lines = parse_lines_range(value or '')
+        if lines is None:
+            return qs
+        return qs.lines_between(*lines)
+
+
+class SearchMixin(FilterSet):
+
+    search = SearchFilter()
+
+
+class CoverLetterFilter(ProjectMixin, TimestampMixin, SearchMixin,
+                        FilterSet):
 
     class Meta:
         model = CoverLetter
@@ -110,9 +160,26 @@ class StateFilter(ModelChoiceFilter):
     field_class = StateChoiceField
 
 
-class PatchFilter(ProjectMixin, TimestampMixin, FilterSet):
+class CheckStateFilter(ChoiceFilter):
+    """Filter by the name of a check state, like 'success'."""
+
+    def __init__(self, *args, **kwargs):
+        kwargs['choices'] = [(name, name) for _, name in Check.STATE_CHOICES]
+        super(CheckStateFilter, self).__init__(*args, **kwargs)
+
+    def filter(self, qs, value):
+        states = dict((name, state) for state, name in Check.STATE_CHOICES)
+        if value not in states:
+            return qs
+        return qs.filter(**{self.name: states[value]})
+
+
+class PatchFilter(ProjectMixin, TimestampMixin, SearchMixin, FilterSet):
 
     state = StateFilter(queryset=State.objects.all())
+    check = CheckStateFilter(name='check_state')
+    path = PathFilter()
+    lines = LinesFilter()
 
     class Meta:
         model = Patch
@@ -87,15 +87,22 @@ class PatchListSerializer(HyperlinkedModelSerializer):
     check = SerializerMethodField()
     checks = SerializerMethodField()
     tags = SerializerMethodField()
+    diffstat = SerializerMethodField()
 
     def get_mbox(self, instance):
         request = self.context.get('request')
         return request.build_absolute_uri(instance.get_mbox_url())
 
     def get_tags(self, instance):
-        # TODO(stephenfin): Make tags performant, possibly by reworking the
-        # model
-        return {}
+        return dict((tag.name, instance.tag_counts.get(tag.id, 0))
+                    for tag in instance.project.tags)
+
+    def get_diffstat(self, instance):
+        if instance.lines_added is None or instance.lines_removed is None:
+            return None
+        return {'files': instance.files_changed or 0,
+                'added': instance.lines_added,
+                'removed': instance.lines_removed}
 
     def get_check(self, instance):
         return instance.combined_check_state
@@ -109,10 +116,10 @@ class PatchListSerializer(HyperlinkedModelSerializer):
         fields = ('id', 'url', 'project', 'msgid', 'date', 'name',
                   'commit_ref', 'pull_url', 'state', 'archived', 'hash',
                   'submitter', 'delegate', 'mbox', 'series', 'check', 'checks',
-                  'tags')
+                  'tags', 'diffstat')
         read_only_fields = ('project', 'msgid', 'date', 'name', 'hash',
                             'submitter', 'mbox', 'mbox', 'series', 'check',
-                            'checks', 'tags')
+                            'checks', 'tags', 'diffstat')
         extra_kwargs = {
             'url': {'view_name': 'api-patch-detail'},
         }
@@ -147,13 +154,17 @@ class PatchList(ListAPIView):
     filter_class = PatchFilter
     search_fields = ('name',)
     ordering_fields = ('id', 'name', 'project', 'date', 'state', 'archived',
-                       'submitter', 'check')
+                       'submitter', 'check', 'lines')
+    ordering_map = {
+        'check': 'check_state',
+        'lines': 'lines_changed',
+    }
 
     def get_queryset(self):
         # TODO(stephenfin): Does the defer here cause issues with Django 1.6
         # (like /cover)?
-        return Patch.objects.all()\
-            .prefetch_related('series', 'check_set')\
+        return Patch.objects.with_lines_changed()\
+            .prefetch_related('series')\
             .select_related('project', 'state', 'submitter', 'delegate')\
             .defer('content', 'diff', 'headers')
 
@@ -166,5 +177,5 @@ class PatchDetail(RetrieveUpdateAPIView):
 
     def get_queryset(self):
         return Patch.objects.all()\
-            .prefetch_related('series', 'check_set')\
+            .prefetch_related('series')\
             .select_related('project', 'state', 'submitter', 'delegate')
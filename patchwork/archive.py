@@ -0,0 +1,440 @@
+# Patchwork - automated patch tracking system
+#
+# This file is part of the Patchwork package.
+#
+# Patchwork is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Patchwork is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Patchwork; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+"""Streaming readers for mail archives."""
+
+import email
+import email.parser
+import errno
+import gzip
+import io
+import json
+import mailbox
+import mmap
+import os
+import sys
+
+from django.utils import six
+
+try:
+    import lzma
+except ImportError:  # Python 2
+    lzma = None
+
+GZIP_MAGIC = b'\x1f\x8b'
+XZ_MAGIC = b'\xfd7zXZ\x00'
+
+
+def message_from_bytes(data):
+    """Build a message from the raw bytes of a mail."""
+    if six.PY3:
+        return email.message_from_bytes(data)
+    return email.message_from_string(data)
+
+
+def headers_from_bytes(data):
+    """Build a message from the raw bytes of a mail, parsing only headers.
+
+    This is considerably cheaper than :func:`message_from_bytes` for
+    multipart mails, as the body is left as a single unparsed string.
+    """
+    if six.PY3:
+        return email.parser.BytesParser().parsebytes(data, headersonly=True)
+    return email.parser.Parser().parsestr(data, headersonly=True)
+
+
+class MboxReader(object):
+    """Read the messages in an mbox archive in a single forward pass.
+
+    Uncompressed archives are memory-mapped and split on ``From ``
+    lines as they are read, rather than building a table of contents
+    up front like :class:`mailbox.mbox` does. Compressed archives and
+    pipes are read line by line instead.
+
+    Iterating over the reader yields ``(offset, data)`` tuples, where
+    ``offset`` is the byte offset of the message's ``From `` line in
+    the uncompressed archive and ``data`` is the raw message without
+    that line. Messages are not parsed here, so that broken messages
+    can be handled by the caller one at a time.
+    """
+
+    def __init__(self, stream, raw=None, size=None, close_raw=True):
+        self._stream = stream
+        self._raw = raw if raw is not None else stream
+        self._close_raw = close_raw
+        self._start = 0
+        self.size = size
+        self.position = 0
+
+    def seek(self, offset):
+        """Skip messages whose ``From `` line starts before an offset.
+
+        This must be called before iterating over the reader. Offsets
+        are in the uncompressed archive, so compressed archives must
+        still be read up to the offset, but the skipped messages are
+        never returned.
+        """
+        self._start = offset
+
+    @property
+    def progress(self):
+        """Return the fraction of the archive read so far, if known."""
+        if not self.size:
+            return None
+
+        if self._stream is self._raw:
+            position = self.position
+        else:
+            # report progress through the compressed file instead
+            try:
+                position = self._raw.tell()
+            except (IOError, OSError, ValueError):
+                return None
+
+        return min(float(position) / self.size, 1.0)
+
+    def _mmap(self):
+        if self._stream is not self._raw or not self.size:
+            return None
+
+        try:
+            return mmap.mmap(self._raw.fileno(), 0, access=mmap.ACCESS_READ)
+        except (AttributeError, ValueError, EnvironmentError,
+                io.UnsupportedOperation):
+            return None
+
+    def _iter_mmap(self, data):
+        if self._start >= len(data):
+            self.position = len(data)
+            return
+
+        if self._start == 0 and data[:5] == b'From ':
+            start = 0
+        else:
+            start = data.find(b'\nFrom ', max(self._start - 1, 0))
+            if start != -1:
+                start += 1
+
+        while start != -1:
+            body = data.find(b'\n', start)
+            if body == -1:
+                break
+            body += 1
+
+            end = data.find(b'\nFrom ', body - 1)
+            if end == -1:
+                stop = next_start = len(data)
+            else:
+                stop = next_start = end + 1
+
+            message = data[body:stop]
+            # drop the blank line separating this from the next message
+            if message.endswith(b'\n\n'):
+                message = message[:-1]
+
+            self.position = stop
+            yield start, message
+
+            start = next_start if next_start < len(data) else -1
+
+    def _iter_lines(self):
+        lines = []
+        start = None
+        offset = 0
+
+        for line in self._stream:
+            if line.startswith(b'From '):
+                if start is not None:
+                    self.position = offset
+                    yield start, self._join(lines)
+                start = offset if offset >= self._start else None
+                lines = []
+            elif start is not None:
+                lines.append(line)
+
+            offset += len(line)
+
+        self.position = offset
+        if start is not None:
+            yield start, self._join(lines)
+
+    @staticmethod
+    def _join(lines):
+        # drop the blank line separating this from the next message
+        if lines and lines[-1] == b'\n':
+            lines.pop()
+        return b''.join(lines)
+
+    def __iter__(self):
+        data = self._mmap()
+        if data is None:
+            for message in self._iter_lines():
+                yield message
+            return
+
+        try:
+            for message in self._iter_mmap(data):
+                yield message
+        finally:
+            data.close()
+
+    def close(self):
+        if self._stream is not self._raw:
+            self._stream.close()
+        if self._close_raw:
+            self._raw.close()
+
+
+class MaildirReader(object):
+    """Read the messages in a Maildir.
+
+    This provides the same interface as :class:`MboxReader`, except the
+    yielded offsets are the Maildir keys of the messages.
+    """
+
+    def __init__(self, path):
+        self._maildir = mailbox.Maildir(path, factory=None)
+        self._keys = sorted(self._maildir.keys())
+        self.size = len(self._keys)
+        self.position = 0
+
+    def exclude(self, keys):
+        """Skip the messages with the given keys.
+
+        This must be called before iterating over the reader.
+        """
+        keys = set(keys)
+        self._keys = [key for key in self._keys if key not in keys]
+        self.size = len(self._keys)
+
+    @property
+    def progress(self):
+        """Return the fraction of the Maildir read so far, if known."""
+        if not self.size:
+            return None
+
+        return float(self.position) / self.size
+
+    def __iter__(self):
+        for key in self._keys:
+            try:
+                if six.PY3:
+                    data = self._maildir.get_bytes(key)
+                else:
+                    data = self._maildir.get_string(key)
+            except KeyError:
+                # the message was removed while we were reading
+                continue
+            finally:
+                self.position += 1
+
+            yield key, data
+
+    def close(self):
+        self._maildir.close()
+
+
+def _peek(fileobj, size):
+    if hasattr(fileobj, 'peek'):
+        return fileobj.peek(size)[:size]
+
+    try:
+        position = fileobj.tell()
+        data = fileobj.read(size)
+        fileobj.seek(position)
+    except (IOError, OSError, ValueError, io.UnsupportedOperation):
+        return b''
+
+    return data
+
+
+def open_archive(path):
+    """Open a mail archive for reading.
+
+    Args:
+        path (str): Path to an mbox file, which may be compressed with
+            gzip or xz, or to a Maildir. If '-', an mbox is read from
+            stdin.
+
+    Returns:
+        A :class:`MboxReader` or :class:`MaildirReader` instance
+
+    Raises:
+        ValueError: The archive is compressed with an unsupported
+            algorithm.
+    """
+    close_raw = True
+
+    if path == '-':
+        raw = sys.stdin.buffer if six.PY3 else sys.stdin
+        size = None
+        close_raw = False
+    elif os.path.isdir(path):
+        return MaildirReader(path)
+    else:
+        raw = open(path, 'rb')
+        size = os.fstat(raw.fileno()).st_size
+
+    magic = _peek(raw, len(XZ_MAGIC))
+
+    if magic.startswith(GZIP_MAGIC):
+        stream = gzip.GzipFile(fileobj=raw, mode='rb')
+    elif magic.startswith(XZ_MAGIC):
+        if lzma is None:
+            raise ValueError('xz-compressed archives require Python 3')
+        stream = lzma.LZMAFile(raw)
+    else:
+        stream = raw
+
+    return MboxReader(stream, raw=raw, size=size, close_raw=close_raw)
+
+
+class Checkpoint(object):
+    """Record which messages of an archive have been imported.
+
+    This allows an interrupted import to be resumed, or an archive which
+    is still growing to be imported incrementally. The first line of
+    the checkpoint file identifies the archive, and each following line
+    records a message which has been processed, using the offset or key
+    yielded by the archive reader. Entries are buffered and written
+    every ``interval`` messages, so a crash can cause at most that many
+    messages to be processed again.
+
+    Messages of an archive read in order, such as an mbox, are skipped
+    by seeking past the last one processed, so only the last entry is
+    needed. With ``last_only``, the file is replaced at each write to
+    record only that entry. Otherwise, entries are appended to the file.
+
+    Args:
+        path (str): Path to the checkpoint file.
+        archive (str): Path to the archive being imported.
+        interval (int): Number of messages to buffer between writes.
+        last_only (bool): Only keep the last entry recorded.
+    """
+
+    def __init__(self, path, archive, interval=1000, last_only=False):
+        self.path = path
+        self.archive = archive if archive == '-' else os.path.abspath(
+            archive)
+        self.interval = interval
+        self.last_only = last_only
+        self._file = None
+        self._pending = []
+        self._unsaved = 0
+
+    @property
+    def _header(self):
+        return json.dumps({'archive': self.archive}) + '\n'
+
+    def load(self):
+        """Read the entries recorded by a previous import.
+
+        Returns:
+            A list of the recorded entries, as strings, which is empty if
+            the checkpoint file does not exist yet.
+
+        Raises:
+            ValueError: The file is not a checkpoint for this archive.
+        """
+        try:
+            f = open(self.path)
+        except (IOError, OSError) as exc:
+            if exc.errno == errno.ENOENT:
+                return []
+            raise
+
+        with f:
+            header = f.readline()
+            if not header:
+                return []
+
+            try:
+                archive = json.loads(header)['archive']
+            except (ValueError, KeyError, TypeError):
+                raise ValueError('%s is not a checkpoint file' % self.path)
+
+            if archive != self.archive:
+                raise ValueError('%s is a checkpoint for %s' % (
+                    self.path, archive))
+
+            # a partially written last line is harmless: it can only cause
+            # a message to be processed again
+            return [line.rstrip('\n') for line in f if line.strip()]
+
+    def open(self, resume=False):
+        """Open the checkpoint for writing.
+
+        Args:
+            resume (bool): Keep the entries of the existing checkpoint, if
+                any, rather than starting a new one.
+        """
+        if resume and os.path.exists(self.path) and \
+                os.path.getsize(self.path):
+            if not self.last_only:
+                self._file = open(self.path, 'a')
+            return
+
+        if self.last_only:
+            self._replace([])
+            return
+
+        self._file = open(self.path, 'w')
+        self._file.write(self._header)
+        self._sync()
+
+    def record(self, entry):
+        """Record a message as processed."""
+        if self.last_only:
+            self._pending = []
+        self._pending.append('%s\n' % entry)
+        self._unsaved += 1
+        if self._unsaved >= self.interval:
+            self.save()
+
+    def save(self):
+        """Write any buffered entries to disk."""
+        if not self._pending:
+            return
+
+        if self.last_only:
+            self._replace(self._pending)
+        else:
+            self._file.write(''.join(self._pending))
+            self._sync()
+        self._pending = []
+        self._unsaved = 0
+
+    def _replace(self, entries):
+        # write a new file and rename it over the old one, so the old
+        # entries are kept should we crash before the new ones are written
+        path = self.path + '.tmp'
+        with open(path, 'w') as f:
+            f.write(self._header + ''.join(entries))
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(path, self.path)
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self.save()
+        if self._file:
+            self._file.close()
+            self._file = None
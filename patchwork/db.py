@@ -0,0 +1,64 @@
+# Patchwork - automated patch tracking system
+#
+# This file is part of the Patchwork package.
+#
+# Patchwork is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Patchwork is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Patchwork; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+"""Database helpers which Django doesn't provide."""
+
+from django.db import connections
+from django.db import router
+
+
+def bulk_update(model, name, values, batch_size=300):
+    """Set a field on many rows without sending signals.
+
+    Django has no ``bulk_update`` before 2.2, so each batch of rows is
+    updated using a single ``UPDATE ... SET <field> = CASE <pk> WHEN ...``
+    statement.
+
+    Args:
+        model (Model): The model to update. The field must be stored in
+            this model's table, rather than that of a parent model.
+        name (str): The name of the field to set.
+        values (list): A list of ``(primary key, value)`` tuples.
+        batch_size (int): Number of rows to update per statement. Each
+            row uses three query parameters.
+    """
+    if not values:
+        return
+
+    using = router.db_for_write(model)
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    field = model._meta.get_field(name)
+    pk = qn(model._meta.pk.column)
+
+    cursor = connection.cursor()
+    try:
+        for i in range(0, len(values), batch_size):
+            batch = values[i:i + batch_size]
+            params = []
+            for key, value in batch:
+                params.extend([key, field.get_db_prep_save(value, connection)])
+            params.extend([key for key, _ in batch])
+
+            sql = 'UPDATE %s SET %s = CASE %s %s END WHERE %s IN (%s)' % (
+                qn(model._meta.db_table), qn(field.column), pk,
+                ' '.join(['WHEN %s THEN %s'] * len(batch)), pk,
+                ', '.join(['%s'] * len(batch)))
+            cursor.execute(sql, params)
+    finally:
+        cursor.close()
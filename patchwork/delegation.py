@@ -0,0 +1,136 @@
+# Patchwork - automated patch tracking system
+#
+# This file is part of the Patchwork package.
+#
+# Patchwork is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Patchwork is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Patchwork; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+"""Matching of filenames against delegation rules."""
+
+import fnmatch
+import re
+
+_glob_re = re.compile(r'[*?[]')
+
+# Python 2 limits the number of groups in a pattern to 100
+_MAX_GROUPS = 90
+
+
+def _translate(path):
+    """Translate a glob to a regex that can be combined with others.
+
+    The trailing end-of-string anchor, and on Python 2 the trailing
+    flags, are removed from the result of :func:`fnmatch.translate`.
+    """
+    regex = fnmatch.translate(path)
+    for suffix in ('\\Z(?ms)', '\\Z'):
+        if regex.endswith(suffix):
+            return regex[:-len(suffix)]
+
+    raise ValueError('Unexpected translation of %r: %r' % (path, regex))
+
+
+class DelegationMatcher(object):
+    """Find the delegation rule matching a filename.
+
+    This is equivalent to checking each rule in turn, in order of
+    priority, using :func:`fnmatch.fnmatchcase`. However, rules are
+    compiled ahead of time so the cost of matching a file does not grow
+    with the number of rules:
+
+    - Rules without any wildcards are looked up in a dict
+    - Rules matching everything below a directory, like ``net/*``, are
+      stored in a trie of path components
+    - All other rules are combined into a single regex
+
+    Args:
+        rules (list): The rules to match against, in order of priority.
+            Each must have a ``path`` attribute.
+    """
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self._exact = {}
+        self._trie = {}
+        self._patterns = []
+
+        wildcards = []
+
+        for index, rule in enumerate(self.rules):
+            path = rule.path
+            if not _glob_re.search(path):
+                self._exact.setdefault(path, index)
+            elif path == '*' or (path.endswith('/*') and
+                                 not _glob_re.search(path[:-2])):
+                node = self._trie
+                for component in path.split('/')[:-1]:
+                    node = node.setdefault(component, {})
+                if None not in node:
+                    node[None] = index
+            else:
+                wildcards.append(index)
+
+        for start in range(0, len(wildcards), _MAX_GROUPS):
+            chunk = wildcards[start:start + _MAX_GROUPS]
+            regex = '|'.join('%s(?P<r%d>)\\Z' % (
+                _translate(self.rules[index].path), index)
+                for index in chunk)
+            self._patterns.append(
+                (chunk[0], re.compile('(?s)(?:%s)' % regex)))
+
+    def _match_index(self, filename):
+        best = self._exact.get(filename)
+
+        # the trie holds directory prefixes, so the basename is never checked
+        node = self._trie
+        components = filename.split('/')
+        for component in components[:-1]:
+            index = node.get(None)
+            if index is not None and (best is None or index < best):
+                best = index
+
+            node = node.get(component)
+            if node is None:
+                break
+        else:
+            index = node.get(None)
+            if index is not None and (best is None or index < best):
+                best = index
+
+        # alternatives are tried in order, so the first match in the first
+        # matching pattern is the rule with the highest priority
+        for first, pattern in self._patterns:
+            if best is not None and first > best:
+                break
+
+            match = pattern.match(filename)
+            if match:
+                index = int(match.lastgroup[1:])
+                if best is None or index < best:
+                    best = index
+                break
+
+        return best
+
+    def match(self, filename):
+        """Return the rule with the highest priority matching a filename.
+
+        Returns:
+            The matching rule, or None if no rule matches
+        """
+        index = self._match_index(filename)
+        if index is None:
+            return None
+
+        return self.rules[index]
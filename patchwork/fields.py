@@ -21,8 +21,11 @@
 from __future__ import absolute_import
 
 import hashlib
+import json
+import zlib
 
 import django
+from django.conf import settings
 from django.db import models
 from django.utils import six
 
@@ -52,3 +55,142 @@ class HashField(HashFieldBase):
 
     def db_type(self, connection=None):
         return 'char(%d)' % self.n_bytes
+
+
+if django.VERSION < (1, 8):
+    CountsFieldBase = six.with_metaclass(models.SubfieldBase,
+                                         models.TextField)  # noqa
+else:
+    CountsFieldBase = models.TextField
+
+
+class CountsField(CountsFieldBase):
+    """Counts of things, keyed by an integer like a tag ID.
+
+    Counts are stored as compact JSON, like ``{"1":2,"3":1}``, and are
+    exposed as a dict mapping keys to counts. Keys with a count of zero
+    are omitted.
+    """
+
+    def to_python(self, value):
+        if isinstance(value, dict):
+            return value
+        if not value:
+            return {}
+        return dict((int(key), count)
+                    for key, count in json.loads(value).items())
+
+    def from_db_value(self, value, *args, **kwargs):
+        return self.to_python(value)
+
+    def get_prep_value(self, value):
+        value = self.to_python(value)
+        return json.dumps(dict((str(key), count)
+                               for key, count in value.items() if count),
+                          separators=(',', ':'), sort_keys=True)
+
+    def value_to_string(self, obj):
+        return self.get_prep_value(self.value_from_object(obj))
+
+
+# the name used by migrations written before the field held check counts
+TagCountsField = CountsField
+
+
+# compressed values are stored as this marker, the ID of the compression
+# method, and the compressed UTF-8 text. Values which aren't compressed are
+# stored as UTF-8 text
+COMPRESSION_MARKER = b'\x01'
+COMPRESSION_ZLIB = b'z'
+
+
+def compress_text(value):
+    """Encode text to be stored, compressing it if that makes it smaller.
+
+    Values shorter than ``TEXT_COMPRESSION_MIN_LENGTH`` aren't
+    compressed, nor are values that don't compress well. Values starting
+    with the marker used for compressed values are always compressed,
+    so they can't be mistaken for one.
+
+    Returns:
+        The bytes to store
+    """
+    if value is None:
+        return None
+
+    data = value
+    if isinstance(data, six.text_type):
+        data = data.encode('utf-8')
+
+    marked = data.startswith(COMPRESSION_MARKER)
+    min_length = settings.TEXT_COMPRESSION_MIN_LENGTH
+    if not marked and (min_length is None or len(value) < min_length):
+        return data
+
+    compressed = COMPRESSION_MARKER + COMPRESSION_ZLIB + zlib.compress(
+        data, 6)
+    if not marked and len(compressed) >= len(data):
+        return data
+    return compressed
+
+
+def is_compressed(value):
+    return bool(value) and not isinstance(value, six.text_type) and \
+        bytes(value[:1]) == COMPRESSION_MARKER
+
+
+def decompress_text(value):
+    """Return the original text of a value stored by :func:`compress_text`.
+
+    Values stored as text, before their column held binary data, are
+    returned unchanged.
+    """
+    if value is None or isinstance(value, six.text_type):
+        return value
+
+    # drivers return binary data as bytes, buffers or memoryviews
+    data = bytes(value)
+    if not data.startswith(COMPRESSION_MARKER):
+        return data.decode('utf-8')
+
+    method = data[1:2]
+    if method != COMPRESSION_ZLIB:
+        raise ValueError('Unknown compression method: %r' % method)
+    return zlib.decompress(data[2:]).decode('utf-8')
+
+
+if django.VERSION < (1, 8):
+    CompressedTextFieldBase = six.with_metaclass(models.SubfieldBase,
+                                                 models.TextField)  # noqa
+else:
+    CompressedTextFieldBase = models.TextField
+
+
+class CompressedTextField(CompressedTextFieldBase):
+    """Text which is compressed when stored, if it's long enough.
+
+    Values are stored in a binary column, so compressed values take no
+    more space than the compressed data. Values are decompressed when
+    they are loaded, so fields which are deferred, or not selected by
+    ``values()`` and ``only()``, are never decompressed. As the stored
+    values aren't text, they can't be used in lookups, other than to
+    check for ``NULL``.
+    """
+
+    def get_internal_type(self):
+        return 'BinaryField'
+
+    if django.VERSION < (1, 8):
+        def to_python(self, value):
+            # this is called by SubfieldBase for values loaded from the
+            # database, as well as for values which are assigned
+            return decompress_text(value)
+
+    def from_db_value(self, value, *args, **kwargs):
+        return decompress_text(value)
+
+    def get_db_prep_save(self, value, connection):
+        value = compress_text(value)
+        if value is not None:
+            value = connection.Database.Binary(value)
+        return value
@@ -25,9 +25,16 @@ from django.utils.safestring import mark_safe
 from django.utils import six
 from django.utils.six.moves.urllib.parse import quote
 
+from patchwork.lookups import get_tags
+from patchwork.models import Check
+from patchwork.models import normalize_path
+from patchwork.models import parse_lines_range
+from patchwork.models import Patch
+from patchwork.models import PatchFile
 from patchwork.models import Person
 from patchwork.models import Series
 from patchwork.models import State
+from patchwork.search import search_submissions
 
 
 class Filter(object):
@@ -80,6 +87,11 @@ class Filter(object):
     def kwargs(self):
         return {}
 
+    def apply(self, queryset):
+        """Filter a queryset by anything which can't be expressed by
+           kwargs(), such as annotations needed to order the results"""
+        return queryset
+
     def __str__(self):
         return '%s: %s' % (self.name, self.kwargs())
 
@@ -283,8 +295,9 @@ class SearchFilter(Filter):
         self.search = key
         self.applied = True
 
-    def kwargs(self):
-        return {'name__icontains': self.search}
+    def apply(self, queryset):
+        # annotates each result with its 'search_rank'
+        return search_submissions(queryset, self.search)
 
     def condition(self):
         return self.search
@@ -303,6 +316,102 @@ class SearchFilter(Filter):
         return mark_safe('function(form) { return form.x.value }')
 
 
+class PathFilter(Filter):
+    """Filter patches by the files they change.
+
+    The key is the path of a file, or of a directory to match any file
+    below it.
+    """
+    param = 'path'
+
+    def __init__(self, filters):
+        super(PathFilter, self).__init__(filters)
+        self.name = 'Path'
+        self.path = None
+
+    def _set_key(self, key):
+        key = normalize_path(key)
+        if not key:
+            return
+
+        self.path = key
+        self.applied = True
+
+    def kwargs(self):
+        return {'id__in': PatchFile.objects.matching(self.path).values(
+            'patch')}
+
+    def condition(self):
+        return self.path
+
+    def key(self):
+        return self.path
+
+    def _form(self):
+        value = ''
+        if self.path:
+            value = escape(self.path)
+        return mark_safe('<input name="%s" class="form-control" value="%s">' %
+                         (self.param, value))
+
+    def form_function(self):
+        return mark_safe('function(form) { return form.x.value }')
+
+
+class LinesFilter(Filter):
+    """Filter patches by the number of lines they add and remove.
+
+    The key is a minimum, like ``1000``, a range, like ``10-100``, or a
+    maximum, like ``-10``.
+    """
+    param = 'lines'
+
+    def __init__(self, filters):
+        super(LinesFilter, self).__init__(filters)
+        self.name = 'Lines'
+        self.range = None
+
+    def _set_key(self, key):
+        self.range = parse_lines_range(key)
+        if self.range is None:
+            return
+
+        self.applied = True
+
+    def kwargs(self):
+        return {'id__in': Patch.objects.lines_between(*self.range).values(
+            'pk')}
+
+    def condition(self):
+        if not self.range:
+            return ''
+        minimum, maximum = self.range
+        if maximum is None:
+            return 'at least %d' % minimum
+        if minimum is None:
+            return 'at most %d' % maximum
+        return '%d to %d' % (minimum, maximum)
+
+    def key(self):
+        if not self.range:
+            return None
+        minimum, maximum = self.range
+        if maximum is None:
+            return str(minimum)
+        return '%s-%d' % ('' if minimum is None else minimum, maximum)
+
+    def _form(self):
+        value = ''
+        if self.range:
+            value = self.key()
+        return mark_safe('<input name="%s" class="form-control" value="%s" '
+                         'placeholder="e.g. 1000, 10-100 or -10">' % (
+                             self.param, value))
+
+    def form_function(self):
+        return mark_safe('function(form) { return form.x.value }')
+
+
 class ArchiveFilter(Filter):
     param = 'archive'
 
@@ -435,12 +544,141 @@ class DelegateFilter(Filter):
             self.forced = True
 
 
+class TagFilter(Filter):
+    """Filter patches with at least a given number of a tag.
+
+    The key is the name of a tag, optionally followed by a colon and the
+    minimum count, like ``Reviewed-by`` or ``Acked-by:2``.
+    """
+    param = 'tag'
+
+    def __init__(self, filters):
+        super(TagFilter, self).__init__(filters)
+        self.name = 'Tag'
+        self.tag = None
+        self.count = 1
+
+    def _set_key(self, key):
+        self.tag = None
+        self.count = 1
+
+        name, _, count = key.strip().partition(':')
+        if count:
+            try:
+                self.count = max(int(count), 1)
+            except ValueError:
+                return
+
+        for tag in get_tags():
+            if tag.name.lower() == name.lower():
+                self.tag = tag
+                break
+        else:
+            return
+
+        self.applied = True
+
+    def kwargs(self):
+        if self.tag:
+            # both conditions must hold for the same PatchTag row, so they
+            # have to be applied in a single call to filter()
+            return {'patchtag__tag': self.tag,
+                    'patchtag__count__gte': self.count}
+        return {}
+
+    def condition(self):
+        if not self.tag:
+            return ''
+        if self.count > 1:
+            return '%s (at least %d)' % (self.tag.name, self.count)
+        return self.tag.name
+
+    def key(self):
+        if not self.tag:
+            return None
+        if self.count > 1:
+            return '%s:%d' % (self.tag.name, self.count)
+        return self.tag.name
+
+    def _form(self):
+        out = '<select name="%s" class="form-control">' % self.param
+        out += '<option value="">any</option>'
+
+        for tag in get_tags():
+            selected = ''
+            if self.tag and self.tag == tag:
+                selected = ' selected="true"'
+
+            out += '<option value="%s"%s>%s</option>' % (
+                escape(tag.name), selected, escape(tag.name))
+        out += '</select>'
+        return mark_safe(out)
+
+    def form_function(self):
+        return 'function(form) { return form.x.value }'
+
+
+class CheckFilter(Filter):
+    """Filter patches by the combined state of their checks."""
+    param = 'check'
+
+    def __init__(self, filters):
+        super(CheckFilter, self).__init__(filters)
+        self.name = 'Checks'
+        self.state = None
+
+    def _set_key(self, key):
+        self.state = None
+
+        for state, name in Check.STATE_CHOICES:
+            if name == key.strip().lower():
+                self.state = state
+                break
+        else:
+            return
+
+        self.applied = True
+
+    def kwargs(self):
+        if self.state is not None:
+            return {'check_state': self.state}
+        return {}
+
+    def condition(self):
+        if self.state is not None:
+            return dict(Check.STATE_CHOICES)[self.state]
+        return ''
+
+    def key(self):
+        return self.condition() or None
+
+    def _form(self):
+        out = '<select name="%s" class="form-control">' % self.param
+        out += '<option value="">any</option>'
+
+        for state, name in Check.STATE_CHOICES:
+            selected = ''
+            if self.state == state:
+                selected = ' selected="true"'
+
+            out += '<option value="%s"%s>%s</option>' % (name, selected, name)
+        out += '</select>'
+        return mark_safe(out)
+
+    def form_function(self):
+        return 'function(form) { return form.x.value }'
+
+
 filterclasses = [SeriesFilter,
                  SubmitterFilter,
                  StateFilter,
                  SearchFilter,
+                 PathFilter,
+                 LinesFilter,
                  ArchiveFilter,
-                 DelegateFilter]
+                 DelegateFilter,
+                 TagFilter,
+                 CheckFilter]
 
 
 class Filters:
@@ -465,9 +703,18 @@ class Filters:
 
     def apply(self, queryset):
         kwargs = self.filter_conditions()
-        if not kwargs:
-            return queryset
-        return queryset.filter(**kwargs)
+        if kwargs:
+            queryset = queryset.filter(**kwargs)
+        for f in self._filters:
+            if f.applied:
+                queryset = f.apply(queryset)
+        return queryset
+
+    @property
+    def ranked(self):
+        """Whether results are annotated with a 'search_rank'"""
+        return any(isinstance(f, SearchFilter) and f.applied
+                   for f in self._filters)
 
     def params(self):
         return [(f.param, f.key()) for f in self._filters
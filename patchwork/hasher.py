@@ -21,27 +21,114 @@
 
 """Hash generation for diffs."""
 
+import argparse
 import hashlib
 import re
 import sys
 
 HUNK_RE = re.compile(r'^\@\@ -\d+(?:,(\d+))? \+\d+(?:,(\d+))? \@\@')
 FILENAME_RE = re.compile(r'^(---|\+\+\+) (\S+)')
+# the start of a commit in 'git log' or 'git diff-tree --stdin' output
+COMMIT_RE = re.compile(br'^(?:commit ([0-9a-f]{40,64})(?: |$)|'
+                       br'([0-9a-f]{40,64})(?: \(from [0-9a-f]+\))?$)')
 
 
-def hash_diff(diff):
-    """Generate a hash from a diff."""
+class DiffHasher(object):
+    """Generate a hash from a diff, one chunk at a time.
+
+    This produces the same hash as :func:`hash_diff`, but the diff can
+    be supplied in chunks of any size, e.g. as it is read from a pipe.
+    Chunks may be either text or bytes. Bytes are split into lines and
+    each line is decoded as UTF-8, falling back to Latin-1 for lines
+    that aren't valid UTF-8.
 
-    # normalise spaces
-    diff = diff.replace('\r', '')
-    diff = diff.strip() + '\n'
+    Args:
+        diff (str or bytes): Initial chunk of the diff.
+    """
 
     prefixes = ['-', '+', ' ']
-    hashed = hashlib.sha1()
 
-    for line in diff.split('\n'):
+    def __init__(self, diff=None):
+        self._hash = hashlib.sha1()
+        self._buffer = None
+        # leading whitespace of the diff is ignored, like 'str.strip()'
+        self._started = False
+        # the last line with content, and any whitespace-only lines after
+        # it. These are held back, as trailing whitespace of the diff is
+        # ignored too
+        self._last = None
+        self._blank = []
+
+        if diff is not None:
+            self.update(diff)
+
+    def copy(self):
+        """Return a copy of the hasher, for hashing diffs sharing a prefix."""
+        other = DiffHasher()
+        other._hash = self._hash.copy()
+        other._buffer = self._buffer
+        other._started = self._started
+        other._last = self._last
+        other._blank = list(self._blank)
+        return other
+
+    def update(self, data):
+        """Hash another chunk of the diff."""
+        if self._buffer is not None:
+            data = self._buffer + data
+
+        lines = data.split(b'\n' if isinstance(data, bytes) else '\n')
+        self._buffer = lines.pop()
+
+        for line in lines:
+            self._update_line(line)
+
+    def update_line(self, line):
+        """Hash a single line of the diff, without its newline."""
+        if self._buffer:
+            raise ValueError('Partial line buffered')
+        self._update_line(line)
+
+    def hexdigest(self):
+        """Return the hash of the diff supplied so far."""
+        hasher = self.copy()
+        if hasher._buffer:
+            hasher._update_line(hasher._buffer)
+
+        if hasher._last is not None:
+            hasher._hash_line(hasher._last.rstrip())
+
+        return hasher._hash.hexdigest()
+
+    def _update_line(self, line):
+        if isinstance(line, bytes):
+            try:
+                line = line.decode('utf-8')
+            except UnicodeDecodeError:
+                line = line.decode('latin-1')
+
+        # normalise spaces
+        line = line.replace('\r', '')
+
+        if not self._started:
+            line = line.lstrip()
+            if not line:
+                return
+            self._started = True
+        elif not line.strip():
+            self._blank.append(line)
+            return
+        else:
+            self._hash_line(self._last)
+            for blank in self._blank:
+                self._hash_line(blank)
+            self._blank = []
+
+        self._last = line
+
+    def _hash_line(self, line):
         if len(line) <= 0:
-            continue
+            return
 
         hunk_match = HUNK_RE.match(line)
         filename_match = FILENAME_RE.match(line)
@@ -63,16 +150,70 @@ def hash_diff(diff):
                 return int(x)
             line_nos = list(map(fn, hunk_match.groups()))
             line = '@@ -%d +%d @@' % tuple(line_nos)
-        elif line[0] in prefixes:
+        elif line[0] in self.prefixes:
             # if we have a +, - or context line, leave as-is
             pass
         else:
             # other lines are ignored
+            return
+
+        self._hash.update((line + '\n').encode('utf-8'))
+
+
+def hash_diff(diff):
+    """Generate a hash from a diff."""
+    return DiffHasher(diff).hexdigest()
+
+
+def hash_commits(stream):
+    """Generate hashes for the commits in 'git log -p' style output.
+
+    Both the output of 'git log -p' and 'git diff-tree --stdin -p' are
+    supported, including the per-parent diffs of merges shown with
+    '-m'. Only the diff of each commit against its first parent is
+    hashed, so the hashes match those of 'git diff <commit>~..<commit>'.
+
+    Args:
+        stream: A binary file-like object to read the output from.
+
+    Yields:
+        A (commit, hash) tuple for each commit, in order
+    """
+    commit = None
+    hasher = None
+    skip = False
+
+    for line in stream:
+        line = line.rstrip(b'\n')
+
+        match = COMMIT_RE.match(line)
+        if match:
+            sha = (match.group(1) or match.group(2)).decode('ascii')
+            # with '-m', merges are shown once per parent. Only the diff
+            # against the first parent is used
+            skip = sha == commit
+            if skip:
+                continue
+
+            if commit is not None:
+                yield commit, (hasher or DiffHasher()).hexdigest()
+            commit = sha
+            hasher = None
             continue
 
-        hashed.update((line + '\n').encode('utf-8'))
+        if commit is None or skip:
+            continue
+
+        # skip the commit message, which precedes the first diff
+        if hasher is None:
+            if not line.startswith(b'diff '):
+                continue
+            hasher = DiffHasher()
+
+        hasher.update_line(line)
 
-    return hashed.hexdigest()
+    if commit is not None:
+        yield commit, (hasher or DiffHasher()).hexdigest()
 
 
 def main(args):
@@ -80,7 +221,25 @@ def main(args):
 
     This is required by scripts found in /tools
     """
-    print(hash_diff('\n'.join(sys.stdin.readlines())))
+    parser = argparse.ArgumentParser(description='Hash diffs read from stdin.')
+    parser.add_argument(
+        '--batch', action='store_true',
+        help="read the output of 'git log -p' or 'git diff-tree --stdin -p' "
+        "and print a '<commit> <hash>' line for each commit")
+    args = parser.parse_args(args[1:])
+
+    stdin = getattr(sys.stdin, 'buffer', sys.stdin)
+
+    if args.batch:
+        for commit, hash_ in hash_commits(stdin):
+            sys.stdout.write('%s %s\n' % (commit, hash_))
+            sys.stdout.flush()
+        return
+
+    hasher = DiffHasher()
+    for chunk in iter(lambda: stdin.read(65536), b''):
+        hasher.update(chunk)
+    print(hasher.hexdigest())
 
 
 if __name__ == '__main__':
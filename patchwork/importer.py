@@ -0,0 +1,765 @@
+# Patchwork - automated patch tracking system
+#
+# This file is part of the Patchwork package.
+#
+# Patchwork is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Patchwork is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Patchwork; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+"""Batched import of mails into the database.
+
+This is an alternative to :func:`patchwork.parser.save_mail` for bulk
+imports of archives. Rather than saving each mail as it is parsed, mails
+are collected into a window and the series and threading information
+for the whole window is resolved in memory, using a handful of queries
+to load any existing state. The resulting objects are then written with
+``bulk_create``.
+
+As ``bulk_create`` does not send signals, the events that the signals
+in :mod:`patchwork.signals` would create are generated here instead.
+"""
+
+from collections import Counter
+from collections import defaultdict
+import datetime
+from functools import reduce
+import hashlib
+import logging
+import operator
+
+from django.db import connections
+from django.db import IntegrityError
+from django.db.models import Q
+from django.db import router
+from django.db import transaction
+from django.utils import six
+
+from patchwork.hasher import hash_diff
+from patchwork.models import Comment
+from patchwork.models import CoverLetter
+from patchwork.models import Event
+from patchwork.models import MessageIndex
+from patchwork.models import Patch
+from patchwork.models import PatchFile
+from patchwork.models import PatchTag
+from patchwork.models import Person
+from patchwork.models import Series
+from patchwork.models import SeriesPatch
+from patchwork.models import SeriesReference
+from patchwork.models import Submission
+from patchwork.parser import find_delegate_by_filename
+from patchwork.parser import find_delegate_by_header
+from patchwork.parser import find_state
+from patchwork.parser import ParsedMail
+from patchwork.parser import save_mail
+from patchwork.parser import SERIES_DELAY_INTERVAL
+from patchwork.search import add_comments
+from patchwork.search import update_documents
+from patchwork.tags import retag_patches
+
+logger = logging.getLogger(__name__)
+
+
+def _insert(model, objs, fields):
+    """Insert rows into a model's table without sending signals.
+
+    ``bulk_create`` refuses to handle multi-table inherited models like
+    ``Patch``, so we insert the rows for each table ourselves.
+    """
+    if not objs:
+        return
+
+    using = router.db_for_write(model)
+    ops = connections[using].ops
+    batch_size = max(ops.bulk_batch_size(fields, objs), 1)
+
+    for i in range(0, len(objs), batch_size):
+        model._base_manager._insert(objs[i:i + batch_size], fields=fields,
+                                    using=using)
+
+
+def _create_with_ids(model, objs):
+    """Create objects without sending signals, populating their IDs."""
+    using = router.db_for_write(model)
+    if getattr(connections[using].features,
+               'can_return_ids_from_bulk_insert', False):
+        model.objects.bulk_create(objs)
+        return
+
+    # we've no natural key to fetch these by, so insert them one by one
+    fields = [f for f in model._meta.local_concrete_fields
+              if not f.primary_key]
+    for obj in objs:
+        obj.pk = model._base_manager._insert(
+            [obj], fields=fields, return_id=True, using=using)
+
+
+def _sync_fks(objs, *names):
+    """Update foreign key IDs for related objects saved after assignment."""
+    for obj in objs:
+        for name in names:
+            setattr(obj, name, getattr(obj, name))
+
+
+class MsgidSet(object):
+    """A compact set of message IDs.
+
+    Each message ID is stored as an 8 byte hash, in a single sorted byte
+    string, so a set of a million IDs takes around 8MB. Being a single
+    object, it is shared by worker processes forked from the process
+    that created it, rather than being copied into each of them.
+
+    Different message IDs can have the same hash, so a match means a
+    message ID is probably, rather than definitely, in the set.
+    """
+    width = 8
+
+    def __init__(self, msgids):
+        hashes = set(self._hash(msgid) for msgid in msgids)
+        self._count = len(hashes)
+        self._data = b''.join(sorted(hashes))
+
+    @classmethod
+    def _hash(cls, msgid):
+        if isinstance(msgid, six.text_type):
+            msgid = msgid.encode('utf-8')
+        return hashlib.sha1(msgid).digest()[:cls.width]
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, msgid):
+        key = self._hash(msgid)
+        width = self.width
+        low, high = 0, self._count
+
+        # a binary search of the sorted hashes
+        while low < high:
+            middle = (low + high) // 2
+            value = self._data[middle * width:(middle + 1) * width]
+            if value < key:
+                low = middle + 1
+            elif value > key:
+                high = middle
+            else:
+                return True
+
+        return False
+
+
+def find_msgids(project):
+    """Return the message IDs of all mails stored for a project.
+
+    This covers both submissions and comments, allowing mails which are
+    probably already stored to be skipped without parsing them. Matches
+    should be confirmed using :func:`is_stored`.
+
+    Args:
+        project (Project): The project to find mails for.
+
+    Returns:
+        A :class:`MsgidSet` of message IDs
+    """
+    submissions = Submission.objects.filter(project=project).values_list(
+        'msgid', flat=True)
+    comments = Comment.objects.filter(submission__project=project).values_list(
+        'msgid', flat=True)
+
+    return MsgidSet(msgid for query in (submissions, comments)
+                    for msgid in query.iterator())
+
+
+def is_stored(project, msgid):
+    """Check if a mail is stored as a submission or comment of a project."""
+    return Submission.objects.filter(project=project, msgid=msgid).exists() \
+        or Comment.objects.filter(submission__project=project,
+                                  msgid=msgid).exists()
+
+
+class _Item(object):
+    """A mail queued for import."""
+
+    def __init__(self, mail, project):
+        self.mail = mail
+        self.project = project
+        self.author_name = None
+        self.email = None
+        self.result = None
+
+
+class _SeriesState(object):
+    """In-memory state of a series touched by the current window."""
+
+    def __init__(self, series, submitter, cover=None, new=False):
+        self.series = series
+        # submitter and cover letter are IDs for existing series
+        self.submitter = submitter
+        self.cover = cover
+        self.new = new
+        self.changed = False
+        # number -> (patch, patch ID, patch name)
+        self.patches = {}
+
+
+class BulkImporter(object):
+    """Import mails into the database in batches.
+
+    Mails are queued with :meth:`add` and written when :meth:`flush` is
+    called. Each flush runs in a single transaction. Should the window
+    fail to import, for example because another process added one of
+    the mails in the meantime, the mails are imported one at a time
+    instead.
+    """
+
+    def __init__(self):
+        self._items = []
+        self._people = {}
+
+    def __len__(self):
+        return len(self._items)
+
+    def add(self, mail, project):
+        """Queue a mail for import.
+
+        Args:
+            mail (`mbox.Mail` or ParsedMail): Mail to add.
+            project (patchwork.Project): Project the mail belongs to.
+        """
+        self._items.append(
+            _Item(ParsedMail.wrap(mail, project.linkname), project))
+
+    def flush(self):
+        """Write all queued mails to the database.
+
+        Returns:
+            A list with a result for each queued mail, in order. This is
+            a Patch, CoverLetter or Comment instance, None if the mail
+            was dropped, or an exception instance if the mail was a
+            duplicate or could not be parsed.
+        """
+        items, self._items = self._items, []
+        if not items:
+            return []
+
+        try:
+            with transaction.atomic():
+                self._import(items)
+        except IntegrityError:
+            logger.warning('Failed to import window of %d mails, retrying '
+                           'one at a time', len(items))
+            # our caches may now refer to rows that were rolled back
+            self._people = {}
+            self._import_serial(items)
+
+        return [item.result for item in items]
+
+    @staticmethod
+    def _import_serial(items):
+        for item in items:
+            try:
+                with transaction.atomic():
+                    item.result = save_mail(item.mail, item.project)
+            except (IntegrityError, ValueError) as exc:
+                item.result = exc
+
+    def _load_people(self, emails):
+        """Load people we haven't seen yet, matching emails like iexact."""
+        emails = set(e for e in emails if e.lower() not in self._people)
+        if not emails:
+            return
+
+        variants = emails | set(e.lower() for e in emails)
+        for person in Person.objects.filter(email__in=variants):
+            self._people.setdefault(person.email.lower(), person)
+
+        missing = [e for e in emails if e.lower() not in self._people]
+        if missing:
+            query = reduce(operator.or_,
+                           (Q(email__iexact=e) for e in missing))
+            for person in Person.objects.filter(query):
+                self._people.setdefault(person.email.lower(), person)
+
+    def _import(self, items):
+        delta = datetime.timedelta(minutes=SERIES_DELAY_INTERVAL)
+
+        # parse mails first, as 'save_mail' would
+
+        valid = []
+        for item in items:
+            try:
+                item.author_name, email = item.mail.parse().author
+            except ValueError as exc:
+                item.result = exc
+                continue
+            item.email = email
+            valid.append(item)
+
+        if not valid:
+            return
+
+        # load existing state for the whole window
+
+        self._load_people([item.email for item in valid])
+
+        projects = dict((item.project.id, item.project) for item in valid)
+        msgids = defaultdict(set)
+        names = set()
+        dates = [item.mail.date for item in valid]
+
+        for item in valid:
+            refs = [item.mail.msgid] + [
+                ref[:255] for ref in item.mail.refs]
+            msgids[item.project.id].update(refs)
+            names.add(item.mail.name)
+
+        # submissions and comments, keyed by (project ID, msgid)
+        submissions = {}
+        comment_parents = {}
+        # identities of (submission, msgid) pairs of comments
+        comment_keys = set()
+        # stub submissions for existing rows, keyed by ID
+        stubs = {}
+
+        def get_stub(submission_id, is_patch):
+            if submission_id not in stubs:
+                stub = Submission(id=submission_id)
+                stub.is_patch = is_patch
+                stubs[submission_id] = stub
+            return stubs[submission_id]
+
+        # series references, keyed by (project ID, msgid)
+        series_refs = {}
+        series_states = {}
+
+        for project_id, project_msgids in msgids.items():
+            for msgid, sub_id, sub_msgid, patch_id, series_id in \
+                    MessageIndex.objects.filter(
+                        project_id=project_id,
+                        msgid__in=list(project_msgids),
+                    ).values_list('msgid', 'submission', 'submission__msgid',
+                                  'submission__patch', 'series'):
+                key = (project_id, msgid)
+
+                if sub_id is not None:
+                    stub = get_stub(sub_id, patch_id is not None)
+                    if sub_msgid == msgid:
+                        submissions[key] = stub
+                    else:
+                        comment_parents[key] = stub
+                        comment_keys.add((id(stub), msgid))
+
+                if series_id is not None:
+                    series_refs[key] = series_id
+
+        # series we might add patches or cover letters to
+        series_ids = set(series_refs.values())
+        candidates = Series.objects.filter(
+            Q(id__in=series_ids) | Q(
+                project_id__in=list(projects),
+                date__range=[min(dates) - delta, max(dates) + delta]))
+        for series in candidates:
+            series_states[series.id] = _SeriesState(
+                series, series.submitter_id, series.cover_letter_id)
+
+        for key, series_id in list(series_refs.items()):
+            series_refs[key] = series_states[series_id]
+
+        for series_id, number, patch_id, name in SeriesPatch.objects.filter(
+                series_id__in=list(series_states),
+        ).values_list('series', 'number', 'patch', 'patch__name'):
+            series_states[series_id].patches[number] = (None, patch_id, name)
+
+        by_markers = list(series_states.values())
+
+        cover_names = Counter(CoverLetter.objects.filter(
+            project_id__in=list(projects), name__in=list(names),
+        ).values_list('project', 'name'))
+
+        # resolve everything in memory
+
+        new_people = []
+        changed_people = []
+        new_series = []
+        patches = []
+        covers = []
+        comments = []
+        # project IDs of the comments, as existing submissions are stubs
+        comment_projects = []
+        refs_to_create = []
+        series_patches = []
+        tag_counts = {}
+        retag = set()
+        events = []
+
+        def use_author(item):
+            person = self._people.get(item.email.lower())
+            if person is None:
+                person = Person(name=item.author_name, email=item.email)
+                self._people[item.email.lower()] = person
+                new_people.append(person)
+            elif item.author_name and person.name != item.author_name:
+                person.name = item.author_name
+                if person.pk and person not in changed_people:
+                    changed_people.append(person)
+            return person
+
+        def same_submitter(state, author):
+            if author.pk is not None and state.submitter == author.pk:
+                return True
+            return state.submitter is author
+
+        def find_series(item, author):
+            project_id = item.project.id
+            refs = [item.mail.msgid] + item.mail.refs
+            for ref in refs:
+                state = series_refs.get((project_id, ref[:255]))
+                if state:
+                    return state
+
+            mail = item.mail
+            matches = [
+                state for state in by_markers
+                if state.series.project_id == project_id and
+                same_submitter(state, author) and
+                state.series.version == mail.version and
+                state.series.total == mail.series_marker[1] and
+                mail.date - delta <= state.series.date <= mail.date + delta]
+            if len(matches) == 1:
+                return matches[0]
+
+        def create_series(item, author, total):
+            series = Series(project=item.project,
+                            date=item.mail.date,
+                            submitter=author,
+                            version=item.mail.version,
+                            total=total)
+            state = _SeriesState(series, author, new=True)
+            new_series.append(state)
+            by_markers.append(state)
+            events.append((Event.CATEGORY_SERIES_CREATED, item.project,
+                           {'series': state}))
+            return state
+
+        def add_patch(state, patch, number, item):
+            if number in state.patches:
+                return
+
+            if not state.series.name and number == 1:
+                state.series.name = patch.name
+                state.changed = True
+
+            state.patches[number] = (patch, None, patch.name)
+            series_patches.append((state, patch, number))
+
+            # see 'create_patch_completed_event'
+            numbers = sorted(state.patches)
+            if numbers.index(number) == number - 1:
+                events.append((Event.CATEGORY_PATCH_COMPLETED, item.project,
+                               {'patch': patch, 'series': state}))
+                count = number + 1
+                for successor in numbers[numbers.index(number) + 1:]:
+                    if successor != count:
+                        break
+                    events.append((
+                        Event.CATEGORY_PATCH_COMPLETED, item.project,
+                        {'patch': state.patches[successor], 'series': state}))
+                    count += 1
+
+            # see 'create_series_completed_event'
+            if state.series.total <= len(state.patches):
+                events.append((Event.CATEGORY_SERIES_COMPLETED, item.project,
+                               {'series': state}))
+
+        def add_cover_letter(state, cover):
+            series = state.series
+            if state.cover:
+                return
+
+            series.cover_letter = state.cover = cover
+            state.changed = True
+
+            if not series.name:
+                series.name = Series._format_name(cover)
+            else:
+                first = state.patches.get(1)
+                if first and series.name == first[2]:
+                    series.name = Series._format_name(cover)
+
+        for item in valid:
+            mail = item.mail
+            project = item.project
+            msgid = mail.msgid
+            name = mail.name
+            x, n = mail.series_marker
+            refs = [ref[:255] for ref in mail.refs]
+            diff, message = mail.diff, mail.message
+
+            if not (diff or message):
+                logger.error("Couldn't find patch or comment content")
+                continue
+
+            if not mail.is_comment and (diff or mail.pull_url):
+                if (project.id, msgid) in submissions:
+                    item.result = IntegrityError('Duplicate patch')
+                    continue
+
+                author = use_author(item)
+
+                delegate = find_delegate_by_header(item.mail)
+                if not delegate and diff:
+                    delegate = find_delegate_by_filename(
+                        project, mail.filenames)
+
+                state = None
+                if n:
+                    state = find_series(item, author)
+                else:
+                    x = n = 1
+
+                if not state or x in state.patches:
+                    state = create_series(item, author, n)
+                    for ref in refs + [msgid]:
+                        if (project.id, ref) not in series_refs:
+                            series_refs[(project.id, ref)] = state
+                            refs_to_create.append((state, ref))
+
+                patch = Patch(
+                    msgid=msgid,
+                    project=project,
+                    name=name[:255],
+                    date=mail.date,
+                    headers=mail.headers,
+                    submitter=author,
+                    content=message,
+                    diff=diff,
+                    pull_url=mail.pull_url,
+                    delegate=delegate,
+                    state=find_state(item.mail))
+                if diff is not None:
+                    patch.hash = hash_diff(diff)
+                patch.is_patch = True
+
+                patches.append(patch)
+                submissions[(project.id, msgid)] = patch
+                tag_counts[id(patch)] = Patch.extract_tags(
+                    message, project.tags) if message else Counter()
+                events.append((Event.CATEGORY_PATCH_CREATED, project,
+                               {'patch': patch}))
+
+                if state and x:
+                    add_patch(state, patch, x, item)
+
+                item.result = patch
+                continue
+            elif x == 0:
+                is_cover_letter = False
+                if not mail.is_comment:
+                    if refs:
+                        is_cover_letter = not cover_names[(project.id, name)]
+                    else:
+                        is_cover_letter = True
+
+                if is_cover_letter:
+                    if (project.id, msgid) in submissions:
+                        item.result = IntegrityError('Duplicate cover letter')
+                        continue
+
+                    author = use_author(item)
+
+                    state = series_refs.get((project.id, msgid))
+                    if not state:
+                        state = create_series(item, author, n)
+                        series_refs[(project.id, msgid)] = state
+                        refs_to_create.append((state, msgid))
+
+                    cover = CoverLetter(
+                        msgid=msgid,
+                        project=project,
+                        name=name[:255],
+                        date=mail.date,
+                        headers=mail.headers,
+                        submitter=author,
+                        content=message)
+                    cover.is_patch = False
+
+                    covers.append(cover)
+                    submissions[(project.id, msgid)] = cover
+                    cover_names[(project.id, cover.name)] += 1
+                    events.append((Event.CATEGORY_COVER_CREATED, project,
+                                   {'cover': cover}))
+
+                    add_cover_letter(state, cover)
+
+                    item.result = cover
+                    continue
+
+            # comments
+
+            submission = None
+            for ref in refs:
+                submission = submissions.get((project.id, ref)) or \
+                    comment_parents.get((project.id, ref))
+                if submission:
+                    break
+
+            if not submission:
+                logger.error("Couldn't find parent submission for comment")
+                continue
+
+            if (id(submission), msgid) in comment_keys:
+                item.result = IntegrityError('Duplicate comment')
+                continue
+
+            author = use_author(item)
+
+            comment = Comment(
+                submission=submission,
+                msgid=msgid,
+                date=mail.date,
+                headers=mail.headers,
+                submitter=author,
+                content=message)
+
+            comments.append(comment)
+            comment_projects.append(project.id)
+            comment_keys.add((id(submission), msgid))
+            comment_parents[(project.id, msgid)] = submission
+
+            if submission.is_patch:
+                if id(submission) in tag_counts:
+                    tag_counts[id(submission)] += Patch.extract_tags(
+                        message, project.tags)
+                else:
+                    retag.add(submission.id)
+
+            item.result = comment
+
+        # write everything out
+
+        if new_people:
+            Person.objects.bulk_create(new_people)
+            ids = dict(Person.objects.filter(
+                email__in=[p.email for p in new_people],
+            ).values_list('email', 'id'))
+            for person in new_people:
+                person.pk = ids[person.email]
+
+        for person in changed_people:
+            Person.objects.filter(pk=person.pk).update(name=person.name)
+
+        submissions = patches + covers
+        if submissions:
+            _sync_fks(submissions, 'project', 'submitter')
+            _insert(Submission, submissions, [
+                f for f in Submission._meta.local_concrete_fields
+                if not f.primary_key])
+
+            by_project = defaultdict(list)
+            for submission in submissions:
+                by_project[submission.project_id].append(submission.msgid)
+
+            ids = {}
+            for project_id, project_msgids in by_project.items():
+                for msgid, sub_id in Submission.objects.filter(
+                        project_id=project_id, msgid__in=project_msgids,
+                ).values_list('msgid', 'id'):
+                    ids[(project_id, msgid)] = sub_id
+
+            for submission in submissions:
+                submission.id = submission.submission_ptr_id = ids[
+                    (submission.project_id, submission.msgid)]
+
+            _sync_fks(patches, 'delegate', 'state')
+            for patch in patches:
+                patch.tag_counts = dict(
+                    (tag.id, count)
+                    for tag, count in tag_counts[id(patch)].items() if count)
+                patch.set_diffstat()
+            _insert(Patch, patches, Patch._meta.local_concrete_fields)
+            _insert(CoverLetter, covers,
+                    CoverLetter._meta.local_concrete_fields)
+
+        if new_series:
+            objs = [state.series for state in new_series]
+            _sync_fks(objs, 'project', 'submitter', 'cover_letter')
+            _create_with_ids(Series, objs)
+
+        for state in series_states.values():
+            if not state.changed:
+                continue
+            _sync_fks([state.series], 'cover_letter')
+            Series.objects.filter(pk=state.series.pk).update(
+                name=state.series.name,
+                cover_letter=state.series.cover_letter_id)
+
+        SeriesReference.objects.bulk_create([
+            SeriesReference(series=state.series, msgid=msgid)
+            for state, msgid in refs_to_create])
+
+        SeriesPatch.objects.bulk_create([
+            SeriesPatch(series=state.series, patch=patch, number=number)
+            for state, patch, number in series_patches])
+
+        _sync_fks(comments, 'submission', 'submitter')
+        Comment.objects.bulk_create(comments)
+
+        index = defaultdict(list)
+        for submission in submissions:
+            index[submission.project_id].append(
+                (submission.msgid, submission.id, None, True))
+        for comment, project_id in zip(comments, comment_projects):
+            index[project_id].append(
+                (comment.msgid, comment.submission_id, None, False))
+        for state, msgid in refs_to_create:
+            index[state.series.project_id].append(
+                (msgid, None, state.series.id, False))
+        for project_id, entries in index.items():
+            MessageIndex.objects.record(project_id, entries)
+
+        PatchFile.objects.bulk_create([
+            PatchFile(patch=patch, path=path)
+            for patch in patches
+            for path in Patch.extract_paths(patch.diff)])
+
+        PatchTag.objects.bulk_create([
+            PatchTag(patch=patch, tag=tag, count=count)
+            for patch in patches
+            for tag, count in tag_counts[id(patch)].items() if count])
+
+        Event.objects.bulk_create([
+            self._build_event(category, project, fields)
+            for category, project, fields in events])
+
+        # the documents of new submissions include any of their comments,
+        # while comments on existing submissions are added to them
+        documents = set(submission.id for submission in submissions)
+        update_documents(documents)
+        add_comments([comment for comment in comments
+                      if comment.submission_id not in documents])
+
+        if retag:
+            retag_patches(Patch.objects.filter(id__in=list(retag)))
+
+    @staticmethod
+    def _build_event(category, project, fields):
+        event = Event(project=project, category=category)
+
+        for name, value in fields.items():
+            if isinstance(value, _SeriesState):
+                value = value.series
+            elif isinstance(value, tuple):
+                # an existing patch from 'SeriesPatch' or a new one
+                value = value[0] or Patch(pk=value[1])
+            setattr(event, name, value)
+
+        return event
@@ -0,0 +1,205 @@
+# Patchwork - automated patch tracking system
+#
+# This file is part of the Patchwork package.
+#
+# Patchwork is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Patchwork is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Patchwork; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+"""Per-process cache of reference data used when parsing mails.
+
+Projects, states, tags and delegation rules are needed for every mail
+parsed but rarely change. Rather than querying for them each time, they
+are cached in each process.
+
+Entries are discarded whenever any of these models is saved or deleted
+(see :mod:`patchwork.signals`). If the default Django cache is shared
+between processes, such as memcached, this also publishes a new
+generation in it, which every process compares with the one its entries
+were built for, so changes made by other processes are seen immediately.
+Otherwise, changes made by other processes are picked up once the cache
+expires, after ``LOOKUP_CACHE_TIMEOUT`` seconds.
+"""
+
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+from patchwork.delegation import DelegationMatcher
+from patchwork.models import DelegationRule
+from patchwork.models import Project
+from patchwork.models import State
+from patchwork.models import Tag
+from patchwork.tags import TagMatcher
+
+# key of the generation published in the Django cache
+GENERATION_KEY = 'patchwork:lookups:generation'
+
+# cache backends which aren't shared between processes
+_LOCAL_CACHES = (
+    'django.core.cache.backends.dummy.DummyCache',
+    'django.core.cache.backends.locmem.LocMemCache',
+)
+
+_lock = threading.Lock()
+_entries = {}
+_generation = 0
+_shared_generation = None
+_expires = 0
+
+
+def _is_shared_cache():
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    return bool(backend) and backend not in _LOCAL_CACHES
+
+
+def _get_shared_generation():
+    """Return the generation published in the Django cache.
+
+    Returns:
+        An opaque value, which changes when any process invalidates its
+        cache, or None if the Django cache isn't shared between
+        processes or is unavailable.
+    """
+    if not _is_shared_cache():
+        return None
+
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        # the key may have been evicted, in which case entries built for
+        # the previous generation are discarded as if it had changed
+        cache.add(GENERATION_KEY, uuid.uuid4().hex, None)
+        generation = cache.get(GENERATION_KEY)
+
+    return generation
+
+
+def invalidate():
+    """Discard all cached reference data, in every process if possible."""
+    global _entries, _generation, _expires
+
+    with _lock:
+        _generation += 1
+        _entries = {}
+        _expires = 0
+
+    if _is_shared_cache():
+        # a new random value rather than an increment, so concurrent
+        # invalidations can't be lost and an evicted key can't be reused
+        cache.set(GENERATION_KEY, uuid.uuid4().hex, None)
+
+
+def _lookup(key, fn):
+    """Return the cached value for a key, calling fn to build it."""
+    global _entries, _generation, _shared_generation, _expires
+
+    shared_generation = _get_shared_generation()
+
+    with _lock:
+        now = time.time()
+        if shared_generation is not None:
+            if shared_generation != _shared_generation:
+                _generation += 1
+                _entries = {}
+                _shared_generation = shared_generation
+        elif now >= _expires:
+            _entries = {}
+            _expires = now + settings.LOOKUP_CACHE_TIMEOUT
+
+        if key in _entries:
+            return _entries[key]
+
+        generation = _generation
+
+    value = fn()
+
+    with _lock:
+        # don't store the value if the cache was invalidated while we were
+        # building it, as it could be stale
+        if generation == _generation:
+            _entries[key] = value
+
+    return value
+
+
+def get_project(list_id):
+    """Return the project with the given list ID, or None."""
+    def fn():
+        try:
+            return Project.objects.get(listid=list_id)
+        except Project.DoesNotExist:
+            return None
+
+    return _lookup(('project', list_id), fn)
+
+
+def _get_states():
+    return _lookup(('states',), lambda: list(State.objects.all()))
+
+
+def get_state(name):
+    """Return the state with the given name, ignoring case, or None."""
+    name = name.lower()
+    for state in _get_states():
+        if state.name.lower() == name:
+            return state
+
+    return None
+
+
+def get_default_state():
+    """Return the default initial state for patches.
+
+    Raises:
+        State.DoesNotExist: There is no default state.
+    """
+    for state in _get_states():
+        if state.ordering == 0:
+            return state
+
+    raise State.DoesNotExist('No default state found')
+
+
+def get_tags():
+    """Return all tags."""
+    return _lookup(('tags',), lambda: list(Tag.objects.all()))
+
+
+def get_tag_matcher(tags):
+    """Return a compiled matcher for a list of tags.
+
+    Returns:
+        A :class:`patchwork.tags.TagMatcher` instance
+    """
+    key = tuple((tag.id, tag.pattern) for tag in tags)
+    return _lookup(('tag_matcher', key), lambda: TagMatcher(tags))
+
+
+def get_delegation_rules(project):
+    """Return the delegation rules for a project, in priority order."""
+    return _lookup(('rules', project.id), lambda: list(
+        DelegationRule.objects.filter(project=project).select_related(
+            'user')))
+
+
+def get_delegation_matcher(project):
+    """Return a compiled matcher for the delegation rules of a project.
+
+    Returns:
+        A :class:`patchwork.delegation.DelegationMatcher` instance
+    """
+    return _lookup(('matcher', project.id), lambda: DelegationMatcher(
+        get_delegation_rules(project)))
@@ -0,0 +1,162 @@
+# Patchwork - automated patch tracking system
+#
+# This file is part of the Patchwork package.
+#
+# Patchwork is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Patchwork is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Patchwork; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+from optparse import make_option
+import time
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db import transaction
+
+from patchwork.db import bulk_update
+from patchwork.fields import COMPRESSION_MARKER
+from patchwork.fields import compress_text
+from patchwork.fields import decompress_text
+from patchwork.fields import is_compressed
+from patchwork.models import Comment
+from patchwork.models import Patch
+from patchwork.models import Submission
+
+# the fields to compress, with the models whose tables store them
+FIELDS = [
+    (Submission, 'content'),
+    (Submission, 'headers'),
+    (Comment, 'content'),
+    (Comment, 'headers'),
+    (Patch, 'diff'),
+]
+
+
+class Command(BaseCommand):
+    help = 'Compress the stored diffs, contents and headers of mails'
+
+    if django.VERSION < (1, 8):
+        option_list = BaseCommand.option_list + (
+            make_option(
+                '--chunk-size', type='int', default=500,
+                help='number of rows to load and update at once.'),
+            make_option(
+                '--sleep', type='float', default=0,
+                help='number of seconds to wait between chunks.'),
+        )
+    else:
+        def add_arguments(self, parser):
+            parser.add_argument(
+                '--chunk-size', type=int, default=500,
+                help='number of rows to load and update at once.')
+            parser.add_argument(
+                '--sleep', type=float, default=0,
+                help='number of seconds to wait between chunks.')
+
+    def _query(self, model, name, min_length):
+        """Find the rows with a value which may need compressing.
+
+        The stored value is selected as ``stored``, as values loaded
+        through the field are decompressed.
+        """
+        qn = connection.ops.quote_name
+        column = '%s.%s' % (qn(model._meta.db_table),
+                            qn(model._meta.get_field(name).column))
+
+        return model.objects.extra(
+            select={'stored': column},
+            where=['LENGTH(%s) >= %%s' % column,
+                   'SUBSTR(%s, 1, 1) <> %%s' % column],
+            params=[min_length,
+                    connection.Database.Binary(COMPRESSION_MARKER)])
+
+    def _compress_chunk(self, model, name, query, last_id, chunk_size):
+        """Compress the values of a chunk of rows, ordered by ID.
+
+        Each chunk is fetched by ID rather than with an OFFSET, so the
+        cost of fetching a chunk doesn't grow as we progress. The rows
+        are locked until they are written, so that changes made to them
+        in the meantime aren't overwritten.
+
+        Returns:
+            A tuple of the IDs of the rows and the number of values
+            compressed
+        """
+        query = query.order_by('pk').values_list('pk', 'stored')
+
+        with transaction.atomic():
+            rows = list(query.select_for_update().filter(
+                pk__gt=last_id)[:chunk_size])
+
+            # values are compressed as they are written, so the original
+            # text is passed for those that are made smaller by compressing
+            # them
+            values = []
+            for pk, stored in rows:
+                value = decompress_text(stored)
+                if is_compressed(compress_text(value)):
+                    values.append((pk, value))
+
+            bulk_update(model, name, values)
+
+        return [pk for pk, _ in rows], len(values)
+
+    def handle(self, *args, **options):
+        chunk_size = options.get('chunk_size') or 500
+        sleep = options.get('sleep') or 0
+        min_length = settings.TEXT_COMPRESSION_MIN_LENGTH
+
+        if min_length is None:
+            self.stdout.write('Compression is disabled, as '
+                              'TEXT_COMPRESSION_MIN_LENGTH is not set')
+            return
+
+        compressed = 0
+        start_time = time.time()
+
+        for model, name in FIELDS:
+            query = self._query(model, name, min_length)
+            count = query.count()
+            processed = 0
+            last_id = 0
+            field_start_time = time.time()
+
+            self.stdout.write('Compressing %s.%s' % (
+                model._meta.db_table, name))
+
+            while True:
+                ids, count_compressed = self._compress_chunk(
+                    model, name, query, last_id, chunk_size)
+                if not ids:
+                    break
+                last_id = ids[-1]
+                processed += len(ids)
+                compressed += count_compressed
+
+                elapsed = time.time() - field_start_time
+                self.stdout.write('%06d/%06d (%d rows/s)\r' % (
+                    processed, count, processed / max(elapsed, 0.001)),
+                    ending='')
+                self.stdout.flush()
+
+                if sleep:
+                    time.sleep(sleep)
+
+            if processed:
+                self.stdout.write('')
+
+        elapsed = time.time() - start_time
+        self.stdout.write('Compressed %d values in %.1f seconds' % (
+            compressed, elapsed))
@@ -17,41 +17,329 @@
 # along with Patchwork; if not, write to the Free Software
 # Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 
+from collections import deque
+from itertools import islice
 import logging
-import mailbox
+import multiprocessing
 from optparse import make_option
 import os
 import sys
+import time
 
 import django
 from django.core.management.base import BaseCommand
 
 from patchwork import models
-from patchwork.parser import parse_mail
+from patchwork.archive import Checkpoint
+from patchwork.archive import headers_from_bytes
+from patchwork.archive import MaildirReader
+from patchwork.archive import message_from_bytes
+from patchwork.archive import open_archive
+from patchwork.importer import BulkImporter
+from patchwork.importer import find_msgids
+from patchwork.importer import is_stored
+from patchwork.parser import check_mail
+from patchwork.parser import ParsedMail
+from patchwork.parser import save_mail
 
 logger = logging.getLogger(__name__)
 
+# result for mails skipped because they are already stored
+SKIPPED = 'skipped'
+
+# number of mails sent to a worker process at once
+CHUNK_SIZE = 16
+
+# state shared with worker processes, set by '_init_worker'
+_worker_list_id = None
+_worker_linknames = None
+_worker_msgids = None
+
+
+def _init_worker(list_id, linknames, msgids):
+    global _worker_list_id, _worker_linknames, _worker_msgids
+
+    _worker_list_id = list_id
+    _worker_linknames = linknames
+    _worker_msgids = msgids
+
+
+def _extract_worker(message, check_known=True):
+    """Parse a raw mail and extract everything that doesn't need the DB.
+
+    This can run in a worker process and must never touch the database.
+
+    Args:
+        message: An ``(offset, data)`` tuple of a raw mail.
+        check_known: Whether to check the message ID against the
+            preloaded message IDs of stored mails.
+
+    Returns:
+        A ``(offset, status, mail, list_id)`` tuple, where offset is the
+        offset or key of the message in the archive, status is one of
+        'ok', 'dropped', 'known' or 'error' and mail is a parsed
+        ``ParsedMail``. For 'known' mails, which are probably already
+        stored, mail is instead a ``(msgid, message)`` tuple so the match
+        can be confirmed.
+    """
+    offset, data = message
+
+    try:
+        # only the headers are needed to find the project and to spot mails
+        # we already have, so don't parse the whole mail until we know we
+        # need it
+        headers = ParsedMail(headers_from_bytes(data))
+
+        if _worker_list_id:
+            list_ids = [_worker_list_id]
+        else:
+            list_ids = headers.list_ids
+
+        for list_id in list_ids:
+            if list_id in _worker_linknames:
+                break
+        else:
+            return (offset, 'dropped', None, None)
+
+        if check_known and _worker_msgids is not None and \
+                headers.msgid in _worker_msgids.get(list_id, ()):
+            return (offset, 'known', (headers.msgid, message), list_id)
+
+        mail = ParsedMail(message_from_bytes(data))
+
+        if not check_mail(mail):
+            return (offset, 'dropped', None, None)
+
+        mail.linkname = _worker_linknames[list_id]
+        mail.parse()
+    except ValueError:
+        return (offset, 'error', None, None)
+    except AttributeError:
+        # broken mails can trip up the Python 'email' library, as described
+        # in '2017-July/004486.html' from the Patchwork archives. Skip them
+        # rather than aborting the import.
+        logger.warning('Broken mail at offset %s, skipping', offset)
+        return (offset, 'error', None, None)
+
+    return (offset, 'ok', mail, list_id)
+
+
+def _extract_chunk(messages):
+    return [_extract_worker(message) for message in messages]
+
 
 class Command(BaseCommand):
     help = 'Parse an mbox archive file and store any patches/comments found.'
 
     if django.VERSION < (1, 8):
-        args = '<infile>'
+        args = '[<infile>]'
         option_list = BaseCommand.option_list + (
             make_option(
                 '--list-id',
                 help='mailing list ID. If not supplied, this will be '
                 'extracted from the mail headers.'),
+            make_option(
+                '--jobs', type='int', default=1,
+                help='number of processes to use for parsing mails. Database '
+                'writes are always made from the main process.'),
+            make_option(
+                '--batch-size', type='int', default=1,
+                help='number of mails to write to the database at once. '
+                'Batches are written using bulk inserts.'),
+            make_option(
+                '--checkpoint',
+                help='file to record progress through the archive in, so '
+                'the import can be resumed with --resume.'),
+            make_option(
+                '--resume', action='store_true', default=False,
+                help='skip mails recorded in the checkpoint file by a '
+                'previous import.'),
+            make_option(
+                '--since-offset', type='int', default=0,
+                help='skip mails starting before this byte offset in the '
+                'uncompressed mbox.'),
+            make_option(
+                '--preload', action='store_true', default=False,
+                help='load the message IDs of stored mails up front, so '
+                'mails which are already stored are skipped without being '
+                'parsed.'),
         )
     else:
         def add_arguments(self, parser):
             parser.add_argument(
                 'infile',
-                help='input mbox filename')
+                nargs='?',
+                type=str,
+                default=None,
+                help='input mbox filename, optionally compressed with gzip '
+                'or xz, or Maildir directory. If not supplied, or if '
+                "'-', the mbox is read from stdin.")
             parser.add_argument(
                 '--list-id',
                 help='mailing list ID. If not supplied, this will be '
                 'extracted from the mail headers.')
+            parser.add_argument(
+                '--jobs', type=int, default=1,
+                help='number of processes to use for parsing mails. Database '
+                'writes are always made from the main process.')
+            parser.add_argument(
+                '--batch-size', type=int, default=1,
+                help='number of mails to write to the database at once. '
+                'Batches are written using bulk inserts.')
+            parser.add_argument(
+                '--checkpoint',
+                help='file to record progress through the archive in, so '
+                'the import can be resumed with --resume.')
+            parser.add_argument(
+                '--resume', action='store_true', default=False,
+                help='skip mails recorded in the checkpoint file by a '
+                'previous import.')
+            parser.add_argument(
+                '--since-offset', type=int, default=0,
+                help='skip mails starting before this byte offset in the '
+                'uncompressed mbox.')
+            parser.add_argument(
+                '--preload', action='store_true', default=False,
+                help='load the message IDs of stored mails up front, so '
+                'mails which are already stored are skipped without being '
+                'parsed.')
+
+    def _extract(self, reader, list_id, jobs, preload):
+        """Extract mails from the archive, in order.
+
+        If more than one job is requested, the parsing happens in worker
+        processes.
+
+        If requested, the message IDs of the mails already stored for
+        each project are loaded first, so the workers can skip these
+        mails without parsing them. These are kept as hashes, to keep
+        them small, so each match is checked against the database.
+        """
+        projects = models.Project.objects.all()
+        if list_id:
+            projects = projects.filter(listid=list_id)
+        projects = dict((project.listid, project) for project in projects)
+
+        linknames = {}
+        msgids = {} if preload else None
+        for project in projects.values():
+            linknames[project.listid] = project.linkname
+            if preload:
+                msgids[project.listid] = find_msgids(project)
+
+        _init_worker(list_id, linknames, msgids)
+
+        if jobs <= 1:
+            extracted = (_extract_worker(message) for message in reader)
+        else:
+            extracted = self._extract_parallel(reader, list_id, jobs,
+                                               linknames, msgids)
+
+        for result in self._confirm_known(extracted, projects):
+            yield result
+
+    @staticmethod
+    def _confirm_known(extracted, projects):
+        """Check mails which are probably stored against the database.
+
+        Mails which are stored are skipped, while any others are parsed
+        as usual.
+        """
+        for result in extracted:
+            offset, status, mail, list_id = result
+            if status == 'known':
+                msgid, message = mail
+                if is_stored(projects[list_id], msgid):
+                    result = (offset, 'skipped', None, None)
+                else:
+                    result = _extract_worker(message, check_known=False)
+            yield result
+
+    @staticmethod
+    def _extract_parallel(reader, list_id, jobs, linknames, msgids):
+        """Extract mails from the archive using worker processes.
+
+        The writes must still be done in order, and from one process, so
+        that threading of series and comments works as expected, so
+        chunks of mails are collected in the order they were sent. Only a
+        few chunks are in flight at once, so that neither the unparsed nor
+        the parsed mails pile up in memory if the writes are slower than
+        the parsing.
+        """
+        pool = multiprocessing.Pool(jobs, _init_worker,
+                                    (list_id, linknames, msgids))
+        # parsed chunks waiting to be saved, in order
+        pending = deque()
+        reader = iter(reader)
+        try:
+            while True:
+                chunk = list(islice(reader, CHUNK_SIZE))
+                if chunk:
+                    pending.append(pool.apply_async(_extract_chunk, (chunk,)))
+                    # bound the number of chunks held in memory
+                    if len(pending) <= jobs * 2:
+                        continue
+                if not pending:
+                    break
+                for result in pending.popleft().get():
+                    yield result
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def _save(self, extracted, batch_size):
+        """Save parsed mails.
+
+        Results are yielded in archive order, and only once the mail has
+        been written to the database.
+
+        Returns:
+            A generator of ``(offset, result)`` tuples
+        """
+        projects = {}
+        importer = BulkImporter() if batch_size > 1 else None
+        # results of mails waiting on the importer, None for queued mails
+        pending = []
+
+        for offset, status, mail, list_id in extracted:
+            if status != 'ok':
+                result = {
+                    'error': ValueError('Failed to parse mail'),
+                    'skipped': SKIPPED,
+                }.get(status)
+                if importer is not None:
+                    pending.append((offset, False, result))
+                    continue
+                yield offset, result
+                continue
+
+            if list_id not in projects:
+                projects[list_id] = models.Project.objects.get(listid=list_id)
+
+            if importer is not None:
+                importer.add(mail, projects[list_id])
+                pending.append((offset, True, None))
+                if len(importer) >= batch_size:
+                    for result in self._flush(importer, pending):
+                        yield result
+                continue
+
+            try:
+                result = save_mail(mail, projects[list_id])
+            except (django.db.utils.IntegrityError, ValueError) as exc:
+                result = exc
+            yield offset, result
+
+        if importer is not None:
+            for result in self._flush(importer, pending):
+                yield result
+
+    @staticmethod
+    def _flush(importer, pending):
+        results = iter(importer.flush())
+        for offset, queued, result in pending:
+            yield offset, next(results) if queued else result
+        del pending[:]
 
     def handle(self, *args, **options):
         results = {
@@ -60,58 +348,103 @@ class Command(BaseCommand):
             models.Comment: 0,
         }
         duplicates = 0
+        skipped = 0
         dropped = 0
         errors = 0
 
-        # TODO(stephenfin): Support passing via stdin
-        path = args and args[0] or options['infile']
-        if not os.path.exists(path):
+        path = args and args[0] or options['infile'] or '-'
+        if path != '-' and not os.path.exists(path):
             self.stdout.write('Invalid path: %s' % path)
             sys.exit(1)
 
-        # assume if <infile> is a directory, then we're passing a maildir
-        if os.path.isfile(path):
-            mbox = mailbox.mbox(path)
-        else:
-            mbox = mailbox.Maildir(path)
-
-        count = len(mbox)
-
-        # Iterate through the mbox. This will pick up exceptions that are only
-        # thrown when a broken email is found part way through. Without this
-        # block, we'd get the exception thrown in enumerate(mbox) below, which
-        # is harder to catch. This is due to a bug in the Python 'email'
-        # library, as described here:
-        #
-        #   https://lists.ozlabs.org/pipermail/patchwork/2017-July/004486.html
-        #
-        # The alternative is converting the mbox to a list of messages, but
-        # that requires holding the entire thing in memory, which is wateful.
         try:
-            for m in mbox:
-                pass
-        except AttributeError:
-            logger.warning('Broken mbox/Maildir, aborting')
-            return
-
-        logger.info('Parsing %d mails', count)
-        for i, msg in enumerate(mbox):
+            reader = open_archive(path)
+        except ValueError as exc:
+            self.stdout.write('Invalid archive: %s' % exc)
+            sys.exit(1)
+
+        jobs = options.get('jobs') or 1
+        batch_size = options.get('batch_size') or 1
+        since_offset = options.get('since_offset') or 0
+        maildir = isinstance(reader, MaildirReader)
+
+        if since_offset:
+            if maildir:
+                self.stdout.write('--since-offset is not supported for '
+                                  'Maildirs')
+                sys.exit(1)
+            reader.seek(since_offset)
+
+        checkpoint = None
+        if options.get('checkpoint'):
+            # Maildirs are read in no particular order, so the key of each
+            # message must be recorded
+            checkpoint = Checkpoint(options['checkpoint'], path,
+                                    last_only=not maildir)
+        elif options.get('resume'):
+            self.stdout.write('--resume requires --checkpoint')
+            sys.exit(1)
+
+        if checkpoint and options.get('resume'):
             try:
-                obj = parse_mail(msg, options['list_id'])
-                if obj:
+                entries = checkpoint.load()
+            except ValueError as exc:
+                self.stdout.write('Invalid checkpoint: %s' % exc)
+                sys.exit(1)
+
+            if maildir:
+                reader.exclude(entries)
+                logger.info('Resuming from %d mails recorded in %s',
+                            len(entries), checkpoint.path)
+            elif entries:
+                # skip everything up to and including the last mail seen
+                offset = int(entries[-1]) + 1
+                reader.seek(max(offset, since_offset))
+                logger.info('Resuming from offset %d recorded in %s',
+                            offset, checkpoint.path)
+
+        if checkpoint:
+            checkpoint.open(resume=options.get('resume'))
+
+        logger.info('Parsing mails from %s', path)
+        results_iter = self._save(
+            self._extract(reader, options['list_id'], jobs,
+                          options.get('preload')),
+            batch_size)
+
+        start = time.time()
+        count = 0
+        try:
+            for offset, obj in results_iter:
+                count += 1
+                if checkpoint:
+                    checkpoint.record(offset)
+
+                if obj is SKIPPED:
+                    skipped += 1
+                elif isinstance(obj, django.db.utils.IntegrityError):
+                    duplicates += 1
+                elif isinstance(obj, ValueError):
+                    # TODO(stephenfin): Perhaps we should store the broken
+                    # patch somewhere for future reference?
+                    errors += 1
+                elif obj:
                     results[type(obj)] += 1
                 else:
                     dropped += 1
-            except django.db.utils.IntegrityError:
-                duplicates += 1
-            except ValueError:
-                # TODO(stephenfin): Perhaps we should store the broken patch
-                # somewhere for future reference?
-                errors += 1
 
-            if (i % 10) == 0:
-                self.stdout.write('%06d/%06d\r' % (i, count), ending='')
-                self.stdout.flush()
+                if (count % 10) == 0:
+                    progress = reader.progress
+                    if progress is not None:
+                        self.stdout.write('%06d (%5.1f%%)\r' % (
+                            count, progress * 100), ending='')
+                    else:
+                        self.stdout.write('%06d\r' % count, ending='')
+                    self.stdout.flush()
+        finally:
+            if checkpoint:
+                checkpoint.close()
+        elapsed = time.time() - start
 
         self.stdout.write(
             'Processed %(total)d messages -->\n'
@@ -119,16 +452,20 @@ class Command(BaseCommand):
             '  %(patches)4d patches\n'
             '  %(comments)4d comments\n'
             '  %(duplicates)4d duplicates\n'
+            '  %(skipped)4d known duplicates\n'
             '  %(dropped)4d dropped\n'
             '  %(errors)4d errors\n'
-            'Total: %(new)s new entries' % {
+            'Total: %(new)s new entries\n'
+            'Throughput: %(rate).1f mails/sec' % {
                 'total': count,
                 'covers': results[models.CoverLetter],
                 'patches': results[models.Patch],
                 'comments': results[models.Comment],
                 'duplicates': duplicates,
+                'skipped': skipped,
                 'dropped': dropped,
                 'errors': errors,
-                'new': count - duplicates - dropped - errors,
+                'new': count - duplicates - skipped - dropped - errors,
+                'rate': count / elapsed if elapsed else 0.0,
             })
-        mbox.close()
+        reader.close()
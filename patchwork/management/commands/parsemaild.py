@@ -0,0 +1,422 @@
+# Patchwork - automated patch tracking system
+#
+# This file is part of the Patchwork package.
+#
+# Patchwork is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Patchwork is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Patchwork; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+import logging
+from optparse import make_option
+import os
+import signal
+import socket
+import stat
+import threading
+
+import django
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.db import connections
+from django.utils.six.moves import queue
+from django.utils.six.moves import socketserver
+
+from patchwork.archive import message_from_bytes
+from patchwork.parser import parse_mail
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SOCKET = '/run/patchwork/parsemaild.sock'
+
+STATUS_OK = 'OK'
+STATUS_DROPPED = 'DROPPED'
+STATUS_ERROR = 'ERROR'
+STATUS_BUSY = 'BUSY'
+
+
+class _Job(object):
+    """A mail waiting to be parsed."""
+
+    def __init__(self, data):
+        self.data = data
+        self.status = None
+        self.done = threading.Event()
+
+
+class MailServer(object):
+    """Accept mails from clients and queue them for parsing.
+
+    Connections are handled by listener threads, which never touch the
+    database. Mails are placed on a bounded queue and parsed, one at a
+    time and in order of arrival, by whichever thread calls
+    :meth:`process`. If the queue stays full for longer than the
+    timeout, clients are told to try again later.
+
+    Args:
+        list_id (str): Mailing list ID to use for all mails. If not
+            supplied, this is extracted from the mail headers.
+        queue_size (int): Number of mails that can be waiting to be
+            parsed before clients must wait.
+        timeout (float): Number of seconds a client will wait for a
+            place in the queue before being told to try again later.
+    """
+
+    def __init__(self, list_id=None, queue_size=100, timeout=10):
+        self.list_id = list_id
+        self.timeout = timeout
+        self.queue = queue.Queue(queue_size)
+        self._servers = []
+        self._threads = []
+
+    def add_unix_listener(self, path, handler, mode=None):
+        """Listen on a UNIX socket, replacing any stale socket file."""
+        if os.path.exists(path):
+            if not stat.S_ISSOCK(os.stat(path).st_mode):
+                raise ValueError('%s exists and is not a socket' % path)
+            os.unlink(path)
+
+        server = _UnixServer(path, handler)
+        if mode is not None:
+            os.chmod(path, mode)
+        self._add_listener(server)
+
+    def add_tcp_listener(self, address, handler):
+        """Listen on a TCP socket."""
+        self._add_listener(_TCPServer(address, handler))
+
+    def _add_listener(self, server):
+        server.mail_server = self
+        self._servers.append(server)
+
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self._threads.append(thread)
+
+    def shutdown(self):
+        """Stop accepting connections."""
+        for server in self._servers:
+            server.shutdown()
+            server.server_close()
+            if server.address_family == getattr(socket, 'AF_UNIX', None):
+                try:
+                    os.unlink(server.server_address)
+                except OSError:
+                    pass
+
+        for thread in self._threads:
+            thread.join()
+
+        self._servers = []
+        self._threads = []
+
+    def submit(self, data):
+        """Queue a mail and wait for it to be parsed.
+
+        This is called from the listener threads.
+
+        Returns:
+            One of the ``STATUS_*`` values
+        """
+        job = _Job(data)
+
+        try:
+            self.queue.put(job, timeout=self.timeout)
+        except queue.Full:
+            logger.warning('Queue full, deferring mail')
+            return STATUS_BUSY
+
+        job.done.wait()
+        return job.status
+
+    def process(self, timeout=None):
+        """Parse the next queued mail.
+
+        Args:
+            timeout (float): Number of seconds to wait for a mail.
+
+        Returns:
+            True if a mail was parsed, else False
+        """
+        try:
+            job = self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return False
+
+        try:
+            job.status = self._parse(job.data)
+        finally:
+            job.done.set()
+
+        return True
+
+    def _parse(self, data):
+        # keep the connection open between mails, unlike the request cycle,
+        # but discard it if it has broken in the meantime
+        for connection in connections.all():
+            if connection.connection is not None and \
+                    not connection.is_usable():
+                connection.close()
+
+        try:
+            mail = message_from_bytes(data)
+        except AttributeError:
+            logger.warning('Broken email ignored')
+            return STATUS_DROPPED
+
+        try:
+            result = parse_mail(mail, self.list_id)
+        except Exception:
+            logger.exception('Error when parsing incoming email',
+                             extra={'mail': mail.as_string()})
+            return STATUS_ERROR
+
+        if not result:
+            logger.warning('Failed to parse mail')
+            return STATUS_DROPPED
+
+        return STATUS_OK
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class _TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class SocketHandler(socketserver.StreamRequestHandler):
+    """Handle a mail sent using the 'parsemaild-client' protocol.
+
+    The client sends the raw mail and closes its side of the connection,
+    then the server replies with a single status line.
+    """
+
+    def handle(self):
+        data = self.rfile.read()
+        if not data:
+            return
+
+        status = self.server.mail_server.submit(data)
+        self.wfile.write(('%s\n' % status).encode('ascii'))
+
+
+class LMTPHandler(socketserver.StreamRequestHandler):
+    """Handle mails delivered by a mail server using LMTP (RFC 2033).
+
+    Mails that fail to parse are still accepted, as 'parsemail' does, so
+    that senders don't receive bounces. Mails are only deferred if the
+    queue is full.
+    """
+
+    max_line = 65536
+
+    def _reply(self, *lines):
+        for line in lines:
+            self.wfile.write(line.encode('ascii') + b'\r\n')
+        self.wfile.flush()
+
+    def _read_data(self):
+        lines = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return None
+            if line in (b'.\r\n', b'.\n'):
+                break
+            if line.startswith(b'.'):
+                line = line[1:]
+            if line.endswith(b'\r\n'):
+                line = line[:-2] + b'\n'
+            lines.append(line)
+
+        return b''.join(lines)
+
+    def handle(self):
+        hostname = socket.getfqdn()
+        sender = None
+        recipients = []
+
+        self._reply('220 %s LMTP Patchwork ready' % hostname)
+
+        while True:
+            line = self.rfile.readline(self.max_line)
+            if not line:
+                return
+
+            line = line.decode('ascii', 'replace').strip()
+            command, _, argument = line.partition(' ')
+            command = command.upper()
+
+            if command == 'LHLO':
+                self._reply('250-%s' % hostname, '250 8BITMIME')
+            elif command == 'MAIL':
+                sender = argument
+                recipients = []
+                self._reply('250 2.1.0 OK')
+            elif command == 'RCPT':
+                if sender is None:
+                    self._reply('503 5.5.1 Need MAIL command')
+                    continue
+                recipients.append(argument)
+                self._reply('250 2.1.5 OK')
+            elif command == 'DATA':
+                if not recipients:
+                    self._reply('503 5.5.1 Need RCPT command')
+                    continue
+
+                self._reply('354 Start mail input; end with <CRLF>.<CRLF>')
+                data = self._read_data()
+                if data is None:
+                    return
+
+                status = self.server.mail_server.submit(data)
+                if status == STATUS_BUSY:
+                    reply = '451 4.3.0 Too busy, try again later'
+                else:
+                    reply = '250 2.0.0 OK'
+
+                # LMTP requires a reply for each recipient
+                self._reply(*[reply] * len(recipients))
+                sender = None
+                recipients = []
+            elif command == 'RSET':
+                sender = None
+                recipients = []
+                self._reply('250 2.0.0 OK')
+            elif command == 'NOOP':
+                self._reply('250 2.0.0 OK')
+            elif command == 'QUIT':
+                self._reply('221 2.0.0 Bye')
+                return
+            else:
+                self._reply('500 5.5.1 Unknown command')
+
+
+def _parse_address(address):
+    """Parse a 'host:port' address, or a path to a UNIX socket."""
+    if '/' in address:
+        return address
+
+    host, _, port = address.rpartition(':')
+    try:
+        return (host or 'localhost', int(port))
+    except ValueError:
+        raise CommandError('Invalid address: %s' % address)
+
+
+class Command(BaseCommand):
+    help = 'Run a server which accepts mails and stores any patches/comments.'
+
+    if django.VERSION < (1, 8):
+        option_list = BaseCommand.option_list + (
+            make_option(
+                '--socket',
+                help='path of a UNIX socket to accept mails on, for use '
+                'with parsemaild-client. Defaults to %s, unless --lmtp '
+                'is supplied.' % DEFAULT_SOCKET),
+            make_option(
+                '--socket-mode', default='660',
+                help='permissions of the UNIX sockets, in octal.'),
+            make_option(
+                '--lmtp',
+                help='address to accept mails on using LMTP. This is either '
+                'a host:port pair or a path to a UNIX socket.'),
+            make_option(
+                '--list-id',
+                help='mailing list ID. If not supplied, this will be '
+                'extracted from the mail headers.'),
+            make_option(
+                '--queue-size', type='int', default=100,
+                help='number of mails that can be waiting to be parsed.'),
+            make_option(
+                '--timeout', type='float', default=10,
+                help='number of seconds to wait for space in the queue '
+                'before asking clients to try again later.'),
+        )
+    else:
+        def add_arguments(self, parser):
+            parser.add_argument(
+                '--socket',
+                help='path of a UNIX socket to accept mails on, for use '
+                'with parsemaild-client. Defaults to %s, unless --lmtp '
+                'is supplied.' % DEFAULT_SOCKET)
+            parser.add_argument(
+                '--socket-mode', default='660',
+                help='permissions of the UNIX sockets, in octal.')
+            parser.add_argument(
+                '--lmtp',
+                help='address to accept mails on using LMTP. This is either '
+                'a host:port pair or a path to a UNIX socket.')
+            parser.add_argument(
+                '--list-id',
+                help='mailing list ID. If not supplied, this will be '
+                'extracted from the mail headers.')
+            parser.add_argument(
+                '--queue-size', type=int, default=100,
+                help='number of mails that can be waiting to be parsed.')
+            parser.add_argument(
+                '--timeout', type=float, default=10,
+                help='number of seconds to wait for space in the queue '
+                'before asking clients to try again later.')
+
+    def handle(self, *args, **options):
+        try:
+            mode = int(options['socket_mode'], 8)
+        except ValueError:
+            raise CommandError('Invalid socket mode: %s' %
+                               options['socket_mode'])
+
+        server = MailServer(options['list_id'], options['queue_size'],
+                            options['timeout'])
+
+        socket_path = options['socket']
+        if not socket_path and not options['lmtp']:
+            socket_path = DEFAULT_SOCKET
+
+        try:
+            if socket_path:
+                server.add_unix_listener(socket_path, SocketHandler, mode)
+                logger.info('Listening on %s', socket_path)
+
+            if options['lmtp']:
+                address = _parse_address(options['lmtp'])
+                if isinstance(address, tuple):
+                    server.add_tcp_listener(address, LMTPHandler)
+                else:
+                    server.add_unix_listener(address, LMTPHandler, mode)
+                logger.info('Listening for LMTP on %s', options['lmtp'])
+        except (EnvironmentError, ValueError) as exc:
+            server.shutdown()
+            raise CommandError('Failed to listen: %s' % exc)
+
+        stopping = threading.Event()
+
+        def stop(signum, frame):
+            logger.info('Stopping')
+            stopping.set()
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        try:
+            while not stopping.is_set():
+                server.process(timeout=1)
+        finally:
+            server.shutdown()
+
+            # finish the mails already accepted
+            while server.process(timeout=0):
+                pass
@@ -20,29 +20,130 @@
 # along with Patchwork; if not, write to the Free Software
 # Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 
+from collections import deque
+import multiprocessing
+from optparse import make_option
+import time
+
+import django
 from django.core.management.base import BaseCommand
+from django.db import transaction
 
+from patchwork.db import bulk_update
+from patchwork.hasher import hash_diff
 from patchwork.models import Patch
 
 
+def _hash_rows(rows):
+    """Hash the diffs of a chunk of patches.
+
+    Returns:
+        A list of ``(patch ID, hash)`` tuples for the patches whose hash
+        has changed
+    """
+    result = []
+    for patch_id, diff, old_hash in rows:
+        new_hash = hash_diff(diff) if diff is not None else None
+        if new_hash != old_hash:
+            result.append((patch_id, new_hash))
+    return result
+
+
 class Command(BaseCommand):
     help = 'Update the hashes on existing patches'
     args = '[<patch_id>...]'
 
+    if django.VERSION < (1, 8):
+        option_list = BaseCommand.option_list + (
+            make_option(
+                '--jobs', type='int', default=1,
+                help='number of processes to use for hashing diffs.'),
+            make_option(
+                '--chunk-size', type='int', default=1000,
+                help='number of patches to load and update at once.'),
+        )
+    else:
+        def add_arguments(self, parser):
+            parser.add_argument(
+                'args', metavar='patch_id', nargs='*',
+                help='a patch ID number. If not supplied, all patches will '
+                'be updated.')
+            parser.add_argument(
+                '--jobs', type=int, default=1,
+                help='number of processes to use for hashing diffs.')
+            parser.add_argument(
+                '--chunk-size', type=int, default=1000,
+                help='number of patches to load and update at once.')
+
+    def _chunks(self, query, chunk_size):
+        """Load the patches in chunks, ordered by ID.
+
+        Only the fields needed to compute the hash are loaded, and each
+        chunk is fetched by ID rather than with an OFFSET, so the cost
+        of fetching a chunk doesn't grow as we progress.
+        """
+        query = query.order_by('id').values_list('id', 'diff', 'hash')
+        last_id = 0
+
+        while True:
+            rows = list(query.filter(id__gt=last_id)[:chunk_size].iterator())
+            if not rows:
+                return
+            yield rows
+            last_id = rows[-1][0]
+
+    def _write(self, hashes):
+        # write the hashes directly, as saving each patch would send
+        # signals and refresh its tag counts
+        with transaction.atomic():
+            bulk_update(Patch, 'hash', hashes)
+        return len(hashes)
+
     def handle(self, *args, **options):
+        jobs = options.get('jobs') or 1
+        chunk_size = options.get('chunk_size') or 1000
         query = Patch.objects
 
         if args:
-            query = query.filter(id_in=args)
+            query = query.filter(id__in=args)
         else:
             query = query.all()
 
         count = query.count()
+        processed = 0
+        changed = 0
+        start_time = time.time()
+
+        pool = multiprocessing.Pool(jobs) if jobs > 1 else None
+        # hashed chunks waiting to be written, in order
+        pending = deque()
 
-        for i, patch in enumerate(query.iterator()):
-            patch.hash = None
-            patch.save()
-            if (i % 10) == 0:
-                self.stdout.write('%06d/%06d\r' % (i, count), ending='')
+        try:
+            for rows in self._chunks(query, chunk_size):
+                processed += len(rows)
+                if pool is None:
+                    changed += self._write(_hash_rows(rows))
+                else:
+                    pending.append(pool.apply_async(_hash_rows, (rows,)))
+                    # bound the number of chunks held in memory
+                    if len(pending) > jobs * 2:
+                        changed += self._write(pending.popleft().get())
+
+                elapsed = time.time() - start_time
+                self.stdout.write('%06d/%06d (%d patches/s)\r' % (
+                    processed, count, processed / max(elapsed, 0.001)),
+                    ending='')
                 self.stdout.flush()
-        self.stdout.write('\ndone')
+
+            while pending:
+                changed += self._write(pending.popleft().get())
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+
+        elapsed = time.time() - start_time
+        self.stdout.write('\nRehashed %d patches (%d changed) in %.1f '
+                          'seconds (%d patches/s)' % (
+                              processed, changed, elapsed,
+                              processed / max(elapsed, 0.001)))
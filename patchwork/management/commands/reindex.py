@@ -0,0 +1,82 @@
+# Patchwork - automated patch tracking system
+#
+# This file is part of the Patchwork package.
+#
+# Patchwork is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Patchwork is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Patchwork; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+from optparse import make_option
+import time
+
+import django
+from django.core.management.base import BaseCommand
+
+from patchwork.models import Submission
+from patchwork.search import update_documents
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index of existing submissions'
+    args = '[<submission_id>...]'
+
+    if django.VERSION < (1, 8):
+        option_list = BaseCommand.option_list + (
+            make_option(
+                '--chunk-size', type='int', default=500,
+                help='number of submissions to load and update at once.'),
+        )
+    else:
+        def add_arguments(self, parser):
+            parser.add_argument(
+                'args', metavar='submission_id', nargs='*',
+                help='a patch or cover letter ID number. If not supplied, '
+                'all submissions will be updated.')
+            parser.add_argument(
+                '--chunk-size', type=int, default=500,
+                help='number of submissions to load and update at once.')
+
+    def handle(self, *args, **options):
+        chunk_size = options.get('chunk_size') or 500
+        query = Submission.objects.order_by('id').values_list(
+            'id', flat=True)
+
+        if args:
+            query = query.filter(id__in=args)
+
+        count = query.count()
+        processed = 0
+        start_time = time.time()
+        last_id = 0
+
+        # load the IDs in chunks, rather than with an OFFSET, so the cost
+        # of fetching a chunk doesn't grow as we progress
+        while True:
+            ids = list(query.filter(id__gt=last_id)[:chunk_size])
+            if not ids:
+                break
+            last_id = ids[-1]
+
+            processed += update_documents(ids, chunk_size=chunk_size)
+
+            elapsed = time.time() - start_time
+            self.stdout.write('%06d/%06d (%d submissions/s)\r' % (
+                processed, count, processed / max(elapsed, 0.001)),
+                ending='')
+            self.stdout.flush()
+
+        elapsed = time.time() - start_time
+        self.stdout.write('\nReindexed %d submissions in %.1f seconds '
+                          '(%d submissions/s)' % (
+                              processed, elapsed,
+                              processed / max(elapsed, 0.001)))
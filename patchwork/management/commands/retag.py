@@ -17,15 +17,42 @@
 # along with Patchwork; if not, write to the Free Software
 # Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 
+from optparse import make_option
+import time
+
+import django
 from django.core.management.base import BaseCommand
 
 from patchwork.models import Patch
+from patchwork.tags import retag_patches
 
 
 class Command(BaseCommand):
     help = 'Update the tag (Ack/Review/Test) counts on existing patches'
     args = '[<patch_id>...]'
 
+    if django.VERSION < (1, 8):
+        option_list = BaseCommand.option_list + (
+            make_option(
+                '--jobs', type='int', default=1,
+                help='number of processes to use for counting tags.'),
+            make_option(
+                '--chunk-size', type='int', default=500,
+                help='number of patches to load and update at once.'),
+        )
+    else:
+        def add_arguments(self, parser):
+            parser.add_argument(
+                'args', metavar='patch_id', nargs='*',
+                help='a patch ID number. If not supplied, all patches will '
+                'be updated.')
+            parser.add_argument(
+                '--jobs', type=int, default=1,
+                help='number of processes to use for counting tags.')
+            parser.add_argument(
+                '--chunk-size', type=int, default=500,
+                help='number of patches to load and update at once.')
+
     def handle(self, *args, **options):
         query = Patch.objects
 
@@ -34,11 +61,24 @@ class Command(BaseCommand):
         else:
             query = query.all()
 
-        count = query.count()
+        # patches in projects not using tags are skipped
+        count = query.filter(project__use_tags=True).count()
+        start_time = time.time()
+        processed = [0]
+
+        def progress(chunk):
+            processed[0] += chunk
+            elapsed = time.time() - start_time
+            self.stdout.write('%06d/%06d (%d patches/s)\r' % (
+                processed[0], count, processed[0] / max(elapsed, 0.001)),
+                ending='')
+            self.stdout.flush()
+
+        retag_patches(query, chunk_size=options.get('chunk_size') or 500,
+                      jobs=options.get('jobs') or 1, progress=progress)
 
-        for i, patch in enumerate(query.iterator()):
-            patch.refresh_tag_counts()
-            if (i % 10) == 0:
-                self.stdout.write('%06d/%06d\r' % (i, count), ending='')
-                self.stdout.flush()
-        self.stdout.write('\ndone')
+        elapsed = time.time() - start_time
+        self.stdout.write('\nRetagged %d patches in %.1f seconds '
+                          '(%d patches/s)' % (
+                              processed[0], elapsed,
+                              processed[0] / max(elapsed, 0.001)))
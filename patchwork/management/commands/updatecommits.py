@@ -0,0 +1,166 @@
+# Patchwork - automated patch tracking system
+#
+# This file is part of the Patchwork package.
+#
+# Patchwork is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Patchwork is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Patchwork; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+from optparse import make_option
+import subprocess
+
+import django
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.db import transaction
+
+from patchwork.hasher import hash_commits
+from patchwork.models import Patch
+from patchwork.models import Project
+from patchwork.models import State
+
+# number of hashes to look up per query, to stay within the limits on
+# query parameters of some databases
+CHUNK_SIZE = 500
+
+
+def hash_revisions(repo, revspec):
+    """Hash the commits in a Git repository.
+
+    The diffs of all commits are generated by a single 'git log'
+    process and hashed as they are read.
+
+    Args:
+        repo (str): Path to the Git repository.
+        revspec (list): Revisions to hash, as accepted by 'git log'.
+
+    Returns:
+        A list of ``(commit, hash)`` tuples, oldest commit first
+
+    Raises:
+        CommandError: 'git log' failed.
+    """
+    cmd = ['git', 'log', '--reverse', '--no-color', '--no-ext-diff', '-p',
+           '-m', '--format=commit %H'] + list(revspec) + ['--']
+
+    try:
+        proc = subprocess.Popen(cmd, cwd=repo, stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE)
+    except OSError as exc:
+        raise CommandError('Failed to run git: %s' % exc)
+
+    commits = list(hash_commits(proc.stdout))
+    stderr = proc.communicate()[1]
+
+    if proc.returncode:
+        raise CommandError('git log failed: %s' %
+                           stderr.decode('utf-8', 'replace').strip())
+
+    return commits
+
+
+class Command(BaseCommand):
+    help = 'Update the state of patches merged into a Git repository.'
+    args = '<revspec>...'
+
+    if django.VERSION < (1, 8):
+        option_list = BaseCommand.option_list + (
+            make_option(
+                '--repo', default='.',
+                help='path to the Git repository. Defaults to the current '
+                'directory.'),
+            make_option(
+                '--project',
+                help='link name of the project the patches belong to.'),
+            make_option(
+                '--state', default='Accepted',
+                help='name of the state to set on the patches. Defaults to '
+                'Accepted.'),
+        )
+    else:
+        def add_arguments(self, parser):
+            parser.add_argument(
+                'revspec',
+                nargs='+',
+                help="commits to update patches for, as accepted by 'git "
+                "log', e.g. 'v1.0..master'.")
+            parser.add_argument(
+                '--repo', default='.',
+                help='path to the Git repository. Defaults to the current '
+                'directory.')
+            parser.add_argument(
+                '--project',
+                help='link name of the project the patches belong to.')
+            parser.add_argument(
+                '--state', default='Accepted',
+                help='name of the state to set on the patches. Defaults to '
+                'Accepted.')
+
+    def handle(self, *args, **options):
+        verbosity = int(options.get('verbosity', 1))
+        revspec = args or options.get('revspec')
+        if not revspec:
+            raise CommandError('No revisions supplied')
+
+        if not options.get('project'):
+            raise CommandError('--project is required')
+
+        try:
+            project = Project.objects.get(linkname=options['project'])
+        except Project.DoesNotExist:
+            raise CommandError('Unknown project: %s' % options['project'])
+
+        try:
+            state = State.objects.get(name__iexact=options['state'])
+        except State.DoesNotExist:
+            raise CommandError('Unknown state: %s' % options['state'])
+
+        # if a diff was applied more than once, e.g. when a merge brings in
+        # a single commit, the oldest commit is used
+        commits = {}
+        for commit, hash_ in hash_revisions(options['repo'], revspec):
+            commits.setdefault(hash_, commit)
+        hashes = list(commits)
+
+        patches = []
+        for i in range(0, len(hashes), CHUNK_SIZE):
+            patches.extend(Patch.objects.filter(
+                project=project, hash__in=hashes[i:i + CHUNK_SIZE]))
+
+        matched = set()
+        updated = 0
+
+        with transaction.atomic():
+            for patch in sorted(patches, key=lambda patch: patch.id):
+                commit = commits[patch.hash]
+                matched.add(patch.hash)
+                if patch.state_id == state.id and patch.commit_ref == commit:
+                    continue
+
+                patch.state = state
+                patch.commit_ref = commit
+                patch.save()
+                updated += 1
+
+                if verbosity > 1:
+                    self.stdout.write('Patch #%d updated using commit %s' %
+                                      (patch.id, commit))
+
+        if verbosity > 1:
+            for hash_, commit in commits.items():
+                if hash_ not in matched:
+                    self.stdout.write('No patch found for commit %s' % commit)
+
+        self.stdout.write('%d patch(es) updated to state %s, %d commit(s) '
+                          'without a patch' % (updated, state.name,
+                                               len(commits) - len(matched)))
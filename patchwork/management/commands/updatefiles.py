@@ -0,0 +1,114 @@
+# Patchwork - automated patch tracking system
+#
+# This file is part of the Patchwork package.
+#
+# Patchwork is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Patchwork is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Patchwork; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+from optparse import make_option
+import time
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from patchwork.db import bulk_update
+from patchwork.models import Patch
+from patchwork.models import PatchFile
+
+
+class Command(BaseCommand):
+    help = ('Update the index of files changed by existing patches, and '
+            'their diffstats')
+    args = '[<patch_id>...]'
+
+    if django.VERSION < (1, 8):
+        option_list = BaseCommand.option_list + (
+            make_option(
+                '--chunk-size', type='int', default=500,
+                help='number of patches to load and update at once.'),
+        )
+    else:
+        def add_arguments(self, parser):
+            parser.add_argument(
+                'args', metavar='patch_id', nargs='*',
+                help='a patch ID number. If not supplied, all patches will '
+                'be updated.')
+            parser.add_argument(
+                '--chunk-size', type=int, default=500,
+                help='number of patches to load and update at once.')
+
+    def _chunks(self, query, chunk_size):
+        """Load the diffs of patches in chunks, ordered by ID.
+
+        Each chunk is fetched by ID rather than with an OFFSET, so the
+        cost of fetching a chunk doesn't grow as we progress.
+        """
+        query = query.order_by('id').values_list('id', 'diff')
+        last_id = 0
+
+        while True:
+            rows = list(query.filter(id__gt=last_id)[:chunk_size].iterator())
+            if not rows:
+                return
+            yield rows
+            last_id = rows[-1][0]
+
+    def _write(self, rows):
+        files = [PatchFile(patch_id=patch_id, path=path)
+                 for patch_id, diff in rows
+                 for path in Patch.extract_paths(diff)]
+        stats = [(patch_id, Patch.extract_diffstat(diff))
+                 for patch_id, diff in rows]
+
+        with transaction.atomic():
+            PatchFile.objects.filter(
+                patch__in=[patch_id for patch_id, _ in rows]).delete()
+            PatchFile.objects.bulk_create(files)
+            for index, name in enumerate(('files_changed', 'lines_added',
+                                          'lines_removed')):
+                bulk_update(Patch, name, [(patch_id, stat[index])
+                                          for patch_id, stat in stats])
+
+        return len(files)
+
+    def handle(self, *args, **options):
+        chunk_size = options.get('chunk_size') or 500
+        query = Patch.objects
+
+        if args:
+            query = query.filter(id__in=args)
+        else:
+            query = query.all()
+
+        count = query.count()
+        processed = 0
+        files = 0
+        start_time = time.time()
+
+        for rows in self._chunks(query, chunk_size):
+            processed += len(rows)
+            files += self._write(rows)
+
+            elapsed = time.time() - start_time
+            self.stdout.write('%06d/%06d (%d patches/s)\r' % (
+                processed, count, processed / max(elapsed, 0.001)),
+                ending='')
+            self.stdout.flush()
+
+        elapsed = time.time() - start_time
+        self.stdout.write('\nUpdated %d patches (%d files) in %.1f seconds '
+                          '(%d patches/s)' % (
+                              processed, files, elapsed,
+                              processed / max(elapsed, 0.001)))
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# submissions are read in chunks of this many
+CHUNK_SIZE = 1000
+
+# comments without an entry, where multiple comments have the same msgid
+# the latest wins
+INSERT_COMMENTS = """
+INSERT INTO patchwork_messageindex (project_id, msgid, submission_id)
+SELECT s.project_id, c.msgid, c.submission_id
+  FROM patchwork_comment c
+  INNER JOIN patchwork_submission s ON s.id = c.submission_id
+  WHERE NOT EXISTS (
+      SELECT 1 FROM patchwork_messageindex m
+        WHERE m.project_id = s.project_id AND m.msgid = c.msgid)
+    AND NOT EXISTS (
+      SELECT 1 FROM patchwork_comment c2
+        INNER JOIN patchwork_submission s2 ON s2.id = c2.submission_id
+        WHERE s2.project_id = s.project_id AND c2.msgid = c.msgid
+          AND (c2.date > c.date OR (c2.date = c.date AND c2.id > c.id)))
+"""
+
+# where multiple series reference the same msgid, the first wins
+UPDATE_SERIES = """
+UPDATE patchwork_messageindex SET series_id = (
+    SELECT r.series_id FROM patchwork_seriesreference r
+      INNER JOIN patchwork_series se ON se.id = r.series_id
+      WHERE se.project_id = patchwork_messageindex.project_id
+        AND r.msgid = patchwork_messageindex.msgid
+      ORDER BY r.id LIMIT 1)
+  WHERE msgid IN (SELECT msgid FROM patchwork_seriesreference)
+"""
+
+INSERT_SERIES = """
+INSERT INTO patchwork_messageindex (project_id, msgid, series_id)
+SELECT se.project_id, r.msgid, r.series_id
+  FROM patchwork_seriesreference r
+  INNER JOIN patchwork_series se ON se.id = r.series_id
+  WHERE se.project_id IS NOT NULL
+    AND NOT EXISTS (
+      SELECT 1 FROM patchwork_messageindex m
+        WHERE m.project_id = se.project_id AND m.msgid = r.msgid)
+    AND NOT EXISTS (
+      SELECT 1 FROM patchwork_seriesreference r2
+        INNER JOIN patchwork_series se2 ON se2.id = r2.series_id
+        WHERE se2.project_id = se.project_id AND r2.msgid = r.msgid
+          AND r2.id < r.id)
+"""
+
+
+def populate_message_index(apps, schema_editor):
+    MessageIndex = apps.get_model('patchwork', 'MessageIndex')
+    Submission = apps.get_model('patchwork', 'Submission')
+
+    # submissions take precedence over comments with the same msgid, so
+    # are added first. The msgid of a submission is unique in its project
+    last_id = 0
+    while True:
+        submissions = list(Submission.objects.filter(
+            id__gt=last_id).order_by('id').values_list(
+                'id', 'project', 'msgid')[:CHUNK_SIZE])
+        if not submissions:
+            break
+
+        MessageIndex.objects.bulk_create([
+            MessageIndex(project_id=project_id, msgid=msgid,
+                         submission_id=submission_id)
+            for submission_id, project_id, msgid in submissions])
+        last_id = submissions[-1][0]
+
+    for sql in (INSERT_COMMENTS, UPDATE_SERIES, INSERT_SERIES):
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patchwork', '0019_userprofile_show_ids'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MessageIndex',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('msgid', models.CharField(max_length=255)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='patchwork.Project')),
+                ('series', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='patchwork.Series')),
+                ('submission', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='patchwork.Submission')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='messageindex',
+            unique_together=set([('project', 'msgid')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='submission',
+            index_together=set([('project', 'name')]),
+        ),
+        migrations.RunPython(populate_message_index,
+                             migrations.RunPython.noop),
+    ]
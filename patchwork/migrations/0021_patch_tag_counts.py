@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+import patchwork.fields
+
+
+def populate_tag_counts(apps, schema_editor):
+    Patch = apps.get_model('patchwork', 'Patch')
+    PatchTag = apps.get_model('patchwork', 'PatchTag')
+
+    # patches without tags keep the default, so only those with tags need
+    # to be updated
+    tag_counts = {}
+    for patch_id, tag_id, count in PatchTag.objects.filter(
+            count__gt=0).values_list('patch', 'tag', 'count').iterator():
+        tag_counts.setdefault(patch_id, {})[tag_id] = count
+
+    for patch_id, counts in tag_counts.items():
+        Patch.objects.filter(pk=patch_id).update(tag_counts=counts)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patchwork', '0020_add_message_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patch',
+            name='tag_counts',
+            field=patchwork.fields.TagCountsField(default=dict, editable=False),
+        ),
+        migrations.RunPython(populate_tag_counts,
+                             migrations.RunPython.noop),
+    ]
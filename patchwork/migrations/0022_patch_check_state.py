@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from collections import Counter
+
+from django.db import migrations, models
+import patchwork.fields
+
+# these match Check.STATE_*
+STATE_PENDING = 0
+STATE_SUCCESS = 1
+STATE_WARNING = 2
+STATE_FAIL = 3
+
+
+def combine_states(states):
+    if not states:
+        return STATE_PENDING
+
+    for state in [STATE_FAIL, STATE_WARNING, STATE_PENDING]:
+        if state in states:
+            return state
+
+    return STATE_SUCCESS
+
+
+def populate_check_state(apps, schema_editor):
+    Check = apps.get_model('patchwork', 'Check')
+    Patch = apps.get_model('patchwork', 'Patch')
+
+    # the newest check for each patch, user and context, with ties going
+    # to the most recently created check
+    latest = {}
+    for check_id, patch_id, user_id, context, state in Check.objects.order_by(
+            'date', 'id').values_list('id', 'patch', 'user', 'context',
+                                      'state').iterator():
+        latest[(patch_id, user_id, context)] = (check_id, state)
+
+    ids = [check_id for check_id, _ in latest.values()]
+    for i in range(0, len(ids), 500):
+        Check.objects.filter(id__in=ids[i:i + 500]).update(latest=True)
+
+    states = {}
+    for (patch_id, _, _), (_, state) in latest.items():
+        states.setdefault(patch_id, []).append(state)
+
+    for patch_id, patch_states in states.items():
+        Patch.objects.filter(pk=patch_id).update(
+            check_state=combine_states(patch_states),
+            check_counts=dict(Counter(patch_states)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patchwork', '0021_patch_tag_counts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='check',
+            name='latest',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='patch',
+            name='check_counts',
+            field=patchwork.fields.CountsField(default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='patch',
+            name='check_state',
+            field=models.SmallIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.RunPython(populate_check_state,
+                             migrations.RunPython.noop),
+    ]
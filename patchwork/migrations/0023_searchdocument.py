@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.utils import OperationalError
+import django.db.models.deletion
+
+# the documents of existing submissions are built by the 'reindex'
+# command, rather than here, so that the migration doesn't hold a
+# transaction open while reading every submission
+
+POSTGRESQL_INDEX = [
+    'ALTER TABLE patchwork_searchdocument ADD COLUMN vector tsvector',
+    """CREATE INDEX patchwork_searchdocument_vector_idx
+ON patchwork_searchdocument USING GIN (vector)""",
+]
+
+POSTGRESQL_DROP_INDEX = [
+    'ALTER TABLE patchwork_searchdocument DROP COLUMN vector',
+]
+
+SQLITE_INDEX = """CREATE VIRTUAL TABLE patchwork_searchdocument_fts USING fts5(
+    title, body, tokenize='porter unicode61')"""
+
+SQLITE_DROP_INDEX = 'DROP TABLE IF EXISTS patchwork_searchdocument_fts'
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        for sql in POSTGRESQL_INDEX:
+            schema_editor.execute(sql)
+    elif vendor == 'sqlite':
+        try:
+            schema_editor.execute(SQLITE_INDEX)
+        except OperationalError:
+            # FTS5 isn't available, so searches will fall back to
+            # matching the subject
+            pass
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        for sql in POSTGRESQL_DROP_INDEX:
+            schema_editor.execute(sql)
+    elif vendor == 'sqlite':
+        schema_editor.execute(SQLITE_DROP_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patchwork', '0022_patch_check_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('submission', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='patchwork.Submission')),
+                ('title', models.TextField()),
+            ],
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patchwork', '0023_searchdocument'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PatchFile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(db_index=True, max_length=255)),
+                ('patch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='patchwork.Patch')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='patchfile',
+            unique_together=set([('patch', 'path')]),
+        ),
+    ]
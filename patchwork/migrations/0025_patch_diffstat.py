@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patchwork', '0024_patchfile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patch',
+            name='files_changed',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='patch',
+            name='lines_added',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='patch',
+            name='lines_removed',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+import patchwork.fields
+
+# the columns which are changed to hold binary data
+COLUMNS = [
+    ('patchwork_comment', 'content'),
+    ('patchwork_comment', 'headers'),
+    ('patchwork_submission', 'content'),
+    ('patchwork_submission', 'headers'),
+    ('patchwork_patch', 'diff'),
+]
+
+# PostgreSQL casts text to bytea by parsing escape sequences in it, which
+# mangles text containing backslashes, so the columns are converted before
+# their fields are altered. In reverse, they are converted back to text
+# before the fields are altered, for the same reason
+POSTGRESQL_TO_BINARY = ("ALTER TABLE %(table)s ALTER COLUMN %(column)s "
+                        "TYPE bytea USING convert_to(%(column)s, 'UTF8')")
+POSTGRESQL_TO_TEXT = ("ALTER TABLE %(table)s ALTER COLUMN %(column)s "
+                      "TYPE text USING convert_from(%(column)s, 'UTF8')")
+
+
+def _convert_columns(schema_editor, sql):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    for table, column in COLUMNS:
+        schema_editor.execute(sql % {'table': table, 'column': column})
+
+
+def noop(apps, schema_editor):
+    pass
+
+
+def convert_to_binary(apps, schema_editor):
+    _convert_columns(schema_editor, POSTGRESQL_TO_BINARY)
+
+
+def convert_to_text(apps, schema_editor):
+    # compressed values can't be converted back to text
+    qn = schema_editor.connection.ops.quote_name
+    with schema_editor.connection.cursor() as cursor:
+        for table, column in COLUMNS:
+            cursor.execute(
+                'SELECT COUNT(*) FROM %s WHERE SUBSTR(%s, 1, 1) = %%s' % (
+                    qn(table), qn(column)), [
+                    schema_editor.connection.Database.Binary(
+                        patchwork.fields.COMPRESSION_MARKER)])
+            if cursor.fetchone()[0]:
+                raise RuntimeError(
+                    'Column %s.%s holds compressed values, which must be '
+                    'decompressed first' % (table, column))
+
+    _convert_columns(schema_editor, POSTGRESQL_TO_TEXT)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patchwork', '0025_patch_diffstat'),
+    ]
+
+    # existing values are compressed using the compresstext management
+    # command, rather than here
+    operations = [
+        migrations.RunPython(convert_to_binary, noop),
+        migrations.AlterField(
+            model_name='comment',
+            name='content',
+            field=patchwork.fields.CompressedTextField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='comment',
+            name='headers',
+            field=patchwork.fields.CompressedTextField(blank=True),
+        ),
+        migrations.AlterField(
+            model_name='submission',
+            name='content',
+            field=patchwork.fields.CompressedTextField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='submission',
+            name='headers',
+            field=patchwork.fields.CompressedTextField(blank=True),
+        ),
+        migrations.AlterField(
+            model_name='patch',
+            name='diff',
+            field=patchwork.fields.CompressedTextField(blank=True, null=True),
+        ),
+        migrations.RunPython(noop, convert_to_text),
+    ]
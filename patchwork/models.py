@@ -29,12 +29,16 @@ import re
 import django
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.db import IntegrityError
 from django.db import models
+from django.db import transaction
 from django.utils.encoding import python_2_unicode_compatible
 from django.utils.functional import cached_property
 
 from patchwork.compat import is_authenticated
 from patchwork.fields import HashField
+from patchwork.fields import CountsField
+from patchwork.fields import CompressedTextField
 from patchwork.hasher import hash_diff
 
 if settings.ENABLE_REST_API:
@@ -91,9 +95,12 @@ class Project(models.Model):
 
     @cached_property
     def tags(self):
+        # imported here as the lookup cache depends on these models
+        from patchwork.lookups import get_tags
+
         if not self.use_tags:
             return []
-        return list(Tag.objects.all())
+        return list(get_tags())
 
     def __str__(self):
         return self.name
@@ -230,10 +237,6 @@ class Tag(models.Model):
         max_length=2, unique=True, help_text='Short (one-or-two letter)'
         ' abbreviation for the tag, used in table column headers')
 
-    @property
-    def attr_name(self):
-        return 'tag_%d_count' % self.id
-
     def __str__(self):
         return self.name
 
@@ -250,40 +253,142 @@ class PatchTag(models.Model):
         unique_together = [('patch', 'tag')]
 
 
+def normalize_path(path):
+    """Normalise the path of a file, as stored for the files of patches.
+
+    Empty and ``.`` components are removed, along with any leading and
+    trailing slashes.
+    """
+    return '/'.join(part for part in path.strip().split('/')
+                    if part and part != '.')
+
+
+class PatchFileManager(models.Manager):
+
+    def matching(self, path):
+        """Find the entries for a file, or any file in a directory.
+
+        Directories are matched using a prefix of the indexed path, so
+        the index can be used by databases supporting this for ``LIKE``.
+
+        Args:
+            path (str): The path of the file or directory.
+        """
+        path = normalize_path(path)
+        return self.filter(models.Q(path=path) |
+                           models.Q(path__startswith=path + '/'))
+
+
+class PatchFile(models.Model):
+    """A file changed by a patch.
+
+    This is an index of the files changed by the diff of each patch,
+    allowing patches changing a file or directory to be found without
+    scanning their diffs. Entries are kept up to date when patches are
+    saved.
+    """
+
+    patch = models.ForeignKey('Patch', on_delete=models.CASCADE)
+    path = models.CharField(max_length=255, db_index=True)
+
+    objects = PatchFileManager()
+
+    class Meta:
+        unique_together = [('patch', 'path')]
+
+
 def get_default_initial_patch_state():
     return State.objects.get(ordering=0)
 
 
+def parse_lines_range(value):
+    """Parse a range of the number of lines changed by patches.
+
+    The range is a number, for at least that many lines, two numbers
+    separated by a hyphen, like ``10-100``, or a number preceded by a
+    hyphen, for at most that many lines.
+
+    Returns:
+        A tuple of the minimum and maximum, either of which may be None,
+        or None if the value isn't a valid range.
+    """
+    minimum, _, maximum = value.strip().partition('-')
+    try:
+        minimum = int(minimum) if minimum.strip() else None
+        maximum = int(maximum) if maximum.strip() else None
+    except ValueError:
+        return None
+
+    if minimum is None and maximum is None:
+        return None
+    if any(x is not None and x < 0 for x in (minimum, maximum)):
+        return None
+    return minimum, maximum
+
+
+LINES_CHANGED_SQL = (
+    'patchwork_patch.lines_added + patchwork_patch.lines_removed')
+
+
 class PatchQuerySet(models.query.QuerySet):
 
     def with_tag_counts(self, project=None):
         if project and not project.use_tags:
             return self
 
-        # We need the project's use_tags field loaded for Project.tags().
+        # The counts themselves are stored on the patch, in tag_counts, but
+        # we need the project's use_tags field loaded for Project.tags().
         # Using prefetch_related means we'll share the one instance of
         # Project, and share the project.tags cache between all patch.project
         # references.
-        qs = self.prefetch_related('project')
-        select = OrderedDict()
-        select_params = []
+        return self.prefetch_related('project')
 
-        # All projects have the same tags, so we're good to go here
-        if project:
-            tags = project.tags
-        else:
-            tags = Tag.objects.all()
+    def with_tag_count(self, tag):
+        """Annotate patches with the count of a single tag.
 
-        for tag in tags:
-            select[tag.attr_name] = (
-                "coalesce("
-                "(SELECT count FROM patchwork_patchtag"
-                " WHERE patchwork_patchtag.patch_id="
-                "patchwork_patch.submission_ptr_id"
-                " AND patchwork_patchtag.tag_id=%s), 0)")
-            select_params.append(tag.id)
+        Filtering by tag can use the indexed ``PatchTag`` table directly,
+        but ordering needs the count of every patch. This adds it, as
+        ``tag_count``, using a subquery for the requested tag only.
+        """
+        return self.extra(select={'tag_count': (
+            "coalesce("
+            "(SELECT count FROM patchwork_patchtag"
+            " WHERE patchwork_patchtag.patch_id="
+            "patchwork_patch.submission_ptr_id"
+            " AND patchwork_patchtag.tag_id=%s), 0)")},
+            select_params=[tag.id])
+
+    def touching(self, path):
+        """Filter patches changing a file, or any file in a directory."""
+        return self.filter(id__in=PatchFile.objects.matching(path).values(
+            'patch'))
+
+    def with_lines_changed(self):
+        """Annotate patches with the number of lines added and removed.
+
+        The total is added as ``lines_changed``. It is null for patches
+        whose diffstat hasn't been recorded.
+        """
+        return self.extra(select={'lines_changed': LINES_CHANGED_SQL})
 
-        return qs.extra(select=select, select_params=select_params)
+    def lines_between(self, minimum=None, maximum=None):
+        """Filter patches by the number of lines added and removed.
+
+        Args:
+            minimum (int): The minimum number of lines changed, if any.
+            maximum (int): The maximum number of lines changed, if any.
+        """
+        where = []
+        params = []
+        if minimum is not None:
+            where.append('%s >= %%s' % LINES_CHANGED_SQL)
+            params.append(minimum)
+        if maximum is not None:
+            where.append('%s <= %%s' % LINES_CHANGED_SQL)
+            params.append(maximum)
+        if not where:
+            return self
+        return self.extra(where=where, params=params)
 
 
 class PatchManager(models.Manager):
@@ -298,6 +403,12 @@ class PatchManager(models.Manager):
     def with_tag_counts(self, project):
         return self.get_queryset().with_tag_counts(project)
 
+    def with_lines_changed(self):
+        return self.get_queryset().with_lines_changed()
+
+    def lines_between(self, minimum=None, maximum=None):
+        return self.get_queryset().lines_between(minimum, maximum)
+
 
 class EmailMixin(models.Model):
     """Mixin for models with an email-origin."""
@@ -305,12 +416,12 @@ class EmailMixin(models.Model):
 
     msgid = models.CharField(max_length=255)
     date = models.DateTimeField(default=datetime.datetime.now)
-    headers = models.TextField(blank=True)
+    headers = CompressedTextField(blank=True)
 
     # content
 
     submitter = models.ForeignKey(Person, on_delete=models.CASCADE)
-    content = models.TextField(null=True, blank=True)
+    content = CompressedTextField(null=True, blank=True)
 
     response_re = re.compile(
         r'^(Tested|Reviewed|Acked|Signed-off|Nacked|Reported)-by: .*$',
@@ -359,6 +470,7 @@ class Submission(FilenameMixin, EmailMixin, models.Model):
     class Meta:
         ordering = ['date']
         unique_together = [('msgid', 'project')]
+        index_together = [('project', 'name')]
 
 
 class SeriesMixin(object):
@@ -391,7 +503,7 @@ class CoverLetter(SeriesMixin, Submission):
 class Patch(SeriesMixin, Submission):
     # patch metadata
 
-    diff = models.TextField(null=True, blank=True)
+    diff = CompressedTextField(null=True, blank=True)
     commit_ref = models.CharField(max_length=255, null=True, blank=True)
     pull_url = models.CharField(max_length=255, null=True, blank=True)
     tags = models.ManyToManyField(Tag, through=PatchTag)
@@ -403,18 +515,139 @@ class Patch(SeriesMixin, Submission):
     state = models.ForeignKey(State, null=True, on_delete=models.CASCADE)
     archived = models.BooleanField(default=False)
     hash = HashField(null=True, blank=True)
+    # a denormalized copy of the counts in PatchTag, so lists of patches can
+    # show the counts without any joins
+    tag_counts = CountsField(default=dict, editable=False)
+    # the combined state of the latest checks, and the number of them in
+    # each state, kept up to date as checks are saved. These are Check.STATE_*
+    # values, defined below
+    check_state = models.SmallIntegerField(default=0, db_index=True,
+                                           editable=False)
+    check_counts = CountsField(default=dict, editable=False)
+    # the number of files and lines changed by the diff, so lists can show,
+    # filter and sort by the size of patches without loading their diffs.
+    # These are null for patches added before they were recorded
+    files_changed = models.PositiveIntegerField(null=True, blank=True,
+                                                editable=False)
+    lines_added = models.PositiveIntegerField(null=True, blank=True,
+                                              editable=False)
+    lines_removed = models.PositiveIntegerField(null=True, blank=True,
+                                                editable=False)
 
     objects = PatchManager()
 
+    # fields whose values are recorded when a patch is loaded, so changes
+    # can be detected without querying for the stored patch
+    tracked_fields = ('state_id', 'delegate_id', 'name', 'content', 'diff')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # NOTE: this is only called by Django >= 1.8. Older versions fall
+        # back to querying for the original values when needed
+        instance = super(Patch, cls).from_db(db, field_names, values)
+        instance._snapshot()
+        return instance
+
+    def _snapshot(self):
+        # deferred fields aren't stored on the instance, so are skipped
+        self._original = dict((name, self.__dict__[name])
+                              for name in self.tracked_fields
+                              if name in self.__dict__)
+
+    def get_original(self, name):
+        """Return the stored value of a field, before any changes.
+
+        The values recorded when the patch was loaded are used where
+        possible. Otherwise, the state and delegate are fetched in a
+        single query, which is then shared by all callers.
+
+        Args:
+            name (str): The attribute name of the field, such as
+                ``state_id``. Only :attr:`tracked_fields` are supported.
+
+        Raises:
+            Patch.DoesNotExist: The patch hasn't been saved.
+        """
+        original = self.__dict__.setdefault('_original', {})
+        if name not in original:
+            if name not in ('state_id', 'delegate_id'):
+                raise ValueError('Unsupported field: %s' % name)
+
+            values = Patch.objects.filter(pk=self.pk).values_list(
+                'state', 'delegate').first()
+            if values is None:
+                raise Patch.DoesNotExist()
+            original['state_id'], original['delegate_id'] = values
+
+        return original[name]
+
+    def has_changed(self, name):
+        """Check if a tracked field may have changed since it was loaded.
+
+        Fields are assumed to have changed if the patch wasn't loaded
+        from the database.
+        """
+        if name not in self.__dict__:
+            # a deferred field that has never been loaded or set
+            return '_original' not in self.__dict__
+
+        original = self.__dict__.get('_original', {})
+        return name not in original or original[name] != self.__dict__[name]
+
     @staticmethod
     def extract_tags(content, tags):
-        counts = Counter()
+        # imported here as the lookup cache depends on these models
+        from patchwork.lookups import get_tag_matcher
+
+        return get_tag_matcher(tags).count(content)
+
+    @staticmethod
+    def extract_paths(diff):
+        """Find the normalised paths of the files changed by a diff.
+
+        Paths are truncated to fit :class:`PatchFile`.
+        """
+        # imported here as the parser depends on these models
+        from patchwork.parser import find_filenames
 
-        for tag in tags:
-            regex = re.compile(tag.pattern, re.MULTILINE | re.IGNORECASE)
-            counts[tag] = len(regex.findall(content))
+        if not diff:
+            return []
 
-        return counts
+        paths = set(normalize_path(filename)[:255]
+                    for filename in find_filenames(diff))
+        paths.discard('')
+        return sorted(paths)
+
+    @staticmethod
+    def extract_diffstat(diff):
+        """Count the files and lines changed by a diff.
+
+        Returns:
+            A tuple of the number of files changed, lines added and lines
+            removed.
+        """
+        # imported here as the parser depends on these models
+        from patchwork.parser import find_diffstat
+
+        if not diff:
+            return 0, 0, 0
+
+        return find_diffstat(diff)
+
+    def set_diffstat(self):
+        """Set the diffstat fields from the diff, without saving them."""
+        (self.files_changed, self.lines_added,
+         self.lines_removed) = self.extract_diffstat(self.diff)
+
+    def _set_files(self, created):
+        paths = set(self.extract_paths(self.diff))
+        if not created:
+            existing = set(self.patchfile_set.values_list('path', flat=True))
+            self.patchfile_set.filter(path__in=existing - paths).delete()
+            paths -= existing
+
+        PatchFile.objects.bulk_create([
+            PatchFile(patch=self, path=path) for path in sorted(paths)])
 
     def _set_tag(self, tag, count):
         if count == 0:
@@ -425,29 +658,106 @@ class Patch(SeriesMixin, Submission):
             patchtag.count = count
             patchtag.save()
 
-    def refresh_tag_counts(self):
+    def update_tag_counts(self, delta):
+        """Adjust the tag counts of the patch without recounting them.
+
+        This is used when a single comment is added, changed or removed,
+        to avoid rescanning the patch and all of its comments. Counts are
+        adjusted in the database, so concurrent updates aren't lost.
+        :meth:`refresh_tag_counts` can be used to repair the counts.
+
+        Args:
+            delta (dict): A mapping of tags to the change in their count.
+        """
+        if not any(delta.values()):
+            return
+
+        with transaction.atomic():
+            # lock the patch so concurrent updates of tag_counts, which is
+            # rewritten as a whole, are serialized
+            list(Patch.objects.select_for_update().filter(
+                pk=self.pk).values_list('pk'))
+
+            for tag, count in delta.items():
+                if not count:
+                    continue
+
+                patchtags = PatchTag.objects.filter(patch=self, tag=tag)
+                if patchtags.update(count=models.F('count') + count):
+                    if count < 0:
+                        patchtags.filter(count__lte=0).delete()
+                    continue
+
+                if count < 0:
+                    continue
+
+                try:
+                    with transaction.atomic():
+                        PatchTag.objects.create(patch=self, tag=tag,
+                                                count=count)
+                except IntegrityError:
+                    # the tag was added by someone else in the meantime
+                    patchtags.update(count=models.F('count') + count)
+
+            self.tag_counts = dict(PatchTag.objects.filter(
+                patch=self).values_list('tag', 'count'))
+            Patch.objects.filter(pk=self.pk).update(
+                tag_counts=self.tag_counts)
+
+    def _count_tags(self):
         tags = self.project.tags
         counter = Counter()
 
         if self.content:
             counter += self.extract_tags(self.content, tags)
 
-        for comment in self.comments.all():
-            counter = counter + self.extract_tags(comment.content, tags)
+        if self.pk is not None:
+            for comment in self.comments.all():
+                counter = counter + self.extract_tags(comment.content, tags)
+
+        return counter
 
-        for tag in tags:
+    def _set_tags(self, counter):
+        for tag in self.project.tags:
             self._set_tag(tag, counter[tag])
 
+    def refresh_tag_counts(self):
+        counter = self._count_tags()
+        self._set_tags(counter)
+
+        self.tag_counts = dict((tag.id, count)
+                               for tag, count in counter.items() if count)
+        Patch.objects.filter(pk=self.pk).update(tag_counts=self.tag_counts)
+
     def save(self, *args, **kwargs):
         if not hasattr(self, 'state') or not self.state:
             self.state = get_default_initial_patch_state()
 
-        if self.hash is None and self.diff is not None:
+        # the hash, files and tags only depend on the diff and content, so
+        # don't recompute them for changes to other fields, like the state.
+        # Deferred fields can't have changed, and aren't loaded to check
+        created = self.pk is None
+        refile = created or self.has_changed('diff')
+        retag = created or self.has_changed('content')
+        if 'diff' in self.__dict__ and self.diff is not None and (
+                self.hash is None or (not created and refile)):
             self.hash = hash_diff(self.diff)
+        if retag:
+            # the counts are stored with the patch, and in PatchTag once the
+            # patch has been saved
+            counter = self._count_tags()
+            self.tag_counts = dict((tag.id, count)
+                                   for tag, count in counter.items() if count)
+        if refile:
+            self.set_diffstat()
 
         super(Patch, self).save(**kwargs)
 
-        self.refresh_tag_counts()
+        if retag:
+            self._set_tags(counter)
+        if refile:
+            self._set_files(created)
+        self._snapshot()
 
     def is_editable(self, user):
         if not is_authenticated(user):
@@ -458,95 +768,81 @@ class Patch(SeriesMixin, Submission):
 
         return self.project.is_editable(user)
 
-    @property
-    def combined_check_state(self):
-        """Return the combined state for all checks.
+    @staticmethod
+    def combine_check_states(states):
+        """Return the combined state of a list of check states.
 
-        Generate the combined check's state for this patch. This check
-        is one of the following, based on the value of each unique
-        check:
+        The combined state is one of the following, based on the state
+        of each check:
 
-          * failure, if any context's latest check reports as failure
-          * warning, if any context's latest check reports as warning
-          * pending, if there are no checks, or a context's latest
-              Check reports as pending
-          * success, if latest checks for all contexts reports as
-              success
+          * failure, if any check reports as failure
+          * warning, if any check reports as warning
+          * pending, if there are no checks, or a check reports as
+              pending
+          * success, if all checks report as success
         """
-        state_names = dict(Check.STATE_CHOICES)
-        states = [check.state for check in self.checks]
-
         if not states:
-            return state_names[Check.STATE_PENDING]
+            return Check.STATE_PENDING
 
         for state in [Check.STATE_FAIL, Check.STATE_WARNING,
                       Check.STATE_PENDING]:  # order sensitive
             if state in states:
-                return state_names[state]
+                return state
 
-        return state_names[Check.STATE_SUCCESS]
+        return Check.STATE_SUCCESS
 
-    @property
-    def checks(self):
-        """Return the list of unique checks.
+    def refresh_check_state(self):
+        """Recompute the stored state of the patch's latest checks.
 
-        Generate a list of checks associated with this patch for each
-        type of Check. Only "unique" checks are considered,
-        identified by their 'context' field. This means, given n
-        checks with the same 'context', the newest check is the only
-        one counted regardless of its value. The end result will be a
-        association of types to number of unique checks for said
-        type.
+        This is called whenever a check is saved or deleted, so lists of
+        patches can show, filter and order by the combined check state
+        without loading the checks themselves.
         """
-        unique = {}
-        duplicates = []
+        states = list(self.check_set.filter(latest=True).values_list(
+            'state', flat=True))
 
-        for check in self.check_set.all():
-            ctx = check.context
-            user = check.user
+        self.check_state = self.combine_check_states(states)
+        self.check_counts = dict(Counter(states))
+        Patch.objects.filter(pk=self.pk).update(
+            check_state=self.check_state, check_counts=self.check_counts)
 
-            if user in unique and ctx in unique[user]:
-                # recheck condition - ignore the older result
-                if unique[user][ctx].date > check.date:
-                    duplicates.append(check.id)
-                    continue
-                duplicates.append(unique[user][ctx].id)
+    @property
+    def combined_check_state(self):
+        """Return the combined state for all checks.
 
-            if user not in unique:
-                unique[user] = {}
+        This is one of the following, based on the latest check for
+        each context:
 
-            unique[user][ctx] = check
+          * failure, if any context's latest check reports as failure
+          * warning, if any context's latest check reports as warning
+          * pending, if there are no checks, or a context's latest
+              Check reports as pending
+          * success, if latest checks for all contexts reports as
+              success
+        """
+        return dict(Check.STATE_CHOICES)[self.check_state]
 
-        # filter out the "duplicates" or older, now-invalid results
+    @property
+    def checks(self):
+        """Return the list of unique checks.
 
-        # Why don't we use filter or exclude here? Surprisingly, it's
-        # an optimisation in the common case. Where we're looking at
-        # checks in anything that uses a generic_list() in the view,
-        # we do a prefetch_related('check_set'). But, if we then do a
-        # .filter or a .exclude, that throws out the existing, cached
-        # information, and does another query. (See the Django docs on
-        # prefetch_related.) So, do it 'by hand' in Python. We can
-        # also be confident that this won't be worse, seeing as we've
-        # just iterated over self.check_set.all() *anyway*.
-        return [c for c in self.check_set.all() if c.id not in duplicates]
+        Only "unique" checks are considered, identified by their 'user'
+        and 'context' fields. This means, given n checks with the same
+        'context' from the same user, the newest check is the only one
+        returned regardless of its value.
+        """
+        return list(self.check_set.filter(latest=True).select_related(
+            'user'))
 
     @property
     def check_count(self):
-        """Generate a list of unique checks for each patch.
-
-        Compile a list of checks associated with this patch for each
-        type of check. Only "unique" checks are considered, identified
-        by their 'context' field. This means, given n checks with the
-        same 'context', the newest check is the only one counted
-        regardless of its value. The end result will be a association
-        of types to number of unique checks for said type.
-        """
-        counts = {key: 0 for key, _ in Check.STATE_CHOICES}
-
-        for check in self.checks:
-            counts[check.state] += 1
+        """Return the number of unique checks in each state.
 
-        return counts
+        Only the newest check for each user and context is counted, as
+        for :attr:`checks`.
+        """
+        return dict((key, self.check_counts.get(key, 0))
+                    for key, _ in Check.STATE_CHOICES)
 
     @models.permalink
     def get_absolute_url(self):
@@ -572,15 +868,44 @@ class Comment(EmailMixin, models.Model):
                                    related_query_name='comment',
                                    on_delete=models.CASCADE)
 
+    def _tag_counts(self, patch, content):
+        if not content:
+            return Counter()
+
+        return Patch.extract_tags(content, patch.project.tags)
+
     def save(self, *args, **kwargs):
+        # only the tags in this comment are counted, and the difference
+        # applied to the patch, rather than recounting every comment
+        old = None
+        if self.pk is not None and not self._state.adding:
+            old = Comment.objects.filter(pk=self.pk).values_list(
+                'submission', 'content').first()
+
         super(Comment, self).save(*args, **kwargs)
-        if hasattr(self.submission, 'patch'):
-            self.submission.patch.refresh_tag_counts()
+
+        if old and old[0] != self.submission_id:
+            for patch in Patch.objects.filter(
+                    id__in=[old[0], self.submission_id]):
+                patch.refresh_tag_counts()
+            return
+
+        if not hasattr(self.submission, 'patch'):
+            return
+
+        patch = self.submission.patch
+        delta = self._tag_counts(patch, self.content)
+        if old:
+            delta.subtract(self._tag_counts(patch, old[1]))
+        patch.update_tag_counts(delta)
 
     def delete(self, *args, **kwargs):
         super(Comment, self).delete(*args, **kwargs)
         if hasattr(self.submission, 'patch'):
-            self.submission.patch.refresh_tag_counts()
+            patch = self.submission.patch
+            delta = self._tag_counts(patch, self.content)
+            patch.update_tag_counts(dict(
+                (tag, -count) for tag, count in delta.items()))
 
     class Meta:
         ordering = ['date']
@@ -747,6 +1072,145 @@ class SeriesReference(models.Model):
         unique_together = [('series', 'msgid')]
 
 
+class MessageIndexManager(models.Manager):
+
+    # stay well below the limit on query parameters of SQLite
+    chunk_size = 500
+
+    def lookup(self, project, msgids):
+        """Find the entries for a number of message IDs.
+
+        Args:
+            project (Project): The project the messages belong to.
+            msgids (list): The message IDs to find.
+
+        Returns:
+            A dict mapping message IDs to ``MessageIndex`` instances.
+            Message IDs without an entry are omitted.
+        """
+        msgids = list(OrderedDict.fromkeys(msgid[:255] for msgid in msgids))
+        entries = {}
+
+        for i in range(0, len(msgids), self.chunk_size):
+            for entry in self.filter(
+                    project=project, msgid__in=msgids[i:i + self.chunk_size],
+            ).select_related('submission', 'series'):
+                entries[entry.msgid] = entry
+
+        return entries
+
+    def record(self, project_id, entries):
+        """Add or update the entries for a number of messages.
+
+        The submission for a message ID is that of the submission with
+        that message ID, if any, else that of the comment with that
+        message ID seen most recently. The series for a message ID is
+        that of the first series referencing it.
+
+        Args:
+            project_id (int): ID of the project the messages belong to.
+            entries (list): ``(msgid, submission_id, series_id, direct)``
+                tuples, where direct is True if this is the message ID
+                of the submission itself, rather than one of its
+                comments. Either ID may be None.
+        """
+        merged = OrderedDict()
+        for msgid, submission_id, series_id, direct in entries:
+            msgid = msgid[:255]
+            entry = merged.get(msgid)
+            if entry is None:
+                merged[msgid] = [submission_id, series_id, direct]
+                continue
+
+            if submission_id and (direct or not entry[2]):
+                entry[0] = submission_id
+                entry[2] = entry[2] or direct
+            if series_id and not entry[1]:
+                entry[1] = series_id
+
+        msgids = list(merged)
+        existing = {}
+        for i in range(0, len(msgids), self.chunk_size):
+            for row in self.filter(
+                    project_id=project_id,
+                    msgid__in=msgids[i:i + self.chunk_size],
+            ).values_list('id', 'msgid', 'submission', 'series',
+                          'submission__msgid'):
+                existing[row[1]] = row
+
+        new = []
+        for msgid, (submission_id, series_id, direct) in merged.items():
+            if msgid not in existing:
+                new.append(self.model(
+                    project_id=project_id, msgid=msgid,
+                    submission_id=submission_id, series_id=series_id))
+                continue
+
+            pk, _, old_submission_id, old_series_id, old_msgid = \
+                existing[msgid]
+            changes = {}
+            # a submission takes precedence over comments with its msgid
+            if submission_id and submission_id != old_submission_id and (
+                    direct or old_submission_id is None or
+                    old_msgid != msgid):
+                changes['submission'] = submission_id
+            if series_id and old_series_id is None:
+                changes['series'] = series_id
+            if changes:
+                self.filter(pk=pk).update(**changes)
+
+        if not new:
+            return
+
+        try:
+            with transaction.atomic():
+                self.bulk_create(new)
+        except IntegrityError:
+            # another process indexed some of these messages in the
+            # meantime, so merge with those entries one at a time
+            for obj in new:
+                direct = merged[obj.msgid][2]
+                self.record(project_id, [
+                    (obj.msgid, obj.submission_id, obj.series_id, direct)])
+
+
+class MessageIndex(models.Model):
+    """An index of the messages seen for a project.
+
+    This maps the message ID of every submission, comment and series
+    reference to the submission and series it belongs to, allowing the
+    parent of a mail to be found using a single query regardless of the
+    number of references it has. Entries are kept up to date when
+    these are saved.
+    """
+
+    project = models.ForeignKey(Project, on_delete=models.CASCADE)
+    msgid = models.CharField(max_length=255)
+    submission = models.ForeignKey(Submission, null=True, blank=True,
+                                   on_delete=models.SET_NULL)
+    series = models.ForeignKey(Series, null=True, blank=True,
+                               on_delete=models.SET_NULL)
+
+    objects = MessageIndexManager()
+
+    class Meta:
+        unique_together = [('project', 'msgid')]
+
+
+class SearchDocument(models.Model):
+    """The text of a submission, as used for full-text search.
+
+    Documents are kept up to date when submissions and comments are
+    saved. The database-specific index of their text is written by the
+    search backend, as described in :mod:`patchwork.search`.
+    """
+
+    submission = models.OneToOneField(Submission, primary_key=True,
+                                      related_name='search_document',
+                                      on_delete=models.CASCADE)
+    title = models.TextField()
+
+
 class Bundle(models.Model):
     owner = models.ForeignKey(User, on_delete=models.CASCADE)
     project = models.ForeignKey(Project, on_delete=models.CASCADE)
@@ -835,6 +1299,38 @@ class Check(models.Model):
         max_length=255, default='default',
         help_text='A label to discern check from checks of other testing '
         'systems.')
+    # whether this is the newest check for its patch, user and context. Older
+    # checks are kept for history, but ignored when combining states
+    latest = models.BooleanField(default=False, editable=False)
+
+    def _update_latest(self):
+        checks = Check.objects.filter(patch=self.patch_id, user=self.user_id,
+                                      context=self.context)
+        latest_id = checks.order_by('-date', '-id').values_list(
+            'id', flat=True).first()
+
+        checks.filter(latest=True).exclude(id=latest_id).update(latest=False)
+        checks.filter(id=latest_id, latest=False).update(latest=True)
+        self.latest = latest_id == self.id
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            # lock the patch, so concurrent checks for it are serialized
+            list(Patch.objects.select_for_update().filter(
+                pk=self.patch_id).values_list('pk'))
+
+            super(Check, self).save(*args, **kwargs)
+            self._update_latest()
+            self.patch.refresh_check_state()
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            list(Patch.objects.select_for_update().filter(
+                pk=self.patch_id).values_list('pk'))
+
+            super(Check, self).delete(*args, **kwargs)
+            self._update_latest()
+            self.patch.refresh_check_state()
 
     def __repr__(self):
         return "<Check id='%d' context='%s' state='%s'" % (
@@ -19,8 +19,22 @@
 
 from __future__ import absolute_import
 
+import base64
+import hashlib
+import json
+
 from django.conf import settings
 from django.core import paginator
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q
+from django.db.models.fields import FieldDoesNotExist
+from django.db.models.fields.related import RelatedField
+from django.utils.encoding import force_bytes
+from django.utils.encoding import force_text
+from django.utils.functional import cached_property
+from django.utils import six
 
 from patchwork.compat import is_authenticated
 
@@ -34,11 +48,68 @@ TRAILING_PAGE_RANGE = 2
 NUM_PAGES_OUTSIDE_RANGE = 2
 ADJACENT_PAGES = 1
 
+COUNT_CACHE_PREFIX = 'patchwork-paginator-count-'
+
 # parts from:
 #  http://blog.localkinegrinds.com/2007/09/06/digg-style-pagination-in-django/
 
 
+def estimate_count(queryset):
+    """Estimate the number of rows a query will return.
+
+    This asks the database's query planner, which is much cheaper than
+    counting the rows but may be some way off. Only PostgreSQL is
+    supported.
+
+    Returns:
+        The estimated number of rows, or None if the database can't
+        provide an estimate
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+
+    query = queryset.order_by().query
+    sql, params = query.get_compiler(using=queryset.db).as_sql()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+
+    if isinstance(plan, six.string_types):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def _encode_cursor(values):
+    data = json.dumps([force_text(value) for value in values])
+    return force_text(base64.urlsafe_b64encode(force_bytes(data)))
+
+
+def _decode_cursor(cursor):
+    try:
+        values = json.loads(force_text(
+            base64.urlsafe_b64decode(force_bytes(cursor))))
+    except (TypeError, ValueError):
+        return None
+
+    if not isinstance(values, list):
+        return None
+    return values
+
+
 class Paginator(paginator.Paginator):
+    """Paginate a list of patches.
+
+    By default, this counts the patches to find the number of pages and
+    skips over the patches before the current page using an OFFSET,
+    both of which get slow for lists of many thousands of patches. The
+    ``PAGINATOR_ESTIMATE_THRESHOLD`` and ``PAGINATOR_COUNT_CACHE_TIMEOUT``
+    settings avoid counting, while ``PAGINATOR_MAX_OFFSET`` limits the
+    number of patches skipped. Pages further into the list are reached
+    from their neighbours using a cursor, holding the values the list
+    is ordered by for the last (``after``) or first (``before``) patch
+    of the neighbouring page.
+    """
 
     def __init__(self, request, objects):
 
@@ -47,11 +118,20 @@ class Paginator(paginator.Paginator):
         if is_authenticated(request.user):
             items_per_page = request.user.profile.items_per_page
 
+        self.max_offset = settings.PAGINATOR_MAX_OFFSET
+        self.count_is_estimate = False
+        self.ordering = None
+        if self.max_offset is not None:
+            objects, self.ordering = self._get_ordering(objects)
+
         super(Paginator, self).__init__(objects, items_per_page)
 
+        after = request.GET.get('after')
+        before = request.GET.get('before')
+
         try:
             page_no = int(request.GET.get('page', 1))
-            self.current_page = self.page(int(page_no))
+            self.current_page = self.page(int(page_no), after, before)
         except ValueError:
             page_no = 1
             self.current_page = self.page(page_no)
@@ -84,6 +164,171 @@ class Paginator(paginator.Paginator):
         self.adjacent_set = [n for n in range(adjacent_start, adjacent_end)
                              if n > 0 and n <= pages]
 
+        # only link to pages which don't need a cursor, and so can be
+        # reached directly
+        self.adjacent_set = [n for n in self.adjacent_set
+                             if n == page_no or self._is_direct(n)]
+        self.leading_set = [n for n in self.leading_set
+                            if self._is_direct(n)]
+
         self.leading_set.reverse()
         self.long_page = len(
             self.current_page.object_list) >= LONG_PAGE_THRESHOLD
+
+    @cached_property
+    def count(self):
+        """Return the number of items, or an estimate for long lists."""
+        timeout = settings.PAGINATOR_COUNT_CACHE_TIMEOUT
+        key = None
+        if timeout:
+            query = self.object_list.order_by().query
+            sql, params = query.get_compiler(
+                using=self.object_list.db).as_sql()
+            key = COUNT_CACHE_PREFIX + hashlib.sha1(
+                force_bytes(repr((sql, params)))).hexdigest()
+            count = cache.get(key)
+            if count is not None:
+                return count
+
+        threshold = settings.PAGINATOR_ESTIMATE_THRESHOLD
+        if threshold is not None:
+            estimate = estimate_count(self.object_list)
+            if estimate is not None and estimate > threshold:
+                self.count_is_estimate = True
+                return estimate
+
+        count = super(Paginator, self).count
+        if key is not None:
+            cache.set(key, count, timeout)
+        return count
+
+    @staticmethod
+    def _get_ordering(objects):
+        """Find the fields a queryset is ordered by.
+
+        An ordering by ID is added to break ties, if needed.
+
+        Returns:
+            A tuple of the queryset and a list of ``(field, descending)``
+            tuples, where the list is None if the queryset can't be
+            paginated using a cursor
+        """
+        names = list(objects.query.order_by)
+        if not names:
+            return objects, None
+
+        ordering = []
+        for name in names:
+            if not isinstance(name, six.string_types):
+                return objects, None
+
+            descending = name.startswith('-')
+            name = name.lstrip('-')
+            if name == 'pk':
+                name = 'id'
+
+            # cursors can only hold the values of non-null fields of the
+            # patch itself
+            try:
+                field = objects.model._meta.get_field(name)
+            except FieldDoesNotExist:
+                return objects, None
+            if isinstance(field, RelatedField) or field.null:
+                return objects, None
+
+            ordering.append((field, descending))
+
+        if ordering[-1][0].name != 'id':
+            descending = ordering[0][1]
+            objects = objects.order_by(
+                *(names + ['-id' if descending else 'id']))
+            ordering.append((objects.model._meta.get_field('id'),
+                             descending))
+
+        return objects, ordering
+
+    def _is_direct(self, number):
+        """Check whether a page can be fetched without a cursor."""
+        if self.max_offset is None:
+            return True
+
+        offset = (number - 1) * self.per_page
+        if offset <= self.max_offset:
+            return True
+
+        # pages at the end of the list are fetched in reverse, which needs
+        # an exact count
+        remaining = self.count - offset - self.per_page
+        if self.ordering is None or self.count_is_estimate:
+            return False
+        return remaining <= self.max_offset
+
+    def _seek(self, values, forward):
+        """Filter the items following or preceding a cursor."""
+        if values is None or len(values) != len(self.ordering):
+            return None
+
+        try:
+            values = [field.to_python(value) for (field, _), value
+                      in zip(self.ordering, values)]
+        except ValidationError:
+            return None
+
+        # (a > x) OR (a = x AND b > y) OR ...
+        query = Q()
+        for i, (field, descending) in enumerate(self.ordering):
+            lookup = 'lt' if descending == forward else 'gt'
+            term = Q(**{'%s__%s' % (field.name, lookup): values[i]})
+            for (prev, _), value in zip(self.ordering[:i], values):
+                term &= Q(**{prev.name: value})
+            query |= term
+
+        objects = self.object_list.filter(query)
+        if not forward:
+            objects = objects.reverse()
+        return objects
+
+    def _cursor(self, item):
+        return _encode_cursor([getattr(item, field.attname)
+                               for field, _ in self.ordering])
+
+    def page(self, number, after=None, before=None):
+        if self.max_offset is None:
+            return super(Paginator, self).page(number)
+
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+
+        objects = None
+        if bottom <= self.max_offset or self.ordering is None:
+            pass
+        elif after:
+            objects = self._seek(_decode_cursor(after), True)
+        elif before:
+            objects = self._seek(_decode_cursor(before), False)
+
+        if objects is not None:
+            objects = list(objects[:self.per_page])
+            if before:
+                objects.reverse()
+            page = self._get_page(objects, number, self)
+        elif bottom > self.max_offset and self._is_direct(number):
+            # fetch the last pages in reverse, to skip fewer items
+            top = min(bottom + self.per_page, self.count)
+            objects = list(self.object_list.reverse()[
+                self.count - top:self.count - bottom])
+            objects.reverse()
+            page = self._get_page(objects, number, self)
+        else:
+            page = super(Paginator, self).page(number)
+
+        page.next_cursor = page.previous_cursor = None
+        if self.ordering is None or not len(page):
+            return page
+
+        if page.has_next() and not self._is_direct(number + 1):
+            page.next_cursor = self._cursor(page[len(page) - 1])
+        if page.has_previous() and not self._is_direct(number - 1):
+            page.previous_cursor = self._cursor(page[0])
+
+        return page
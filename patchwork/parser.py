@@ -24,29 +24,51 @@ from email.header import make_header
 from email.utils import mktime_tz
 from email.utils import parsedate_tz
 from email.errors import HeaderParseError
-from fnmatch import fnmatch
 import logging
 import re
 
 from django.contrib.auth.models import User
+from django.utils.functional import cached_property
 from django.utils import six
 
+from patchwork import lookups
 from patchwork.models import Comment
 from patchwork.models import CoverLetter
-from patchwork.models import DelegationRule
-from patchwork.models import get_default_initial_patch_state
+from patchwork.models import MessageIndex
 from patchwork.models import Patch
 from patchwork.models import Person
-from patchwork.models import Project
 from patchwork.models import Series
 from patchwork.models import SeriesReference
 from patchwork.models import SeriesPatch
-from patchwork.models import State
-from patchwork.models import Submission
 
 
 _hunk_re = re.compile(r'^\@\@ -\d+(?:,(\d+))? \+\d+(?:,(\d+))? \@\@')
 _filename_re = re.compile(r'^(---|\+\+\+) (\S+)')
+_listid_res = [re.compile(r'.*<([^>]+)>.*', re.S),
+               re.compile(r'^([\S]+)$', re.S)]
+_re_re = re.compile(r'^(re|fwd?)[:\s]\s*', re.I)
+_prefix_re = re.compile(r'^\[([^\]]*)\]\s*(.*)$')
+_comment_re = re.compile(r'^(re)[:\s]\s*', re.I)
+
+# tuple of (regex, fn)
+#  - where fn returns a (name, email) tuple from the match groups resulting
+#    from re.match().groups()
+# TODO(stephenfin): Perhaps we should check for "real" email addresses
+# instead of anything ('.*?')
+_from_res = [
+    # for "Firstname Lastname" <example@example.com> style addresses
+    (re.compile(r'"?(.*?)"?\s*<([^>]+)>'), (lambda g: (g[0], g[1]))),
+
+    # for example at example.com (Firstname Lastname) style addresses
+    (re.compile(r'(.*?)\sat\s(.*?)\s*\(([^\)]+)\)'),
+     (lambda g: (g[2], '@'.join(g[0:2])))),
+
+    # for example@example.com (Firstname Lastname) style addresses
+    (re.compile(r'"?(.*?)"?\s*\(([^\)]+)\)'), (lambda g: (g[1], g[0]))),
+
+    # everything else
+    (re.compile(r'(.*)'), (lambda g: (None, g[0]))),
+]
 list_id_headers = ['List-ID', 'X-Mailing-List', 'X-list']
 
 SERIES_DELAY_INTERVAL = 10
@@ -152,26 +174,28 @@ def clean_header(header):
 
 def find_project_by_id(list_id):
     """Find a `project` object with given `list_id`."""
-    project = None
-    try:
-        project = Project.objects.get(listid=list_id)
-    except Project.DoesNotExist:
-        pass
-    return project
+    return lookups.get_project(list_id)
 
 
-def find_project_by_header(mail):
-    project = None
-    listid_res = [re.compile(r'.*<([^>]+)>.*', re.S),
-                  re.compile(r'^([\S]+)$', re.S)]
+def find_list_ids(mail):
+    """Find the candidate mailing list IDs in a mail's headers.
+
+    This does not touch the database, so it is safe to use from worker
+    processes.
+
+    Returns:
+        A list of list IDs, in order of preference
+    """
+    mail = ParsedMail.wrap(mail)
+    list_ids = []
 
     for header in list_id_headers:
         if header in mail:
-            h = clean_header(mail.get(header))
+            h = mail.header(header)
             if not h:
                 continue
 
-            for listid_re in listid_res:
+            for listid_re in _listid_res:
                 match = listid_re.match(h)
                 if match:
                     break
@@ -179,11 +203,18 @@ def find_project_by_header(mail):
             if not match:
                 continue
 
-            listid = match.group(1)
+            list_ids.append(match.group(1))
+
+    return list_ids
+
+
+def find_project_by_header(mail):
+    project = None
 
-            project = find_project_by_id(listid)
-            if project:
-                break
+    for listid in ParsedMail.wrap(mail).list_ids:
+        project = find_project_by_id(listid)
+        if project:
+            break
 
     return project
 
@@ -218,19 +249,19 @@ def _find_series_by_references(project, mail):
     Returns:
         The matching ``Series`` instance, if any
     """
-    refs = find_references(mail)
-    h = clean_header(mail.get('Message-Id'))
-    if h:
-        refs = [h] + refs
+    mail = ParsedMail.wrap(mail)
+    refs = mail.refs
+    if mail.msgid:
+        refs = [mail.msgid] + refs
+
+    entries = MessageIndex.objects.lookup(project, refs)
     for ref in refs:
-        try:
-            return SeriesReference.objects.get(
-                msgid=ref[:255], series__project=project).series
-        except SeriesReference.DoesNotExist:
-            continue
+        entry = entries.get(ref[:255])
+        if entry is not None and entry.series is not None:
+            return entry.series
 
 
-def _find_series_by_markers(project, mail):
+def _find_series_by_markers(project, mail, author):
     """Find a patch's series using series markers and sender.
 
     Identify suitable series for a patch using a combination of the
@@ -251,14 +282,12 @@ def _find_series_by_markers(project, mail):
     still won't help us if someone spams the mailing list with
     duplicate series but that's a tricky situation for anyone to parse.
     """
-    author = find_author(mail)
+    mail = ParsedMail.wrap(mail, project.linkname)
 
-    subject = mail.get('Subject')
-    name, prefixes = clean_subject(subject, [project.linkname])
-    _, total = parse_series_marker(prefixes)
-    version = parse_version(name, prefixes)
+    _, total = mail.series_marker
+    version = mail.version
 
-    date = find_date(mail)
+    date = mail.date
     delta = datetime.timedelta(minutes=SERIES_DELAY_INTERVAL)
     start_date = date - delta
     end_date = date + delta
@@ -271,53 +300,51 @@ def _find_series_by_markers(project, mail):
         return
 
 
-def find_series(project, mail):
+def find_series(project, mail, author=None):
     """Find a series, if any, for a given patch.
 
     Args:
         project (patchwork.Project): The project that the series
             belongs to
         mail (email.message.Message): The mail to extract series from
+        author (patchwork.Person): The author of the mail, if already
+            known
 
     Returns:
         The matching ``Series`` instance, if any
     """
+    mail = ParsedMail.wrap(mail, project.linkname)
+
     series = _find_series_by_references(project, mail)
     if series:
         return series
 
-    return _find_series_by_markers(project, mail)
+    if author is None:
+        author = find_author(mail)
 
+    return _find_series_by_markers(project, mail, author)
 
-def find_author(mail):
-    from_header = clean_header(mail.get('From'))
 
-    if not from_header:
-        raise ValueError("Invalid 'From' header")
+def parse_author(mail):
+    """Extract the name and email address of a mail's author.
 
-    name, email = (None, None)
+    This does not touch the database; use :func:`find_author` to get
+    the matching ``Person``.
 
-    # tuple of (regex, fn)
-    #  - where fn returns a (name, email) tuple from the match groups resulting
-    #    from re.match().groups()
-    # TODO(stephenfin): Perhaps we should check for "real" email addresses
-    # instead of anything ('.*?')
-    from_res = [
-        # for "Firstname Lastname" <example@example.com> style addresses
-        (re.compile(r'"?(.*?)"?\s*<([^>]+)>'), (lambda g: (g[0], g[1]))),
+    Returns:
+        A ``(name, email)`` tuple. The name can be None.
 
-        # for example at example.com (Firstname Lastname) style addresses
-        (re.compile(r'(.*?)\sat\s(.*?)\s*\(([^\)]+)\)'),
-         (lambda g: (g[2], '@'.join(g[0:2])))),
+    Raises:
+        ValueError: The 'From' header is invalid.
+    """
+    from_header = ParsedMail.wrap(mail).header('From')
 
-        # for example@example.com (Firstname Lastname) style addresses
-        (re.compile(r'"?(.*?)"?\s*\(([^\)]+)\)'), (lambda g: (g[1], g[0]))),
+    if not from_header:
+        raise ValueError("Invalid 'From' header")
 
-        # everything else
-        (re.compile(r'(.*)'), (lambda g: (None, g[0]))),
-    ]
+    name, email = (None, None)
 
-    for regex, fn in from_res:
+    for regex, fn in _from_res:
         match = regex.match(from_header)
         if match:
             (name, email) = fn(match.groups())
@@ -330,6 +357,12 @@ def find_author(mail):
     if name is not None:
         name = name.strip()[:255]
 
+    return name, email
+
+
+def find_author(mail):
+    name, email = ParsedMail.wrap(mail).author
+
     try:
         person = Person.objects.get(email__iexact=email)
         if name:  # use the latest provided name
@@ -341,7 +374,7 @@ def find_author(mail):
 
 
 def find_date(mail):
-    h = clean_header(mail.get('Date', ''))
+    h = ParsedMail.wrap(mail).header('Date')
     if not h:
         return datetime.datetime.utcnow()
 
@@ -547,40 +580,38 @@ def find_comment_content(mail):
 
 
 def find_submission_for_comment(project, refs):
-    for ref in refs:
-        ref = ref[:255]
-        # first, check for a direct reply
-        try:
-            submission = Submission.objects.get(project=project, msgid=ref)
-            return submission
-        except Submission.DoesNotExist:
-            pass
+    """Find the submission a comment replies to.
+
+    The submission for the first reference which is either a submission
+    or a comment on one is used.
+
+    NOTE(stephenfin): Where more than one comment has the same message
+    ID, the submission of the most recent is used. This is a artifact of
+    prior lack of support for cover letters in Patchwork. Previously all
+    replies to patches were saved as comments. However, it's possible
+    that someone could have created a new series as a reply to one of
+    the comments on the original patch series. For example,
+    '2015-November/002096.html' from the Patchwork archives. In this
+    case, reparsing the archives will result in creation of a cover
+    letter with the same message ID as the existing comment. Follow up
+    comments will then apply to both this cover letter and the linked
+    patch from the comment previously created. We choose to apply the
+    comment to the cover letter. Note that this only happens when
+    running 'parsearchive' or similar, so it should not affect every
+    day use in any way.
 
-        # see if we have comments that refer to a patch
-        try:
-            comment = Comment.objects.get(submission__project=project,
-                                          msgid=ref)
-            return comment.submission
-        except Comment.MultipleObjectsReturned:
-            # NOTE(stephenfin): This is a artifact of prior lack of support
-            # for cover letters in Patchwork. Previously all replies to
-            # patches were saved as comments. However, it's possible that
-            # someone could have created a new series as a reply to one of the
-            # comments on the original patch series. For example,
-            # '2015-November/002096.html' from the Patchwork archives. In this
-            # case, reparsing the archives will result in creation of a cover
-            # letter with the same message ID as the existing comment. Follow
-            # up comments will then apply to both this cover letter and the
-            # linked patch from the comment previously created. We choose to
-            # apply the comment to the cover letter. Note that this only
-            # happens when running 'parsearchive' or similar, so it should not
-            # affect every day use in any way.
-            comments = Comment.objects.filter(submission__project=project,
-                                              msgid=ref)
-            # The latter item will be the cover letter
-            return comments.reverse()[0].submission
-        except Comment.DoesNotExist:
-            pass
+    Args:
+        project (patchwork.Project): The project the comment belongs to
+        refs (list): The references of the comment, most recent first
+
+    Returns:
+        The matching ``Submission`` instance, if any
+    """
+    entries = MessageIndex.objects.lookup(project, refs)
+    for ref in refs:
+        entry = entries.get(ref[:255])
+        if entry is not None and entry.submission is not None:
+            return entry.submission
 
     return None
 
@@ -613,13 +644,19 @@ def clean_subject(subject, drop_prefixes=None):
         drop_prefixes: Additional, case-insensitive prefixes to remove
           from the subject
     """
-    re_re = re.compile(r'^(re|fwd?)[:\s]\s*', re.I)
-    prefix_re = re.compile(r'^\[([^\]]*)\]\s*(.*)$')
     subject = clean_header(subject)
 
     if subject is None:
         raise ValueError("Invalid 'Subject' header")
 
+    return _clean_subject(subject, drop_prefixes)
+
+
+def _clean_subject(subject, drop_prefixes=None):
+    """Clean an already decoded Subject: header.
+
+    See :func:`clean_subject`.
+    """
     if drop_prefixes is None:
         drop_prefixes = []
     else:
@@ -628,13 +665,13 @@ def clean_subject(subject, drop_prefixes=None):
     drop_prefixes.append('patch')
 
     # remove Re:, Fwd:, etc
-    subject = re_re.sub(' ', subject)
+    subject = _re_re.sub(' ', subject)
 
     subject = normalise_space(subject)
 
     prefixes = []
 
-    match = prefix_re.match(subject)
+    match = _prefix_re.match(subject)
 
     while match:
         prefix_str = match.group(1)
@@ -642,7 +679,7 @@ def clean_subject(subject, drop_prefixes=None):
                      if p.lower() not in drop_prefixes]
 
         subject = match.group(2)
-        match = prefix_re.match(subject)
+        match = _prefix_re.match(subject)
 
     subject = normalise_space(subject)
     if prefixes:
@@ -653,13 +690,11 @@ def clean_subject(subject, drop_prefixes=None):
 
 def subject_check(subject):
     """Determine if a mail is a reply."""
-    comment_re = re.compile(r'^(re)[:\s]\s*', re.I)
-
     h = clean_header(subject)
     if not h:
         return False
 
-    return comment_re.match(h)
+    return _comment_re.match(h)
 
 
 def clean_content(content):
@@ -673,11 +708,39 @@ def clean_content(content):
     return content.strip()
 
 
+def _hunk_count(value):
+    if not value:
+        return 1
+    return int(value)
+
+
+def _iter_lines(text):
+    """Iterate over the lines of text, keeping their line endings.
+
+    Only ``\\n`` ends a line, unlike ``str.splitlines()``, which also
+    splits at characters like form feeds that can appear in diffs. This
+    works for both byte and unicode strings on Python 2, and doesn't
+    build a list of every line.
+    """
+    start = 0
+    while True:
+        end = text.find('\n', start) + 1
+        if not end:
+            break
+        yield text[start:end]
+        start = end
+
+    if start < len(text):
+        yield text[start:]
+
+
 def parse_patch(content):
     """Split a mail's contents into a diff and comment.
 
     This is a state machine that takes a patch, generally in UNIX mbox
-    format, and splits it into the component comments and diff.
+    format, and splits it into the component comments and diff. Lines
+    are collected in lists and only joined once parsing is complete, so
+    that the cost is linear in the size of the content.
 
     Args:
         patch: The patch to be split
@@ -689,9 +752,9 @@ def parse_patch(content):
     Raises:
         Exception: The state machine transitioned to an invalid state.
     """
-    patchbuf = ''
-    commentbuf = ''
-    buf = ''
+    patchbuf = []
+    commentbuf = []
+    buf = []
 
     # state specified the line we just saw, and what to expect next
     state = 0
@@ -723,21 +786,44 @@ def parse_patch(content):
     lc = (0, 0)
     hunk = 0
 
-    for line in content.split('\n'):
-        line += '\n'
+    # iterate lazily, rather than splitting into a list, giving every line
+    # including the last a trailing newline
+    add_patch = patchbuf.append
+    for line in _iter_lines(content + '\n'):
+        if state in (4, 5):
+            # checked first as the vast majority of lines are hunk content
+            # every line has at least a newline, so this is always safe
+            first = line[0]
+            if first == '-':
+                lc[0] -= 1
+            elif first == '+':
+                lc[1] -= 1
+            elif first == '\\' and \
+                    line.startswith(r'\ No newline at end of file'):
+                # Special case: Not included as part of the hunk's line count
+                pass
+            else:
+                lc[0] -= 1
+                lc[1] -= 1
 
-        if state == 0:
-            if line.startswith('diff ') or line.startswith('===') \
-                    or line.startswith('Index: '):
+            add_patch(line)
+
+            if lc[0] <= 0 and lc[1] <= 0:
+                state = 3
+                hunk += 1
+            else:
+                state = 5
+        elif state == 0:
+            if line.startswith(('diff ', '===', 'Index: ')):
                 state = 1
-                buf += line
+                buf.append(line)
             elif line.startswith('--- '):
                 state = 2
-                buf += line
+                buf.append(line)
             else:
-                commentbuf += line
+                commentbuf.append(line)
         elif state == 1:
-            buf += line
+            buf.append(line)
             if line.startswith('--- '):
                 state = 2
 
@@ -746,82 +832,61 @@ def parse_patch(content):
         elif state == 2:
             if line.startswith('+++ '):
                 state = 3
-                buf += line
+                buf.append(line)
             elif hunk:
                 state = 1
-                buf += line
+                buf.append(line)
             else:
                 state = 0
-                commentbuf += buf + line
-                buf = ''
+                commentbuf.extend(buf)
+                commentbuf.append(line)
+                buf = []
         elif state == 3:
             match = _hunk_re.match(line)
             if match:
-                def fn(x):
-                    if not x:
-                        return 1
-                    return int(x)
-
-                lc = [fn(x) for x in match.groups()]
+                lc = [_hunk_count(x) for x in match.groups()]
 
                 state = 4
-                patchbuf += buf + line
-                buf = ''
+                patchbuf.extend(buf)
+                patchbuf.append(line)
+                buf = []
             elif line.startswith('--- '):
-                patchbuf += buf + line
-                buf = ''
+                patchbuf.extend(buf)
+                patchbuf.append(line)
+                buf = []
                 state = 2
             elif hunk and line.startswith(r'\ No newline at end of file'):
                 # If we had a hunk and now we see this, it's part of the patch,
                 # and we're still expecting another @@ line.
-                patchbuf += line
+                patchbuf.append(line)
             elif hunk:
                 state = 1
-                buf += line
+                buf.append(line)
             else:
                 state = 0
-                commentbuf += buf + line
-                buf = ''
-        elif state in [4, 5]:
-            if line.startswith('-'):
-                lc[0] -= 1
-            elif line.startswith('+'):
-                lc[1] -= 1
-            elif line.startswith(r'\ No newline at end of file'):
-                # Special case: Not included as part of the hunk's line count
-                pass
-            else:
-                lc[0] -= 1
-                lc[1] -= 1
-
-            patchbuf += line
-
-            if lc[0] <= 0 and lc[1] <= 0:
-                state = 3
-                hunk += 1
-            else:
-                state = 5
+                commentbuf.extend(buf)
+                commentbuf.append(line)
+                buf = []
         elif state == 6:
             if line.startswith(('rename to ', 'rename from ')):
-                patchbuf += buf + line
-                buf = ''
+                patchbuf.extend(buf)
+                patchbuf.append(line)
+                buf = []
             elif line.startswith('--- '):
-                patchbuf += buf + line
-                buf = ''
+                patchbuf.extend(buf)
+                patchbuf.append(line)
+                buf = []
                 state = 2
             else:
-                buf += line
+                buf.append(line)
                 state = 1
         else:
             raise Exception("Unknown state %d! (line '%s')" % (state, line))
 
-    commentbuf += buf
-
-    if patchbuf == '':
-        patchbuf = None
+    commentbuf.extend(buf)
 
-    if commentbuf == '':
-        commentbuf = None
+    patchbuf = ''.join(patchbuf) or None
+    commentbuf = ''.join(commentbuf) or None
 
     return patchbuf, commentbuf
 
@@ -839,33 +904,29 @@ def parse_pull_request(content):
 
 def find_state(mail):
     """Return the state with the given name or the default."""
-    state_name = clean_header(mail.get('X-Patchwork-State', ''))
+    state_name = ParsedMail.wrap(mail).header('X-Patchwork-State')
     if state_name:
-        try:
-            return State.objects.get(name__iexact=state_name)
-        except State.DoesNotExist:
-            pass
-    return get_default_initial_patch_state()
+        state = lookups.get_state(state_name)
+        if state:
+            return state
+    return lookups.get_default_state()
 
 
 def find_delegate_by_filename(project, filenames):
     if not filenames:
         return None
 
-    rules = list(DelegationRule.objects.filter(project=project))
+    matcher = lookups.get_delegation_matcher(project)
 
     patch_delegate = None
 
     for filename in filenames:
-        file_delegate = None
-        for rule in rules:
-            if fnmatch(filename, rule.path):
-                file_delegate = rule.user
-                break
-
-        if file_delegate is None:
+        rule = matcher.match(filename)
+        if rule is None:
             return None
 
+        file_delegate = rule.user
+
         if patch_delegate is not None and file_delegate != patch_delegate:
             return None
 
@@ -876,7 +937,7 @@ def find_delegate_by_filename(project, filenames):
 
 def find_delegate_by_header(mail):
     """Return the delegate with the given email or None."""
-    delegate_email = clean_header(mail.get('X-Patchwork-Delegate', ''))
+    delegate_email = ParsedMail.wrap(mail).header('X-Patchwork-Delegate')
     if delegate_email:
         try:
             return User.objects.get(email__iexact=delegate_email)
@@ -886,17 +947,20 @@ def find_delegate_by_header(mail):
     return None
 
 
-def parse_mail(mail, list_id=None):
-    """Parse a mail and add to the database.
+def check_mail(mail):
+    """Run some basic sanity checks on a mail.
 
     Args:
-        mail (`mbox.Mail`): Mail to parse and add.
-        list_id (str): Mailing list ID
+        mail (`mbox.Mail`): Mail to check.
 
     Returns:
-        Patch, CoverLetter, Comment or None
+        False if the mail should be ignored, else True
+
+    Raises:
+        ValueError: A required header is missing.
     """
-    # some basic sanity checks
+    mail = ParsedMail.wrap(mail)
+
     if 'From' not in mail:
         raise ValueError("Missing 'From' header")
 
@@ -906,9 +970,196 @@ def parse_mail(mail, list_id=None):
     if 'Message-Id' not in mail:
         raise ValueError("Missing 'Message-Id' header")
 
-    hint = clean_header(mail.get('X-Patchwork-Hint', ''))
+    hint = mail.header('X-Patchwork-Hint')
     if hint and hint.lower() == 'ignore':
         logger.debug("Ignoring email due to 'ignore' hint")
+        return False
+
+    return True
+
+
+class ParsedMail(object):
+    """A mail, along with the values parsed from it.
+
+    Each header is decoded at most once, and each value derived from
+    the mail is computed at most once, on first access. The same
+    instance should be passed through the whole parsing pipeline so
+    that no work is repeated. Instances can be pickled, meaning mails
+    can be parsed in one process and saved from another.
+
+    Args:
+        mail (`mbox.Mail`): The mail to parse.
+        linkname (str): Link name of the project the mail belongs to.
+            This is dropped from the subject prefixes.
+    """
+
+    # values that depend on the project's link name
+    _linkname_values = ('_subject', 'name', 'prefixes', 'series_marker',
+                        'version')
+
+    def __init__(self, mail, linkname=None):
+        self.mail = mail
+        self._linkname = linkname
+        self._header_cache = {}
+
+    @classmethod
+    def wrap(cls, mail, linkname=None):
+        """Return a ``ParsedMail`` for a mail, reusing it if possible."""
+        if not isinstance(mail, cls):
+            return cls(mail, linkname)
+
+        if linkname is not None:
+            mail.linkname = linkname
+
+        return mail
+
+    @property
+    def linkname(self):
+        return self._linkname
+
+    @linkname.setter
+    def linkname(self, value):
+        if value != self._linkname:
+            for name in self._linkname_values:
+                self.__dict__.pop(name, None)
+        self._linkname = value
+
+    def __contains__(self, name):
+        return name in self.mail
+
+    def get(self, name, failobj=None):
+        return self.mail.get(name, failobj)
+
+    def get_all(self, name, failobj=None):
+        return self.mail.get_all(name, failobj)
+
+    def items(self):
+        return self.mail.items()
+
+    def header(self, name):
+        """Return the decoded value of a header, or None if missing."""
+        key = name.lower()
+        if key not in self._header_cache:
+            value = self.mail.get(name)
+            if value is not None:
+                value = clean_header(value)
+            self._header_cache[key] = value
+
+        return self._header_cache[key]
+
+    def parse(self):
+        """Parse everything that does not need the database.
+
+        Returns:
+            This instance
+
+        Raises:
+            ValueError: The mail has a broken header.
+        """
+        if not self.msgid:
+            raise ValueError("Broken 'Message-Id' header")
+
+        for name in ('author', 'name', 'is_comment', 'series_marker',
+                     'version', 'refs', 'date', 'headers', 'pull_url'):
+            getattr(self, name)
+
+        return self
+
+    @cached_property
+    def msgid(self):
+        msgid = self.header('Message-Id')
+        if not msgid:
+            return None
+        return msgid[:255]
+
+    @cached_property
+    def list_ids(self):
+        return find_list_ids(self)
+
+    @cached_property
+    def author(self):
+        return parse_author(self)
+
+    @cached_property
+    def _subject(self):
+        subject = self.header('Subject')
+        if subject is None:
+            raise ValueError("Invalid 'Subject' header")
+
+        return _clean_subject(subject, [self.linkname] if self.linkname
+                              else None)
+
+    @cached_property
+    def name(self):
+        return self._subject[0]
+
+    @cached_property
+    def prefixes(self):
+        return self._subject[1]
+
+    @cached_property
+    def is_comment(self):
+        subject = self.header('Subject')
+        return bool(subject and _comment_re.match(subject))
+
+    @cached_property
+    def series_marker(self):
+        return parse_series_marker(self.prefixes)
+
+    @cached_property
+    def version(self):
+        return parse_version(self.name, self.prefixes)
+
+    @cached_property
+    def refs(self):
+        return find_references(self)
+
+    @cached_property
+    def date(self):
+        return find_date(self)
+
+    @cached_property
+    def headers(self):
+        return find_headers(self)
+
+    @cached_property
+    def content(self):
+        if self.is_comment:
+            return find_comment_content(self.mail)
+        return find_patch_content(self.mail)
+
+    @property
+    def diff(self):
+        return self.content[0]
+
+    @property
+    def message(self):
+        return self.content[1]
+
+    @cached_property
+    def pull_url(self):
+        return parse_pull_request(self.message)
+
+    @cached_property
+    def filenames(self):
+        if not self.diff:
+            return []
+        return find_filenames(self.diff)
+
+
+def parse_mail(mail, list_id=None):
+    """Parse a mail and add to the database.
+
+    Args:
+        mail (`mbox.Mail`): Mail to parse and add.
+        list_id (str): Mailing list ID
+
+    Returns:
+        Patch, CoverLetter, Comment or None
+    """
+    mail = ParsedMail.wrap(mail)
+
+    if not check_mail(mail):
         return
 
     if list_id:
@@ -920,36 +1171,44 @@ def parse_mail(mail, list_id=None):
         logger.error('Failed to find a project for email')
         return
 
-    # parse metadata
+    return save_mail(mail, project)
+
+
+def save_mail(mail, project):
+    """Add a mail to the database.
+
+    Args:
+        mail (`mbox.Mail` or ParsedMail): Mail to add. This can be
+            parsed ahead of time using :meth:`ParsedMail.parse`.
+        project (patchwork.Project): Project the mail belongs to.
+
+    Returns:
+        Patch, CoverLetter, Comment or None
 
-    msgid = clean_header(mail.get('Message-Id'))
-    if not msgid:
-        raise ValueError("Broken 'Message-Id' header")
-    msgid = msgid[:255]
+    Raises:
+        ValueError: The mail has a broken header.
+    """
+    mail = ParsedMail.wrap(mail, project.linkname)
+    mail.parse()
+
+    msgid = mail.msgid
+    name = mail.name
+    is_comment = mail.is_comment
+    x, n = mail.series_marker
+    version = mail.version
+    refs = mail.refs
+    date = mail.date
+    headers = mail.headers
+    diff = mail.diff
+    message = mail.message
+    pull_url = mail.pull_url
 
     author = find_author(mail)
-    subject = mail.get('Subject')
-    name, prefixes = clean_subject(subject, [project.linkname])
-    is_comment = subject_check(subject)
-    x, n = parse_series_marker(prefixes)
-    version = parse_version(name, prefixes)
-    refs = find_references(mail)
-    date = find_date(mail)
-    headers = find_headers(mail)
-
-    # parse content
-
-    if not is_comment:
-        diff, message = find_patch_content(mail)
-    else:
-        diff, message = find_comment_content(mail)
 
     if not (diff or message):
         logger.error("Couldn't find patch or comment content")
         return  # nothing to work with
 
-    pull_url = parse_pull_request(message)
-
     # build objects
 
     if not is_comment and (diff or pull_url):  # patches or pull requests
@@ -958,14 +1217,13 @@ def parse_mail(mail, list_id=None):
 
         delegate = find_delegate_by_header(mail)
         if not delegate and diff:
-            filenames = find_filenames(diff)
-            delegate = find_delegate_by_filename(project, filenames)
+            delegate = find_delegate_by_filename(project, mail.filenames)
 
         # if we don't have a series marker, we will never have an existing
         # series to match against.
         series = None
         if n:
-            series = find_series(project, mail)
+            series = find_series(project, mail, author)
         else:
             x = n = 1
 
@@ -987,19 +1245,25 @@ def parse_mail(mail, list_id=None):
             # received first. Without storing references, it would not
             # be possible to identify the relationship between patches
             # as the earlier patch does not reference the later one.
+            new_refs = []
+            entries = MessageIndex.objects.lookup(project, refs + [msgid])
             for ref in refs + [msgid]:
                 ref = ref[:255]
-                # we don't want duplicates
-                try:
-                    # we could have a ref to a previous series. (For
-                    # example, a series sent in reply to another
-                    # series.) That should not create a series ref
-                    # for this series, so check for the msg-id only,
-                    # not the msg-id/series pair.
-                    SeriesReference.objects.get(msgid=ref,
-                                                series__project=project)
-                except SeriesReference.DoesNotExist:
-                    SeriesReference.objects.create(series=series, msgid=ref)
+                # we don't want duplicates. We could have a ref to a
+                # previous series. (For example, a series sent in reply
+                # to another series.) That should not create a series
+                # ref for this series, so check for the msg-id only, not
+                # the msg-id/series pair.
+                entry = entries.get(ref)
+                if ref in new_refs or (entry and entry.series_id):
+                    continue
+                new_refs.append(ref)
+
+            SeriesReference.objects.bulk_create([
+                SeriesReference(series=series, msgid=ref)
+                for ref in new_refs])
+            MessageIndex.objects.record(project.id, [
+                (ref, None, series.id, False) for ref in new_refs])
 
         patch = Patch(
             msgid=msgid,
@@ -1030,14 +1294,9 @@ def parse_mail(mail, list_id=None):
         is_cover_letter = False
         if not is_comment:
             if not refs == []:
-                try:
-                    CoverLetter.objects.all().get(name=name)
-                except CoverLetter.DoesNotExist:
-                    # if no match, this is a new cover letter
-                    is_cover_letter = True
-                except CoverLetter.MultipleObjectsReturned:
-                    # if multiple cover letters are found, just ignore
-                    pass
+                # if no match, this is a new cover letter
+                is_cover_letter = not CoverLetter.objects.filter(
+                    project=project, name=name).exists()
             else:
                 is_cover_letter = True
 
@@ -1048,11 +1307,8 @@ def parse_mail(mail, list_id=None):
             # always be the first item in a thread, thus the references
             # could only point to a different series or unrelated
             # message
-            try:
-                series = SeriesReference.objects.get(
-                    msgid=msgid, series__project=project).series
-            except SeriesReference.DoesNotExist:
-                series = None
+            entry = MessageIndex.objects.lookup(project, [msgid]).get(msgid)
+            series = entry.series if entry else None
 
             if not series:
                 series = Series(project=project,
@@ -1132,3 +1388,51 @@ def find_filenames(diff):
     filenames = sorted(filenames.keys())
 
     return filenames
+
+
+def find_diffstat(diff):
+    """Count the files and lines changed by a diff.
+
+    Lines are counted within hunks only, using the line counts in the
+    hunk headers, so that lines of text which happen to start with a
+    ``+`` or ``-`` aren't counted. Files are counted using the ``diff``
+    headers of git diffs, which are present even for changes without
+    hunks such as renames, or using the ``+++`` headers otherwise.
+
+    Args:
+        diff (str): The diff of a patch.
+
+    Returns:
+        A tuple of the number of files changed, lines added and lines
+        removed.
+    """
+    added = removed = 0
+    headers = files = 0
+    lc = [0, 0]
+
+    for line in _iter_lines(diff):
+        # lines may end with CRLF, and the last may have no line ending
+        line = line.rstrip('\r\n')
+        if lc[0] > 0 or lc[1] > 0:
+            # blank context lines may have lost their leading space
+            first = line[:1]
+            if first == '-':
+                removed += 1
+                lc[0] -= 1
+            elif first == '+':
+                added += 1
+                lc[1] -= 1
+            elif first != '\\':
+                lc[0] -= 1
+                lc[1] -= 1
+            continue
+
+        match = _hunk_re.match(line)
+        if match:
+            lc = [_hunk_count(x) for x in match.groups()]
+        elif line.startswith('diff '):
+            headers += 1
+        elif line.startswith('+++ '):
+            files += 1
+
+    return headers or files, added, removed
@@ -0,0 +1,368 @@
+# Patchwork - automated patch tracking system
+#
+# This file is part of the Patchwork package.
+#
+# Patchwork is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Patchwork is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Patchwork; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+"""Full-text search of patches and cover letters.
+
+Each submission is indexed using its subject and a body made up of its
+commit message or cover letter and, depending on the
+``SEARCH_INDEX_DIFFS`` and ``SEARCH_INDEX_COMMENTS`` settings, its diff
+and the content of its comments. The body isn't stored in the
+:class:`~patchwork.models.SearchDocument` of the submission, as it would
+be an uncompressed copy of text stored elsewhere. Instead, each backend
+only stores what its index needs.
+
+How documents are indexed and searched depends on the database, using a
+backend chosen by the database vendor. With PostgreSQL, a ``tsvector``
+column is indexed using GIN. With SQLite, an FTS5 table, which keeps
+its own copy of the text, is used. Both are created by migrations.
+Other databases fall back to matching each word of a query anywhere in
+the subject, as do searches of submissions which haven't been indexed.
+"""
+
+from django.conf import settings
+from django.db import connections
+from django.db import DEFAULT_DB_ALIAS
+from django.db import transaction
+from django.db.models import Q
+
+from patchwork.models import Comment
+from patchwork.models import Patch
+from patchwork.models import SearchDocument
+from patchwork.models import Submission
+
+# name of the FTS5 table used with SQLite
+SQLITE_FTS_TABLE = 'patchwork_searchdocument_fts'
+
+
+class SearchBackend(object):
+    """Search submissions by matching the words of a query in the subject.
+
+    This is used for databases without supported full-text search,
+    where searching the body would mean scanning all of the text
+    stored. Results aren't ranked.
+
+    Args:
+        using (str): The alias of the database to search.
+    """
+
+    def __init__(self, using):
+        self.using = using
+
+    @property
+    def connection(self):
+        return connections[self.using]
+
+    def documents(self):
+        return SearchDocument.objects.using(self.using)
+
+    @staticmethod
+    def match_subject(query):
+        """Match each word of a query anywhere in the subject.
+
+        Returns:
+            A ``Q`` object filtering submissions
+        """
+        match = Q()
+        for word in query.split():
+            match &= Q(name__icontains=word)
+        return match
+
+    def match(self, query):
+        """Find the submissions matching a query.
+
+        Returns:
+            A ``Q`` object filtering submissions
+        """
+        return self.match_subject(query)
+
+    def rank_sql(self, column, query):
+        """Return the SQL to rank the document for a submission.
+
+        Args:
+            column (str): The quoted column holding the submission's ID.
+            query (str): The words to search for.
+
+        Returns:
+            A tuple of the SQL expression, where higher values are better
+            matches, and its parameters
+        """
+        return '0', []
+
+    def write(self, documents):
+        """Replace the documents of a number of submissions.
+
+        Args:
+            documents (list): ``(submission_id, title, body)`` tuples.
+        """
+        with transaction.atomic(using=self.using):
+            self.documents().filter(submission__in=[
+                submission_id for submission_id, _, _ in documents]).delete()
+            self.documents().bulk_create([
+                SearchDocument(submission_id=submission_id, title=title)
+                for submission_id, title, _ in documents])
+
+    def append(self, submission_id, text):
+        """Add text to the body of an existing document.
+
+        This allows text, such as a new comment, to be indexed without
+        rebuilding the whole document.
+        """
+
+    def remove(self, submission_id):
+        """Remove a document, which has been deleted, from the index."""
+
+
+class FullTextSearchBackend(SearchBackend):
+    """Search submissions using the database's full-text search.
+
+    Submissions without a document, such as those stored before
+    upgrading which haven't been indexed by the ``reindex`` command yet,
+    are matched by their subject instead.
+    """
+
+    def match_documents(self, query):
+        """Find the documents matching a query.
+
+        Returns:
+            A queryset of the matching ``SearchDocument`` instances
+        """
+        raise NotImplementedError
+
+    def match(self, query):
+        return Q(pk__in=self.match_documents(query).values('submission')) | (
+            Q(search_document__isnull=True) & self.match_subject(query))
+
+
+class PostgreSQLSearchBackend(FullTextSearchBackend):
+    """Search documents using PostgreSQL's full-text search.
+
+    The ``vector`` column of each document holds its ``tsvector``, with
+    the title given more weight than the body.
+    """
+
+    tsquery = "plainto_tsquery('pg_catalog.english', %s)"
+    tsvector = "setweight(to_tsvector('pg_catalog.english', %%s), '%s')"
+
+    def match_documents(self, query):
+        return self.documents().extra(
+            where=['vector @@ ' + self.tsquery], params=[query])
+
+    def rank_sql(self, column, query):
+        return ('COALESCE((SELECT ts_rank(vector, %s) FROM '
+                'patchwork_searchdocument WHERE submission_id = %s), 0)' % (
+                    self.tsquery, column),
+                [query])
+
+    def write(self, documents):
+        with transaction.atomic(using=self.using):
+            super(PostgreSQLSearchBackend, self).write(documents)
+            with self.connection.cursor() as cursor:
+                cursor.executemany(
+                    'UPDATE patchwork_searchdocument SET vector = %s || %s '
+                    'WHERE submission_id = %%s' % (
+                        self.tsvector % 'A', self.tsvector % 'B'),
+                    [(title, body, submission_id)
+                     for submission_id, title, body in documents])
+
+    def append(self, submission_id, text):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                'UPDATE patchwork_searchdocument SET vector = vector || %s '
+                'WHERE submission_id = %%s' % (self.tsvector % 'B'),
+                [text, submission_id])
+
+
+class SQLiteSearchBackend(FullTextSearchBackend):
+    """Search documents using SQLite's FTS5 extension.
+
+    The rows of the FTS5 table use the ID of the submission as their
+    ``rowid``.
+    """
+
+    @staticmethod
+    def _fts_query(query):
+        # quote each word, so characters in the query aren't treated as
+        # FTS5 query syntax
+        return ' '.join('"%s"' % word.replace('"', '""')
+                        for word in query.split())
+
+    def match_documents(self, query):
+        return self.documents().extra(
+            where=['submission_id IN (SELECT rowid FROM %s WHERE %s MATCH '
+                   '%%s)' % (SQLITE_FTS_TABLE, SQLITE_FTS_TABLE)],
+            params=[self._fts_query(query)])
+
+    def rank_sql(self, column, query):
+        # bm25() is lower for better matches. Matches in the title are
+        # given more weight than those in the body
+        return ('COALESCE((SELECT -bm25(%s, 10.0, 1.0) FROM %s WHERE %s '
+                'MATCH %%s AND rowid = %s), 0)' % (
+                    SQLITE_FTS_TABLE, SQLITE_FTS_TABLE, SQLITE_FTS_TABLE,
+                    column),
+                [self._fts_query(query)])
+
+    def write(self, documents):
+        # the old rows are removed from the FTS5 table as the old
+        # documents are deleted
+        with transaction.atomic(using=self.using):
+            super(SQLiteSearchBackend, self).write(documents)
+            with self.connection.cursor() as cursor:
+                cursor.executemany(
+                    'INSERT INTO %s (rowid, title, body) '
+                    'VALUES (%%s, %%s, %%s)' % SQLITE_FTS_TABLE, documents)
+
+    def append(self, submission_id, text):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                "UPDATE %s SET body = CASE WHEN body = '' THEN %%s "
+                "ELSE body || %%s END WHERE rowid = %%s" % SQLITE_FTS_TABLE,
+                [text, '\n\n' + text, submission_id])
+
+    def remove(self, submission_id):
+        with self.connection.cursor() as cursor:
+            cursor.execute('DELETE FROM %s WHERE rowid = %%s' %
+                           SQLITE_FTS_TABLE, [submission_id])
+
+
+_backends = {}
+
+
+def get_backend(using=DEFAULT_DB_ALIAS):
+    """Return the search backend for a database.
+
+    Args:
+        using (str): The alias of the database.
+
+    Returns:
+        A :class:`SearchBackend` instance
+    """
+    connection = connections[using]
+    # the database used for an alias changes when testing
+    key = (using, connection.settings_dict['NAME'])
+    backend = _backends.get(key)
+    if backend is not None:
+        return backend
+
+    cls = SearchBackend
+    if connection.vendor == 'postgresql':
+        cls = PostgreSQLSearchBackend
+    elif connection.vendor == 'sqlite':
+        # the FTS5 table is only created if SQLite supports FTS5
+        with connection.cursor() as cursor:
+            if SQLITE_FTS_TABLE in connection.introspection.table_names(
+                    cursor):
+                cls = SQLiteSearchBackend
+
+    backend = _backends[key] = cls(using)
+    return backend
+
+
+def search_submissions(queryset, query):
+    """Filter a queryset of submissions by a search query.
+
+    Submissions are annotated with a ``search_rank`` attribute, which
+    is higher for better matches and can be used to order them.
+
+    Args:
+        queryset (QuerySet): The submissions to search, such as patches.
+        query (str): The words to search for.
+
+    Returns:
+        The filtered queryset
+    """
+    backend = get_backend(queryset.db)
+    connection = connections[queryset.db]
+    opts = queryset.model._meta
+    column = '%s.%s' % (connection.ops.quote_name(opts.db_table),
+                        connection.ops.quote_name(opts.pk.column))
+    rank, params = backend.rank_sql(column, query)
+
+    return queryset.filter(backend.match(query)).extra(
+        select={'search_rank': rank}, select_params=params)
+
+
+def _build_documents(submission_ids):
+    rows = list(Submission.objects.filter(
+        id__in=submission_ids).values_list('id', 'name', 'content'))
+    bodies = dict((submission_id, [content] if content else [])
+                  for submission_id, _, content in rows)
+
+    if settings.SEARCH_INDEX_DIFFS:
+        for patch_id, diff in Patch.objects.filter(
+                id__in=submission_ids).values_list('id', 'diff'):
+            if diff:
+                bodies[patch_id].append(diff)
+
+    if settings.SEARCH_INDEX_COMMENTS:
+        for submission_id, content in Comment.objects.filter(
+                submission__in=submission_ids).order_by(
+                    'submission', 'id').values_list('submission', 'content'):
+            if content:
+                bodies[submission_id].append(content)
+
+    return [(submission_id, name, '\n\n'.join(bodies[submission_id]))
+            for submission_id, name, _ in rows]
+
+
+def update_documents(submission_ids, chunk_size=500, existing=False):
+    """Rebuild the search documents of a number of submissions.
+
+    Args:
+        submission_ids (list): The IDs of the submissions.
+        chunk_size (int): Number of submissions to load and update at
+            once.
+        existing (bool): Only rebuild documents which already exist.
+            This is used for changes to comments, which may be deleted
+            along with their submission.
+
+    Returns:
+        The number of documents written
+    """
+    backend = get_backend()
+    submission_ids = sorted(set(submission_ids))
+    count = 0
+
+    for i in range(0, len(submission_ids), chunk_size):
+        chunk = submission_ids[i:i + chunk_size]
+        if existing:
+            chunk = list(SearchDocument.objects.filter(
+                submission__in=chunk).values_list('submission', flat=True))
+        documents = _build_documents(chunk)
+        backend.write(documents)
+        count += len(documents)
+
+    return count
+
+
+def add_comments(comments):
+    """Add new comments to the search documents of their submissions.
+
+    Only the text of the comments is indexed, rather than rebuilding
+    each document from its submission and all of its comments.
+
+    Args:
+        comments (list): The new ``Comment`` instances, in the order
+            they were received.
+    """
+    if not settings.SEARCH_INDEX_COMMENTS:
+        return
+
+    backend = get_backend()
+    for comment in comments:
+        if comment.content:
+            backend.append(comment.submission_id, comment.content)
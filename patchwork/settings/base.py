@@ -157,7 +157,7 @@ REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': (
         'patchwork.compat.DjangoFilterBackend',
         'rest_framework.filters.SearchFilter',
-        'rest_framework.filters.OrderingFilter',
+        'patchwork.api.base.OrderingFilter',
     ),
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework.authentication.SessionAuthentication',
@@ -227,6 +227,32 @@ LOGGING = {
 
 DEFAULT_ITEMS_PER_PAGE = 100
 
+# Lists with more items than this, according to the database's estimate, are
+# paginated using the estimate rather than counting the items. Estimates are
+# only available with PostgreSQL. Set to None to always count items
+PAGINATOR_ESTIMATE_THRESHOLD = None
+
+# Number of seconds for which the number of items in a list is cached. Set to
+# 0 to disable caching
+PAGINATOR_COUNT_CACHE_TIMEOUT = 0
+
+# Pages starting further than this many items from either end of a list are
+# fetched relative to the previous or next page, rather than by skipping over
+# all the items before them. Set to None to disable
+PAGINATOR_MAX_OFFSET = None
+
+# Include the diffs of patches and the content of comments in the full-text
+# search index, in addition to the subject and commit message or cover letter.
+# Run the 'reindex' management command after changing these
+SEARCH_INDEX_DIFFS = False
+SEARCH_INDEX_COMMENTS = False
+
+# The diffs, contents and headers of mails which are at least this many
+# characters long are stored compressed. Set to None to store new values
+# uncompressed. Run the 'compresstext' management command to apply this to
+# existing values
+TEXT_COMPRESSION_MIN_LENGTH = 1024
+
 CONFIRMATION_VALIDITY_DAYS = 7
 
 NOTIFICATION_DELAY_MINUTES = 10
@@ -241,6 +267,12 @@ ENABLE_REST_API = True
 
 REST_RESULTS_PER_PAGE = 30
 
+# Number of seconds for which projects, states, tags and delegation rules
+# are cached by each process. Changes made from the same process, or from
+# any process if the default cache is shared like memcached, are seen
+# immediately, regardless of this setting
+LOOKUP_CACHE_TIMEOUT = 60
+
 # Set to True to enable redirections or URLs from previous versions
 # of patchwork
 COMPAT_REDIR = True
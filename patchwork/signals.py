@@ -19,17 +19,30 @@
 
 from datetime import datetime as dt
 
+from django.conf import settings
+from django.db.models.signals import post_delete
 from django.db.models.signals import post_save
 from django.db.models.signals import pre_save
 from django.dispatch import receiver
 
+from patchwork import lookups
+from patchwork import search
 from patchwork.models import Check
+from patchwork.models import Comment
 from patchwork.models import CoverLetter
+from patchwork.models import DelegationRule
 from patchwork.models import Event
+from patchwork.models import MessageIndex
 from patchwork.models import Patch
 from patchwork.models import PatchChangeNotification
+from patchwork.models import Project
+from patchwork.models import SearchDocument
 from patchwork.models import Series
 from patchwork.models import SeriesPatch
+from patchwork.models import SeriesReference
+from patchwork.models import State
+from patchwork.models import Submission
+from patchwork.models import Tag
 
 
 @receiver(pre_save, sender=Patch)
@@ -42,13 +55,13 @@ def patch_change_callback(sender, instance, **kwargs):
         return
 
     try:
-        orig_patch = Patch.objects.get(pk=instance.pk)
+        orig_state_id = instance.get_original('state_id')
     except Patch.DoesNotExist:
         return
 
     # If there's no interesting changes, abort without creating the
     # notification
-    if orig_patch.state == instance.state:
+    if orig_state_id == instance.state_id:
         return
 
     notification = None
@@ -59,8 +72,8 @@ def patch_change_callback(sender, instance, **kwargs):
 
     if notification is None:
         notification = PatchChangeNotification(patch=instance,
-                                               orig_state=orig_patch.state)
-    elif notification.orig_state == instance.state:
+                                               orig_state_id=orig_state_id)
+    elif notification.orig_state_id == instance.state_id:
         # If we're back at the original state, there is no need to notify
         notification.delete()
         return
@@ -69,6 +82,96 @@ def patch_change_callback(sender, instance, **kwargs):
     notification.save()
 
 
+@receiver([post_save, post_delete], sender=Project)
+@receiver([post_save, post_delete], sender=State)
+@receiver([post_save, post_delete], sender=Tag)
+@receiver([post_save, post_delete], sender=DelegationRule)
+def invalidate_lookups(sender, **kwargs):
+    lookups.invalidate()
+
+
+@receiver(post_save, sender=Submission)
+@receiver(post_save, sender=CoverLetter)
+@receiver(post_save, sender=Patch)
+def index_submission(sender, instance, created, **kwargs):
+    if not created:
+        return
+
+    MessageIndex.objects.record(instance.project_id, [
+        (instance.msgid, instance.id, None, True)])
+
+
+@receiver(post_save, sender=Comment)
+def index_comment(sender, instance, created, **kwargs):
+    if not created:
+        return
+
+    MessageIndex.objects.record(instance.submission.project_id, [
+        (instance.msgid, instance.submission_id, None, False)])
+
+
+@receiver(post_delete, sender=Comment)
+def unindex_comment(sender, instance, **kwargs):
+    # leave the entry alone if it's for a submission with the same msgid
+    MessageIndex.objects.filter(
+        msgid=instance.msgid[:255], submission=instance.submission_id,
+    ).exclude(submission__msgid=instance.msgid).update(submission=None)
+
+
+@receiver(post_save, sender=Submission)
+@receiver(post_save, sender=CoverLetter)
+@receiver(post_save, sender=Patch)
+def update_search_document(sender, instance, created, **kwargs):
+    # changes to patches, like their state, don't usually affect the text
+    if not created and isinstance(instance, Patch) and not any(
+            instance.has_changed(name) for name in ('name', 'content',
+                                                    'diff')):
+        return
+
+    search.update_documents([instance.id])
+
+
+@receiver(post_save, sender=Comment)
+def update_comment_search_document(sender, instance, created, **kwargs):
+    if not settings.SEARCH_INDEX_COMMENTS:
+        return
+
+    # new comments are added to the document, while rarer changes to
+    # existing comments rebuild it
+    if created:
+        search.add_comments([instance])
+    else:
+        search.update_documents([instance.submission_id], existing=True)
+
+
+@receiver(post_delete, sender=Comment)
+def remove_comment_search_document(sender, instance, **kwargs):
+    if not settings.SEARCH_INDEX_COMMENTS:
+        return
+
+    search.update_documents([instance.submission_id], existing=True)
+
+
+@receiver(post_delete, sender=SearchDocument)
+def remove_search_document(sender, instance, using, **kwargs):
+    search.get_backend(using).remove(instance.submission_id)
+
+
+@receiver(post_save, sender=SeriesReference)
+def index_series_reference(sender, instance, created, **kwargs):
+    if not created or instance.series.project_id is None:
+        return
+
+    MessageIndex.objects.record(instance.series.project_id, [
+        (instance.msgid, None, instance.series_id, False)])
+
+
+@receiver(post_delete, sender=SeriesReference)
+def unindex_series_reference(sender, instance, **kwargs):
+    MessageIndex.objects.filter(
+        msgid=instance.msgid, series=instance.series_id).update(series=None)
+
+
 @receiver(post_save, sender=CoverLetter)
 def create_cover_created_event(sender, instance, created, **kwargs):
 
@@ -107,19 +210,22 @@ def create_patch_state_changed_event(sender, instance, **kwargs):
             project=patch.project,
             patch=patch,
             category=Event.CATEGORY_PATCH_STATE_CHANGED,
-            previous_state=before,
-            current_state=after)
+            previous_state_id=before,
+            current_state_id=after)
 
     # only trigger on updated items
     if not instance.pk:
         return
 
-    orig_patch = Patch.objects.get(pk=instance.pk)
+    try:
+        orig_state_id = instance.get_original('state_id')
+    except Patch.DoesNotExist:
+        return
 
-    if orig_patch.state == instance.state:
+    if orig_state_id == instance.state_id:
         return
 
-    create_event(instance, orig_patch.state, instance.state)
+    create_event(instance, orig_state_id, instance.state_id)
 
 
 @receiver(pre_save, sender=Patch)
@@ -130,19 +236,22 @@ def create_patch_delegated_event(sender, instance, **kwargs):
             project=patch.project,
             patch=patch,
             category=Event.CATEGORY_PATCH_DELEGATED,
-            previous_delegate=before,
-            current_delegate=after)
+            previous_delegate_id=before,
+            current_delegate_id=after)
 
     # only trigger on updated items
     if not instance.pk:
         return
 
-    orig_patch = Patch.objects.get(pk=instance.pk)
+    try:
+        orig_delegate_id = instance.get_original('delegate_id')
+    except Patch.DoesNotExist:
+        return
 
-    if orig_patch.delegate == instance.delegate:
+    if orig_delegate_id == instance.delegate_id:
         return
 
-    create_event(instance, orig_patch.delegate, instance.delegate)
+    create_event(instance, orig_delegate_id, instance.delegate_id)
 
 
 @receiver(post_save, sender=SeriesPatch)
@@ -0,0 +1,237 @@
+# Patchwork - automated patch tracking system
+#
+# This file is part of the Patchwork package.
+#
+# Patchwork is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Patchwork is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Patchwork; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+"""Counting of tags, like Acked-by, in patches and comments."""
+
+from collections import Counter
+from collections import deque
+import multiprocessing
+import re
+
+from django.db import transaction
+
+from patchwork.db import bulk_update
+from patchwork.models import Comment
+from patchwork.models import Patch
+from patchwork.models import PatchTag
+from patchwork.models import Tag
+
+_FLAGS = re.MULTILINE | re.IGNORECASE
+
+# patterns using backreferences can't be renumbered into a combined regex
+_backref_re = re.compile(r'\\[1-9]|\(\?P=')
+
+# Python 2 limits the number of groups in a pattern to 100
+_MAX_GROUPS = 90
+
+
+class TagMatcher(object):
+    """Count the tags in a piece of content.
+
+    This is equivalent to counting the matches of each tag's pattern
+    using :func:`re.findall`, but the patterns are combined into a
+    single regex so content is only scanned once, however many tags
+    there are. As a result, where matches for two different tags
+    overlap, only the first is counted. This can't happen for patterns
+    anchored to the start of a line, like the default tags.
+
+    Args:
+        tags (list): The tags to count. Each must have a ``pattern``
+            attribute.
+    """
+
+    def __init__(self, tags):
+        self.tags = list(tags)
+        # regexes combining the patterns of several tags
+        self._patterns = []
+        # (tag, regex) for patterns that must be matched separately
+        self._separate = []
+
+        chunk = []
+        groups = 0
+
+        for index, tag in enumerate(self.tags):
+            regex = re.compile(tag.pattern, _FLAGS)
+            if _backref_re.search(tag.pattern) or \
+                    regex.groups >= _MAX_GROUPS:
+                self._separate.append((tag, regex))
+                continue
+
+            if groups + regex.groups + 1 > _MAX_GROUPS:
+                self._combine(chunk)
+                chunk = []
+                groups = 0
+
+            chunk.append(index)
+            groups += regex.groups + 1
+
+        self._combine(chunk)
+
+    def _combine(self, chunk):
+        if not chunk:
+            return
+
+        # the empty group after each pattern identifies the matching tag
+        regex = '|'.join('(?:%s)(?P<t%d>)' % (self.tags[index].pattern,
+                                              index) for index in chunk)
+        self._patterns.append(re.compile(regex, _FLAGS))
+
+    def count(self, content):
+        """Count the tags in a piece of content.
+
+        Returns:
+            A :class:`collections.Counter` of tags, holding only tags
+            which were found
+        """
+        counts = Counter()
+        if not content:
+            return counts
+
+        for pattern in self._patterns:
+            for match in pattern.finditer(content):
+                counts[self.tags[int(match.lastgroup[1:])]] += 1
+
+        for tag, regex in self._separate:
+            count = len(regex.findall(content))
+            if count:
+                counts[tag] = count
+
+        return counts
+
+
+_matcher = None
+
+
+def _init_worker(tags):
+    global _matcher
+
+    _matcher = TagMatcher(tags)
+
+
+def _count_chunk(rows):
+    """Count the tags of a chunk of patches.
+
+    Args:
+        rows (list): A list of ``(patch ID, contents)`` tuples, where
+            contents is a list of the content of the patch and each of
+            its comments.
+
+    Returns:
+        A list of ``(patch ID, tag ID, count)`` tuples, for tags found
+    """
+    result = []
+    for patch_id, contents in rows:
+        counts = Counter()
+        for content in contents:
+            counts.update(_matcher.count(content))
+
+        result.extend((patch_id, tag.id, count)
+                      for tag, count in counts.items())
+
+    return result
+
+
+def _load_chunks(query, chunk_size):
+    """Load patches in chunks, along with the content of their comments.
+
+    Each chunk is fetched by ID rather than with an OFFSET, and the
+    comments of all patches in the chunk are loaded with a single query.
+    """
+    query = query.filter(project__use_tags=True).order_by('id').values_list(
+        'id', 'content')
+    last_id = 0
+
+    while True:
+        patches = list(query.filter(id__gt=last_id)[:chunk_size].iterator())
+        if not patches:
+            return
+        last_id = patches[-1][0]
+
+        contents = dict((patch_id, [content])
+                        for patch_id, content in patches)
+        for patch_id, content in Comment.objects.filter(
+                submission__in=list(contents)).order_by(
+                    'submission_id', 'id').values_list(
+                        'submission', 'content').iterator():
+            contents[patch_id].append(content)
+
+        yield [(patch_id, contents[patch_id]) for patch_id, _ in patches]
+
+
+def _write_chunk(rows, counts):
+    tag_counts = dict((patch_id, {}) for patch_id, _ in rows)
+    for patch_id, tag_id, count in counts:
+        tag_counts[patch_id][tag_id] = count
+
+    with transaction.atomic():
+        PatchTag.objects.filter(patch__in=list(tag_counts)).delete()
+        PatchTag.objects.bulk_create([
+            PatchTag(patch_id=patch_id, tag_id=tag_id, count=count)
+            for patch_id, tag_id, count in counts])
+        bulk_update(Patch, 'tag_counts', list(tag_counts.items()))
+
+
+def retag_patches(query, chunk_size=500, jobs=1, progress=None):
+    """Recount the tags of many patches.
+
+    This is equivalent to calling :meth:`Patch.refresh_tag_counts` for
+    each patch, but patches are handled in chunks using a few queries
+    per chunk. The tags of each chunk are rewritten in a single
+    transaction, without sending signals.
+
+    Args:
+        query (QuerySet): The patches to recount tags for.
+        chunk_size (int): Number of patches to load and update at once.
+        jobs (int): Number of processes to use for counting tags.
+        progress (callable): Called with the number of patches in each
+            chunk once it has been written.
+    """
+    tags = list(Tag.objects.all())
+    if jobs > 1:
+        pool = multiprocessing.Pool(jobs, _init_worker, (tags,))
+    else:
+        pool = None
+        _init_worker(tags)
+
+    # chunks waiting to be written, in order
+    pending = deque()
+
+    def write(rows, counts):
+        _write_chunk(rows, counts)
+        if progress is not None:
+            progress(len(rows))
+
+    try:
+        for rows in _load_chunks(query, chunk_size):
+            if pool is None:
+                write(rows, _count_chunk(rows))
+                continue
+
+            pending.append((rows, pool.apply_async(_count_chunk, (rows,))))
+            # bound the number of chunks held in memory
+            if len(pending) > jobs * 2:
+                rows, result = pending.popleft()
+                write(rows, result.get())
+
+        while pending:
+            rows, result = pending.popleft()
+            write(rows, result.get())
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
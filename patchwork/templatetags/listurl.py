@@ -34,6 +34,9 @@ register = template.Library()
 # params to preserve across views
 list_params = [c.param for c in filterclasses] + ['order', 'page']
 
+# params only set by links, which aren't preserved
+link_params = ['after', 'before']
+
 
 class ListURLNode(template.defaulttags.URLNode):
 
@@ -41,7 +44,7 @@ class ListURLNode(template.defaulttags.URLNode):
         super(ListURLNode, self).__init__(None, [], {}, False)
         self.params = {}
         for (k, v) in kwargs.items():
-            if k in list_params:
+            if k in list_params or k in link_params:
                 self.params[k] = v
 
     def render(self, context):
@@ -35,7 +35,7 @@ def patch_tags(patch):
     counts = []
     titles = []
     for tag in patch.project.tags:
-        count = getattr(patch, tag.attr_name)
+        count = patch.tag_counts.get(tag.id, 0)
         titles.append('%d %s' % (count, tag.name))
         if count == 0:
             counts.append("-")
@@ -57,6 +57,15 @@ def patch_checks(patch):
         ' '.join([str(counts[state]) for state in required])))
 
 
+@register.filter(name='patch_diffstat')
+def patch_diffstat(patch):
+    if patch.lines_added is None or patch.lines_removed is None:
+        return '-'
+
+    return mark_safe('<span title="%d files changed">+%d -%d</span>' % (
+        patch.files_changed or 0, patch.lines_added, patch.lines_removed))
+
+
 @register.filter(name='state_class')
 def state_class(state):
     return '-'.join(state.split())
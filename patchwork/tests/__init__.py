@@ -20,5 +20,6 @@
 import os
 
 TEST_MAIL_DIR = os.path.join(os.path.dirname(__file__), 'mail')
+TEST_SERIES_DIR = os.path.join(os.path.dirname(__file__), 'series')
 TEST_PATCH_DIR = os.path.join(os.path.dirname(__file__), 'patches')
 TEST_FUZZ_DIR = os.path.join(os.path.dirname(__file__), 'fuzztests')
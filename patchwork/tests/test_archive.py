@@ -0,0 +1,256 @@
+# Patchwork - automated patch tracking system
+#
+# This file is part of the Patchwork package.
+#
+# Patchwork is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Patchwork is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Patchwork; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+import gzip
+import io
+import mailbox
+import os
+import shutil
+import tempfile
+import unittest
+
+from django.utils import six
+
+from patchwork.archive import Checkpoint
+from patchwork.archive import MboxReader
+from patchwork.archive import open_archive
+from patchwork.tests import TEST_MAIL_DIR
+from patchwork.tests import TEST_SERIES_DIR
+
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+
+def _read_mailbox(path):
+    mbox = mailbox.mbox(path)
+    try:
+        if six.PY3:
+            return [mbox.get_bytes(key) for key in mbox.iterkeys()]
+        return [mbox.get_string(key) for key in mbox.iterkeys()]
+    finally:
+        mbox.close()
+
+
+class MboxReaderTest(unittest.TestCase):
+
+    paths = [
+        os.path.join(TEST_SERIES_DIR, 'base-cover-letter.mbox'),
+        os.path.join(TEST_SERIES_DIR, 'base-deep-threaded.mbox'),
+        os.path.join(TEST_MAIL_DIR, '0001-git-pull-request.mbox'),
+        os.path.join(TEST_MAIL_DIR, '0013-with-utf8-body.mbox'),
+    ]
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _read(self, reader):
+        try:
+            return list(reader)
+        finally:
+            reader.close()
+
+    def test_mmap(self):
+        """Validate the memory-mapped reader matches 'mailbox'."""
+        for path in self.paths:
+            messages = self._read(open_archive(path))
+
+            self.assertEqual([data for _, data in messages],
+                             _read_mailbox(path))
+
+    def test_stream(self):
+        """Validate the line-based reader matches the memory-mapped one."""
+        for path in self.paths:
+            with open(path, 'rb') as f:
+                reader = MboxReader(io.BytesIO(f.read()))
+
+            self.assertEqual(self._read(reader),
+                             self._read(open_archive(path)))
+
+    def test_offsets(self):
+        path = self.paths[0]
+        with open(path, 'rb') as f:
+            raw = f.read()
+
+        reader = open_archive(path)
+        for offset, _ in reader:
+            self.assertTrue(raw[offset:].startswith(b'From '))
+        self.assertEqual(reader.progress, 1.0)
+        reader.close()
+
+    def test_seek(self):
+        """Validate seeking skips the messages before an offset."""
+        for path in self.paths:
+            messages = self._read(open_archive(path))
+            with open(path, 'rb') as f:
+                raw = f.read()
+
+            for index, (offset, _) in enumerate(messages):
+                for reader in (open_archive(path),
+                               MboxReader(io.BytesIO(raw))):
+                    reader.seek(offset)
+                    self.assertEqual(self._read(reader), messages[index:])
+
+                reader = open_archive(path)
+                reader.seek(offset + 1)
+                self.assertEqual(self._read(reader), messages[index + 1:])
+
+            reader = open_archive(path)
+            reader.seek(len(raw))
+            self.assertEqual(self._read(reader), [])
+
+    def test_gzip(self):
+        path = self.paths[1]
+        gz_path = os.path.join(self.tmpdir, 'archive.mbox.gz')
+        with open(path, 'rb') as src:
+            with gzip.open(gz_path, 'wb') as dst:
+                dst.write(src.read())
+
+        self.assertEqual(self._read(open_archive(gz_path)),
+                         self._read(open_archive(path)))
+
+    @unittest.skipIf(lzma is None, 'lzma is not available')
+    def test_xz(self):
+        path = self.paths[1]
+        xz_path = os.path.join(self.tmpdir, 'archive.mbox.xz')
+        with open(path, 'rb') as src:
+            with lzma.open(xz_path, 'wb') as dst:
+                dst.write(src.read())
+
+        self.assertEqual(self._read(open_archive(xz_path)),
+                         self._read(open_archive(path)))
+
+    def test_empty(self):
+        path = os.path.join(self.tmpdir, 'empty.mbox')
+        open(path, 'wb').close()
+
+        self.assertEqual(self._read(open_archive(path)), [])
+
+
+class MaildirReaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'maildir')
+
+        maildir = mailbox.Maildir(self.path)
+        for data in _read_mailbox(
+                os.path.join(TEST_SERIES_DIR, 'base-cover-letter.mbox')):
+            maildir.add(data)
+        maildir.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_exclude(self):
+        reader = open_archive(self.path)
+        messages = list(reader)
+        reader.close()
+        self.assertEqual(len(messages), 3)
+
+        reader = open_archive(self.path)
+        reader.exclude([messages[0][0], messages[2][0], 'unknown'])
+        self.assertEqual(list(reader), [messages[1]])
+        self.assertEqual(reader.progress, 1.0)
+        reader.close()
+
+
+class CheckpointTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'checkpoint')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_missing(self):
+        self.assertEqual(Checkpoint(self.path, 'archive.mbox').load(), [])
+
+    def test_record(self):
+        checkpoint = Checkpoint(self.path, 'archive.mbox', interval=2)
+        checkpoint.open()
+        checkpoint.record(0)
+        checkpoint.record(10)
+        checkpoint.record(20)
+
+        # entries are written in batches
+        self.assertEqual(Checkpoint(self.path, 'archive.mbox').load(),
+                         ['0', '10'])
+
+        checkpoint.close()
+        self.assertEqual(Checkpoint(self.path, 'archive.mbox').load(),
+                         ['0', '10', '20'])
+
+    def test_last_only(self):
+        checkpoint = Checkpoint(self.path, 'archive.mbox', interval=2,
+                                last_only=True)
+        checkpoint.open()
+        self.assertEqual(checkpoint.load(), [])
+        checkpoint.record(0)
+        checkpoint.record(10)
+        checkpoint.record(20)
+        self.assertEqual(checkpoint.load(), ['10'])
+
+        checkpoint.close()
+        self.assertEqual(checkpoint.load(), ['20'])
+        self.assertEqual(os.listdir(self.tmpdir), ['checkpoint'])
+
+        # resuming keeps the entry until a new one is written
+        checkpoint = Checkpoint(self.path, 'archive.mbox', last_only=True)
+        checkpoint.open(resume=True)
+        self.assertEqual(checkpoint.load(), ['20'])
+        checkpoint.record(30)
+        checkpoint.close()
+        self.assertEqual(checkpoint.load(), ['30'])
+
+    def test_resume(self):
+        checkpoint = Checkpoint(self.path, 'archive.mbox')
+        checkpoint.open()
+        checkpoint.record('a')
+        checkpoint.close()
+
+        checkpoint = Checkpoint(self.path, 'archive.mbox')
+        checkpoint.open(resume=True)
+        checkpoint.record('b')
+        checkpoint.close()
+        self.assertEqual(checkpoint.load(), ['a', 'b'])
+
+        # starting over discards the previous entries
+        checkpoint = Checkpoint(self.path, 'archive.mbox')
+        checkpoint.open()
+        checkpoint.close()
+        self.assertEqual(checkpoint.load(), [])
+
+    def test_other_archive(self):
+        checkpoint = Checkpoint(self.path, 'archive.mbox')
+        checkpoint.open()
+        checkpoint.close()
+
+        with self.assertRaises(ValueError):
+            Checkpoint(self.path, 'other.mbox').load()
+
+        with open(self.path, 'w') as f:
+            f.write('garbage\n')
+
+        with self.assertRaises(ValueError):
+            Checkpoint(self.path, 'archive.mbox').load()
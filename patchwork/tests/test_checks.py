@@ -23,6 +23,7 @@ from datetime import timedelta
 from django.test import TransactionTestCase
 
 from patchwork.models import Check
+from patchwork.models import Patch
 from patchwork.tests.utils import create_check
 from patchwork.tests.utils import create_patches
 from patchwork.tests.utils import create_user
@@ -151,3 +152,24 @@ class PatchChecksTest(TransactionTestCase):
         self._create_check()
         self._create_check(context='new/test1')
         self.assertCheckEqual(self.patch, Check.STATE_SUCCESS)
+
+    def test_check__stored(self):
+        """Validate the combined state is stored with the patch."""
+        self._create_check()
+        self._create_check(context='new/test1', state=Check.STATE_WARNING)
+
+        patch = Patch.objects.get(pk=self.patch.pk)
+        self.assertEqual(patch.check_state, Check.STATE_WARNING)
+        self.assertEqual(patch.check_count[Check.STATE_SUCCESS], 1)
+        self.assertEqual(patch.check_count[Check.STATE_WARNING], 1)
+
+    def test_check__delete(self):
+        """Validate deleting the latest check restores the previous one."""
+        old = self._create_check(date=(dt.now() - timedelta(days=1)))
+        check = self._create_check(state=Check.STATE_FAIL)
+        self.assertCheckEqual(self.patch, Check.STATE_FAIL)
+
+        check.delete()
+        self.assertTrue(Check.objects.get(pk=old.pk).latest)
+        self.assertEqual(Patch.objects.get(pk=self.patch.pk).check_state,
+                         Check.STATE_SUCCESS)
@@ -0,0 +1,76 @@
+# Patchwork - automated patch tracking system
+#
+# This file is part of the Patchwork package.
+#
+# Patchwork is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Patchwork is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Patchwork; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+from collections import namedtuple
+from fnmatch import fnmatchcase
+import unittest
+
+from patchwork.delegation import DelegationMatcher
+
+Rule = namedtuple('Rule', ['path', 'user'])
+
+
+class DelegationMatcherTest(unittest.TestCase):
+
+    filenames = [
+        'MAINTAINERS',
+        'net/core/dev.c',
+        'net/ipv4/tcp.c',
+        'drivers/net/ethernet/intel/e1000.c',
+        'drivers/gpu/drm/drm.h',
+        'Documentation/networking/ip-sysctl.txt',
+        'include/linux/netdevice.h',
+        'a[b]/c',
+        'drivers/gpu/file200.c',
+    ]
+
+    def _test_rules(self, paths):
+        rules = [Rule(path, i) for i, path in enumerate(paths)]
+        matcher = DelegationMatcher(rules)
+
+        for filename in self.filenames:
+            expected = None
+            for rule in rules:
+                if fnmatchcase(filename, rule.path):
+                    expected = rule
+                    break
+            self.assertIs(matcher.match(filename), expected, filename)
+
+    def test_no_rules(self):
+        self._test_rules([])
+
+    def test_exact(self):
+        self._test_rules(['MAINTAINERS', 'net/core/dev.c', 'net/core'])
+
+    def test_directory(self):
+        self._test_rules(['net/*', 'drivers/net/*', 'drivers/*'])
+
+    def test_wildcard(self):
+        self._test_rules(['*.h', 'net/*/tcp.c', 'drivers/*/e1000.?',
+                          'Documentation/[nN]etworking/*', 'a[[]b]/*'])
+
+    def test_priority(self):
+        self._test_rules(['drivers/*', 'drivers/net/*', '*.c', '*',
+                          'MAINTAINERS'])
+        self._test_rules(['*', 'drivers/*', 'MAINTAINERS'])
+        self._test_rules(['*.c', 'drivers/net/*', 'net/core/dev.c'])
+
+    def test_many_rules(self):
+        """Validate behavior with more rules than one regex can hold."""
+        paths = ['drivers/*/file%d.c' % i for i in range(250)]
+        self._test_rules(paths + ['drivers/*', '*.h'])
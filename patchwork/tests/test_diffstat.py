@@ -0,0 +1,154 @@
+# Patchwork - automated patch tracking system
+#
+# This file is part of the Patchwork package.
+#
+# Patchwork is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Patchwork is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Patchwork; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+import unittest
+
+from django.test import TestCase
+from django.utils import six
+
+from patchwork.compat import reverse
+from patchwork.models import parse_lines_range
+from patchwork.models import Patch
+from patchwork.parser import find_diffstat
+from patchwork.tests.utils import create_patch
+from patchwork.tests.utils import create_project
+
+
+def make_diff(path, added, removed):
+    return '--- a/%s\n+++ b/%s\n@@ -1,%d +1,%d @@\n%s%s' % (
+        path, path, removed + 1, added + 1, '-a\n' * removed,
+        '+b\n' * added + ' c\n')
+
+
+class DiffstatTest(unittest.TestCase):
+
+    def test_single(self):
+        self.assertEqual(find_diffstat(make_diff('a.c', 3, 2)), (1, 3, 2))
+
+    def test_multiple(self):
+        diff = make_diff('a.c', 3, 2) + make_diff('b.c', 0, 4)
+        self.assertEqual(find_diffstat(diff), (2, 3, 6))
+
+    def test_header_lines(self):
+        # file headers and lines outside of hunks aren't counted as changes
+        diff = ('--- a/a.c\n+++ b/a.c\n@@ -1,2 +1,2 @@\n'
+                '---a\n++++b\n c\n'
+                '--- a/b.c\n+++ b/b.c\n@@ -1 +1 @@\n-a\n+b\n'
+                '\\ No newline at end of file\n')
+        self.assertEqual(find_diffstat(diff), (2, 2, 2))
+
+    def test_git_rename(self):
+        diff = ('diff --git a/a.c b/b.c\nsimilarity index 100%\n'
+                'rename from a.c\nrename to b.c\n'
+                'diff --git a/c.c b/c.c\n--- a/c.c\n+++ b/c.c\n'
+                '@@ -0,0 +1 @@\n+a\n')
+        self.assertEqual(find_diffstat(diff), (2, 1, 0))
+
+    def test_line_endings(self):
+        diff = ('--- a/a.c\r\n+++ b/a.c\r\n@@ -1,3 +1,3 @@\r\n'
+                '\r\n-a\r\n+b\r\n c')
+        self.assertEqual(find_diffstat(diff), (1, 1, 1))
+        self.assertEqual(find_diffstat(diff + '\r\n+d\r\n'), (1, 1, 1))
+
+    def test_byte_string(self):
+        diff = b'--- a/a.c\n+++ b/a.c\n@@ -1 +1 @@\n-a\n+b\n'
+        if six.PY3:
+            diff = diff.decode('ascii')
+
+        self.assertEqual(find_diffstat(diff), (1, 1, 1))
+
+    def test_parse_lines_range(self):
+        self.assertEqual(parse_lines_range('1000'), (1000, None))
+        self.assertEqual(parse_lines_range('10-100'), (10, 100))
+        self.assertEqual(parse_lines_range(' -10'), (None, 10))
+        self.assertEqual(parse_lines_range('10-'), (10, None))
+        self.assertIsNone(parse_lines_range('-'))
+        self.assertIsNone(parse_lines_range('ten'))
+        self.assertIsNone(parse_lines_range('10--5'))
+
+
+class PatchDiffstatTest(TestCase):
+
+    def test_create(self):
+        patch = create_patch(diff=make_diff('a.c', 3, 2))
+        patch = Patch.objects.get(pk=patch.pk)
+        self.assertEqual(
+            (patch.files_changed, patch.lines_added, patch.lines_removed),
+            (1, 3, 2))
+
+    def test_pull_request(self):
+        patch = create_patch(diff=None, pull_url='git://example.com/repo')
+        self.assertEqual(
+            (patch.files_changed, patch.lines_added, patch.lines_removed),
+            (0, 0, 0))
+
+    def test_update(self):
+        patch = create_patch(diff=make_diff('a.c', 3, 2))
+        patch = Patch.objects.get(pk=patch.pk)
+        patch.diff = make_diff('a.c', 5, 0)
+        patch.save()
+
+        patch = Patch.objects.get(pk=patch.pk)
+        self.assertEqual((patch.lines_added, patch.lines_removed), (5, 0))
+
+    def test_lines_between(self):
+        small = create_patch(diff=make_diff('a.c', 1, 1))
+        large = create_patch(diff=make_diff('a.c', 900, 200))
+
+        self.assertEqual(list(Patch.objects.lines_between(1000)), [large])
+        self.assertEqual(list(Patch.objects.lines_between(None, 10)),
+                         [small])
+        self.assertEqual(list(Patch.objects.lines_between(2, 2)), [small])
+
+
+class DiffstatListTest(TestCase):
+
+    def setUp(self):
+        self.project = create_project()
+        self.small = create_patch(project=self.project,
+                                  diff=make_diff('a.c', 1, 1))
+        self.large = create_patch(project=self.project,
+                                  diff=make_diff('a.c', 900, 200))
+        self.unknown = create_patch(project=self.project)
+        Patch.objects.filter(pk=self.unknown.pk).update(
+            files_changed=None, lines_added=None, lines_removed=None)
+
+    def _get_patches(self, params):
+        response = self.client.get(
+            reverse('patch-list', kwargs={
+                'project_id': self.project.linkname}),
+            params)
+        self.assertEqual(response.status_code, 200)
+        return list(response.context['page'].object_list)
+
+    def test_filter(self):
+        self.assertEqual(self._get_patches({'lines': '1000'}), [self.large])
+        self.assertEqual(self._get_patches({'lines': '-10'}), [self.small])
+        self.assertEqual(len(self._get_patches({'lines': 'many'})), 3)
+
+    def test_order(self):
+        # databases differ in where they order nulls, so the patch with an
+        # unknown diffstat is ignored
+        patches = [patch for patch in self._get_patches({'order': '-lines'})
+                   if patch != self.unknown]
+        self.assertEqual(patches, [self.large, self.small])
+
+    def test_column(self):
+        response = self.client.get(reverse('patch-list', kwargs={
+            'project_id': self.project.linkname}))
+        self.assertContains(response, '+900 -200')
@@ -20,6 +20,7 @@
 from django.test import TestCase
 
 from patchwork.models import Event
+from patchwork.models import Patch
 from patchwork.tests import utils
 
 BASE_FIELDS = ['previous_state', 'current_state', 'previous_delegate',
@@ -169,6 +170,55 @@ class PatchChangedTest(_BaseTestCase):
                          Event.CATEGORY_PATCH_DELEGATED)
         self.assertEventFields(events[3], previous_delegate=delegate_b)
 
+    def test_patch_state_changed_loaded(self):
+        """Validate the original state of a loaded patch isn't queried."""
+        patch = utils.create_patch()
+        old_state = patch.state
+        new_state = utils.create_state()
+
+        patch = Patch.objects.select_related('project').get(id=patch.id)
+        patch.state = new_state
+        # an event and an update of each of the submission and patch tables
+        with self.assertNumQueries(3):
+            patch.save()
+
+        events = _get_events(patch=patch)
+        self.assertEqual(events.count(), 2)
+        self.assertEventFields(events[1], previous_state=old_state,
+                               current_state=new_state)
+
+    def test_patch_state_changed_deferred(self):
+        """Validate deferred fields aren't loaded to check for changes."""
+        patch = utils.create_patch()
+        new_state = utils.create_state()
+
+        # as loaded by the patch lists
+        patch = Patch.objects.select_related('project').defer(
+            'content', 'diff', 'headers').get(id=patch.id)
+        patch.state = new_state
+        # an event and an update of each of the submission and patch tables
+        with self.assertNumQueries(3):
+            patch.save()
+
+        self.assertEqual(Patch.objects.get(id=patch.id).state, new_state)
+
+    def test_patch_state_changed_unloaded(self):
+        """Validate the original state is queried for other patches."""
+        patch = utils.create_patch()
+        old_state = patch.state
+        new_state = utils.create_state()
+
+        patch = Patch(pk=patch.pk, **dict(
+            (field.attname, getattr(patch, field.attname))
+            for field in Patch._meta.concrete_fields))
+        patch.state = new_state
+        patch.save()
+
+        events = _get_events(patch=patch)
+        self.assertEqual(events.count(), 2)
+        self.assertEventFields(events[1], previous_state=old_state,
+                               current_state=new_state)
+
 
 class CheckCreateTest(_BaseTestCase):
 
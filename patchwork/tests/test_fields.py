@@ -17,9 +17,16 @@
 # along with Patchwork; if not, write to the Free Software
 # Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 
+import zlib
+
+from django.db import connection
+from django.test import override_settings
 from django.test import SimpleTestCase
+from django.test import TestCase
 
 from patchwork import fields
+from patchwork.models import Patch
+from patchwork.tests.utils import create_patch
 
 
 class TestHashField(SimpleTestCase):
@@ -31,3 +38,95 @@ class TestHashField(SimpleTestCase):
         """
         field = fields.HashField()
         self.assertEqual(field.n_bytes, 40)
+
+
+class TestCountsField(SimpleTestCase):
+
+    def test_round_trip(self):
+        field = fields.CountsField()
+        value = field.get_prep_value({2: 1, 10: 3, 3: 0})
+
+        self.assertEqual(value, '{"10":3,"2":1}')
+        self.assertEqual(field.to_python(value), {2: 1, 10: 3})
+
+    def test_empty(self):
+        field = fields.CountsField()
+
+        self.assertEqual(field.get_prep_value({}), '{}')
+        self.assertEqual(field.to_python(''), {})
+
+
+@override_settings(TEXT_COMPRESSION_MIN_LENGTH=100)
+class TestCompressedTextField(SimpleTestCase):
+
+    def test_round_trip(self):
+        field = fields.CompressedTextField()
+        value = field.get_db_prep_save(u'\u00e9a diff\n' * 100, connection)
+
+        self.assertTrue(fields.is_compressed(value))
+        # the compressed data is stored as is, rather than encoded as text
+        self.assertEqual(zlib.decompress(bytes(value)[2:]),
+                         (u'\u00e9a diff\n' * 100).encode('utf-8'))
+        self.assertEqual(field.from_db_value(value, None, connection, None),
+                         u'\u00e9a diff\n' * 100)
+
+    def test_short(self):
+        field = fields.CompressedTextField()
+
+        self.assertEqual(bytes(field.get_db_prep_save('short', connection)),
+                         b'short')
+        self.assertIsNone(field.get_db_prep_save(None, connection))
+
+    @override_settings(TEXT_COMPRESSION_MIN_LENGTH=None)
+    def test_disabled(self):
+        field = fields.CompressedTextField()
+        value = 'a diff\n' * 100
+
+        self.assertEqual(bytes(field.get_db_prep_save(value, connection)),
+                         value.encode('ascii'))
+
+    def test_uncompressed(self):
+        field = fields.CompressedTextField()
+
+        self.assertEqual(
+            field.from_db_value(b'plain text', None, connection, None),
+            'plain text')
+        # values stored before the column held binary data
+        self.assertEqual(
+            field.from_db_value(u'plain text', None, connection, None),
+            'plain text')
+
+    def test_marker(self):
+        """Validate text that looks compressed is stored unambiguously."""
+        field = fields.CompressedTextField()
+        text = fields.COMPRESSION_MARKER.decode('ascii') + 'z'
+        value = field.get_db_prep_save(text, connection)
+
+        self.assertNotEqual(bytes(value), text.encode('ascii'))
+        self.assertEqual(field.from_db_value(value, None, connection, None),
+                         text)
+
+    def test_lookup(self):
+        """Validate values aren't compressed when used for lookups."""
+        field = fields.CompressedTextField()
+        value = 'a diff\n' * 100
+
+        self.assertEqual(field.get_prep_value(value), value)
+
+
+@override_settings(TEXT_COMPRESSION_MIN_LENGTH=100)
+class TestCompressedTextFieldModel(TestCase):
+
+    def _stored(self, patch):
+        return Patch.objects.filter(pk=patch.pk).extra(
+            select={'stored': 'patchwork_patch.diff'}).values_list(
+                'stored', flat=True)[0]
+
+    def test_save(self):
+        diff = '--- a/foo\n+++ b/foo\n@@ -1 +1 @@\n-a\n+b\n' * 10
+        patch = create_patch(diff=diff)
+
+        self.assertTrue(fields.is_compressed(self._stored(patch)))
+        self.assertEqual(Patch.objects.get(pk=patch.pk).diff, diff)
+        self.assertEqual(Patch.objects.filter(pk=patch.pk).values_list(
+            'diff', flat=True)[0], diff)
@@ -0,0 +1,139 @@
+# Patchwork - automated patch tracking system
+#
+# This file is part of the Patchwork package.
+#
+# Patchwork is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Patchwork is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Patchwork; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+import io
+import unittest
+
+from django.test import TestCase
+
+from patchwork.hasher import DiffHasher
+from patchwork.hasher import hash_commits
+from patchwork.hasher import hash_diff
+from patchwork.models import Patch
+from patchwork.tests.utils import create_patch
+from patchwork.tests.utils import read_patch
+
+SHA_A = 'a' * 40
+SHA_B = 'b' * 40
+SHA_C = 'c' * 40
+
+
+class DiffHasherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.diff = read_patch('0002-utf-8.patch', encoding='utf-8')
+        self.expected = hash_diff(self.diff)
+
+    def test_hash(self):
+        diff = read_patch('0001-add-line.patch')
+        self.assertEqual(hash_diff(diff),
+                         'f59149b3310fb8f337b1cfc845c060ed6ef85df8')
+
+    def test_chunks(self):
+        data = self.diff.encode('utf-8')
+
+        for size in (1, 2, 7, 4096):
+            hasher = DiffHasher()
+            for i in range(0, len(data), size):
+                hasher.update(data[i:i + size])
+            self.assertEqual(hasher.hexdigest(), self.expected)
+
+    def test_whitespace(self):
+        """Validate whitespace is normalised as for a whole diff."""
+        diff = '\n \n' + self.diff.replace('\n', '\r\n') + ' \n\t\n'
+
+        self.assertEqual(hash_diff(diff), self.expected)
+        hasher = DiffHasher()
+        for line in diff.splitlines(True):
+            hasher.update(line)
+        self.assertEqual(hasher.hexdigest(), self.expected)
+
+    def test_hexdigest(self):
+        """Validate a digest can be taken part way through a diff."""
+        lines = self.diff.splitlines(True)
+        hasher = DiffHasher()
+        for line in lines[:-2]:
+            hasher.update(line)
+
+        self.assertEqual(hasher.hexdigest(), hash_diff(''.join(lines[:-2])))
+        hasher.update(''.join(lines[-2:]))
+        self.assertEqual(hasher.hexdigest(), self.expected)
+
+    def test_latin1(self):
+        """Validate lines which aren't valid UTF-8 are decoded as Latin-1."""
+        data = self.diff.encode('latin-1')
+        self.assertEqual(DiffHasher(data).hexdigest(), self.expected)
+
+
+class HashCommitsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.diff = read_patch('0001-add-line.patch')
+        self.expected = hash_diff(self.diff)
+
+    def _hash(self, output):
+        return list(hash_commits(io.BytesIO(output.encode('utf-8'))))
+
+    def test_log(self):
+        output = ''.join([
+            'commit %s (HEAD -> master)\n' % SHA_A,
+            'Author: Test <test@example.com>\n\n',
+            '    Add a line\n\n',
+            '    +not part of the diff\n\n',
+            self.diff,
+            '\n',
+            'commit %s\n' % SHA_B,
+            'Author: Test <test@example.com>\n\n',
+            '    Empty commit\n',
+        ])
+
+        self.assertEqual(self._hash(output), [
+            (SHA_A, self.expected),
+            (SHA_B, hash_diff('')),
+        ])
+
+    def test_diff_tree(self):
+        other = self.diff.replace('+meep', '+moop')
+        output = ''.join([
+            '%s\n' % SHA_A,
+            self.diff,
+            # a merge, shown with '-m'
+            '%s (from %s)\n' % (SHA_B, SHA_A),
+            self.diff,
+            '%s (from %s)\n' % (SHA_B, SHA_C),
+            other,
+            '%s\n' % SHA_C,
+            other,
+        ])
+
+        self.assertEqual(self._hash(output), [
+            (SHA_A, self.expected),
+            (SHA_B, self.expected),
+            (SHA_C, hash_diff(other)),
+        ])
+
+
+class PatchHashTest(TestCase):
+
+    def test_diff_changed(self):
+        patch = Patch.objects.get(pk=create_patch().pk)
+        patch.diff = read_patch('0001-add-line.patch')
+        patch.save()
+
+        self.assertEqual(Patch.objects.get(pk=patch.pk).hash,
+                         hash_diff(patch.diff))
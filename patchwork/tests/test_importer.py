@@ -0,0 +1,174 @@
+# Patchwork - automated patch tracking system
+#
+# This file is part of the Patchwork package.
+#
+# Patchwork is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Patchwork is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Patchwork; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+from collections import Counter
+import mailbox
+import os
+import unittest
+
+from django.db import IntegrityError
+from django.db import transaction
+from django.test import TestCase
+
+from patchwork import models
+from patchwork.importer import BulkImporter
+from patchwork.importer import MsgidSet
+from patchwork.parser import parse_mail
+from patchwork.tests import TEST_SERIES_DIR
+from patchwork.tests import utils
+
+
+class MsgidSetTest(unittest.TestCase):
+
+    def test_contains(self):
+        msgids = ['<%d@example.com>' % i for i in range(100)]
+        msgid_set = MsgidSet(msgids + msgids[:10])
+
+        self.assertEqual(len(msgid_set), 100)
+        for msgid in msgids:
+            self.assertIn(msgid, msgid_set)
+            self.assertIn(msgid.encode('ascii'), msgid_set)
+        self.assertNotIn('<100@example.com>', msgid_set)
+
+    def test_empty(self):
+        self.assertEqual(len(MsgidSet([])), 0)
+        self.assertNotIn('<0@example.com>', MsgidSet([]))
+
+
+class BulkImporterTest(TestCase):
+    """Validate the bulk importer against the regular parser."""
+
+    def setUp(self):
+        utils.create_state()
+        self.project = utils.create_project()
+        models.Tag.objects.create(name='Reviewed-by', abbrev='R',
+                                  pattern=r'^Reviewed-by:')
+
+    def _mails(self, names):
+        for name in names:
+            mbox = mailbox.mbox(os.path.join(TEST_SERIES_DIR, name))
+            for mail in mbox:
+                yield mail
+            mbox.close()
+
+    def _snapshot(self):
+        """Summarise the database in a way that ignores IDs."""
+        series = {}
+        for obj in models.Series.objects.all():
+            series[tuple(sorted(obj.references.values_list(
+                'msgid', flat=True)))] = (
+                obj.name, obj.version, obj.total,
+                obj.cover_letter.msgid if obj.cover_letter else None,
+                tuple(obj.seriespatch_set.values_list(
+                    'number', 'patch__msgid')))
+
+        return {
+            'people': sorted(models.Person.objects.values_list(
+                'email', 'name')),
+            'patches': sorted(models.Patch.objects.values_list(
+                'msgid', 'name', 'submitter__email', 'hash', 'state__name')),
+            'covers': sorted(models.CoverLetter.objects.values_list(
+                'msgid', 'name', 'submitter__email')),
+            'comments': sorted(models.Comment.objects.values_list(
+                'msgid', 'submission__msgid', 'submitter__email')),
+            'tags': sorted(models.PatchTag.objects.values_list(
+                'patch__msgid', 'tag__name', 'count')),
+            'tag_counts': sorted(models.Patch.objects.values_list(
+                'msgid', 'tag_counts')),
+            'series': series,
+            'events': Counter(models.Event.objects.values_list(
+                'category', 'patch__msgid', 'cover__msgid')),
+            'index': sorted(models.MessageIndex.objects.exclude(
+                submission=None, series=None).values_list(
+                    'msgid', 'submission__msgid', 'series__name')),
+            'files': sorted(models.PatchFile.objects.values_list(
+                'patch__msgid', 'path')),
+            'diffstats': sorted(models.Patch.objects.values_list(
+                'msgid', 'files_changed', 'lines_added', 'lines_removed')),
+            'search': sorted(models.SearchDocument.objects.values_list(
+                'submission__msgid', 'title')),
+        }
+
+    def _import_serial(self, names):
+        for mail in self._mails(names):
+            try:
+                with transaction.atomic():
+                    parse_mail(mail, self.project.listid)
+            except IntegrityError:
+                pass
+
+    def _import_bulk(self, names, window):
+        importer = BulkImporter()
+        results = []
+        for mail in self._mails(names):
+            importer.add(mail, self.project)
+            if len(importer) >= window:
+                results.extend(importer.flush())
+        results.extend(importer.flush())
+        return results
+
+    def _test_equivalence(self, names):
+        self._import_serial(names)
+        expected = self._snapshot()
+
+        for window in (1, 3, 100):
+            models.Series.objects.all().delete()
+            models.Submission.objects.all().delete()
+            models.Person.objects.all().delete()
+            models.Event.objects.all().delete()
+
+            self._import_bulk(names, window)
+            self.assertEqual(self._snapshot(), expected,
+                             'window of %d mails differs' % window)
+
+    def test_cover_letter(self):
+        self._test_equivalence(['base-cover-letter.mbox'])
+
+    def test_deep_threaded(self):
+        self._test_equivalence(['base-deep-threaded.mbox'])
+
+    def test_out_of_order(self):
+        self._test_equivalence(['base-out-of-order.mbox'])
+
+    def test_revisions(self):
+        self._test_equivalence(['revision-basic.mbox',
+                                'revision-threaded-to-cover.mbox',
+                                'revision-threaded-to-patch.mbox'])
+
+    def test_no_references(self):
+        self._test_equivalence(['base-no-references.mbox',
+                                'base-no-references-no-cover.mbox'])
+
+    def test_extra_patches(self):
+        self._test_equivalence(['base-extra-patches.mbox',
+                                'bugs-multiple-references.mbox',
+                                'mercurial-cover-letter.mbox'])
+
+    def test_all(self):
+        self._test_equivalence(sorted(
+            name for name in os.listdir(TEST_SERIES_DIR)
+            if name.endswith('.mbox')))
+
+    def test_duplicates(self):
+        names = ['base-cover-letter.mbox']
+        self._import_bulk(names, 100)
+        expected = self._snapshot()
+
+        results = self._import_bulk(names, 100)
+        self.assertEqual(self._snapshot(), expected)
+        self.assertTrue(all(isinstance(r, Exception) for r in results))
@@ -22,11 +22,15 @@ from __future__ import absolute_import
 from datetime import datetime as dt
 import re
 
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.utils.six.moves import zip
 
 from patchwork.compat import reverse
+from patchwork.models import Check
 from patchwork.models import Patch
+from patchwork.tests.utils import create_check
 from patchwork.tests.utils import create_patch
 from patchwork.tests.utils import create_person
 from patchwork.tests.utils import create_project
@@ -132,3 +136,91 @@ class PatchOrderTest(TestCase):
                                     p2.submitter.name.lower())
 
         self._test_sequence(response, test_fn)
+
+
+class PatchTagListTest(TestCase):
+
+    fixtures = ['default_tags']
+    review = 'Reviewed-by: Test User <test@example.com>\n'
+
+    def setUp(self):
+        self.project = create_project()
+        self.patches = [
+            create_patch(project=self.project, content=self.review * count)
+            for count in (1, 0, 2)]
+        self.url = reverse('patch-list',
+                           kwargs={'project_id': self.project.linkname})
+
+    def _extract_patch_ids(self, response):
+        id_re = re.compile(r'<tr id="patch_row:(\d+)"')
+        return [int(m.group(1))
+                for m in id_re.finditer(response.content.decode())]
+
+    def test_tag_counts(self):
+        response = self.client.get(self.url)
+        self.assertContains(response, '<span title="0 Acked-by / '
+                            '2 Reviewed-by / 0 Tested-by">- 2 -</span>')
+
+    def test_tag_filter(self):
+        response = self.client.get(self.url + '?tag=reviewed-by')
+        self.assertEqual(sorted(self._extract_patch_ids(response)),
+                         [self.patches[0].id, self.patches[2].id])
+
+        response = self.client.get(self.url + '?tag=Reviewed-by:2')
+        self.assertEqual(self._extract_patch_ids(response),
+                         [self.patches[2].id])
+
+        response = self.client.get(self.url + '?tag=Acked-by')
+        self.assertEqual(self._extract_patch_ids(response), [])
+
+    def test_tag_order(self):
+        response = self.client.get(self.url + '?order=-tag:R')
+        self.assertEqual(self._extract_patch_ids(response),
+                         [self.patches[2].id, self.patches[0].id,
+                          self.patches[1].id])
+
+        response = self.client.get(self.url + '?order=tag:R')
+        self.assertEqual(self._extract_patch_ids(response),
+                         [self.patches[1].id, self.patches[0].id,
+                          self.patches[2].id])
+
+
+class PatchCheckListTest(TestCase):
+
+    def setUp(self):
+        self.project = create_project()
+        self.patches = [create_patch(project=self.project) for _ in range(3)]
+        create_check(patch=self.patches[0], state=Check.STATE_SUCCESS)
+        create_check(patch=self.patches[2], state=Check.STATE_FAIL)
+        self.url = reverse('patch-list',
+                           kwargs={'project_id': self.project.linkname})
+
+    def _extract_patch_ids(self, response):
+        id_re = re.compile(r'<tr id="patch_row:(\d+)"')
+        return [int(m.group(1))
+                for m in id_re.finditer(response.content.decode())]
+
+    def test_check_filter(self):
+        response = self.client.get(self.url + '?check=fail')
+        self.assertEqual(self._extract_patch_ids(response),
+                         [self.patches[2].id])
+
+        response = self.client.get(self.url + '?check=pending')
+        self.assertEqual(self._extract_patch_ids(response),
+                         [self.patches[1].id])
+
+    def test_check_order(self):
+        response = self.client.get(self.url + '?order=-check')
+        self.assertEqual(self._extract_patch_ids(response),
+                         [self.patches[2].id, self.patches[0].id,
+                          self.patches[1].id])
+
+    def test_check_queries(self):
+        """Validate checks aren't loaded to render their state."""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+
+        self.assertContains(response, '<span title="Success / Warning / '
+                            'Fail">0 0 1</span>')
+        self.assertFalse([query['sql'] for query in queries
+                          if 'patchwork_check' in query['sql']])
@@ -0,0 +1,126 @@
+# Patchwork - automated patch tracking system
+#
+# This file is part of the Patchwork package.
+#
+# Patchwork is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Patchwork is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Patchwork; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+import shutil
+import tempfile
+
+from django.core.cache import cache
+from django.test import override_settings
+from django.test import TestCase
+
+from patchwork import lookups
+from patchwork.models import DelegationRule
+from patchwork.models import State
+from patchwork.tests.utils import create_project
+from patchwork.tests.utils import create_state
+from patchwork.tests.utils import create_user
+
+
+class LookupCacheTest(TestCase):
+
+    def setUp(self):
+        lookups.invalidate()
+
+    def test_project(self):
+        project = create_project()
+
+        self.assertEqual(lookups.get_project(project.listid), project)
+        with self.assertNumQueries(0):
+            self.assertEqual(lookups.get_project(project.listid), project)
+
+        self.assertIsNone(lookups.get_project('missing.example.com'))
+        with self.assertNumQueries(0):
+            self.assertIsNone(lookups.get_project('missing.example.com'))
+
+    def test_project_invalidated(self):
+        self.assertIsNone(lookups.get_project('test.example.com'))
+
+        project = create_project(listid='test.example.com')
+        self.assertEqual(lookups.get_project('test.example.com'), project)
+
+        project.delete()
+        self.assertIsNone(lookups.get_project('test.example.com'))
+
+    def test_state(self):
+        default = create_state(ordering=0)
+        state = create_state(name='Accepted', ordering=1)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(lookups.get_default_state(), default)
+            self.assertEqual(lookups.get_state('accepted'), state)
+            self.assertIsNone(lookups.get_state('missing'))
+
+        state.name = 'Merged'
+        state.save()
+        self.assertIsNone(lookups.get_state('accepted'))
+        self.assertEqual(lookups.get_state('merged'), state)
+
+    def test_no_default_state(self):
+        with self.assertRaises(State.DoesNotExist):
+            lookups.get_default_state()
+
+    def test_delegation_rules(self):
+        project = create_project()
+        user = create_user()
+        rule_a = DelegationRule.objects.create(
+            project=project, user=user, path='a/*', priority=1)
+
+        self.assertEqual(lookups.get_delegation_rules(project), [rule_a])
+
+        rule_b = DelegationRule.objects.create(
+            project=project, user=user, path='b/*', priority=2)
+
+        with self.assertNumQueries(1):
+            rules = lookups.get_delegation_rules(project)
+            self.assertEqual(rules, [rule_b, rule_a])
+            self.assertEqual(rules[0].user, user)
+
+    @override_settings(LOOKUP_CACHE_TIMEOUT=0)
+    def test_timeout(self):
+        project = create_project()
+
+        lookups.get_project(project.listid)
+        with self.assertNumQueries(1):
+            lookups.get_project(project.listid)
+
+    def test_shared_cache(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        caches = {'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': tmpdir,
+        }}
+
+        with override_settings(CACHES=caches):
+            project = create_project()
+            lookups.get_project(project.listid)
+            with self.assertNumQueries(0):
+                lookups.get_project(project.listid)
+
+            # another process invalidating its cache also invalidates ours
+            cache.set(lookups.GENERATION_KEY, 'other', None)
+            with self.assertNumQueries(1):
+                lookups.get_project(project.listid)
+
+            # and entries don't expire, as the generation is checked instead
+            with override_settings(LOOKUP_CACHE_TIMEOUT=0):
+                with self.assertNumQueries(0):
+                    lookups.get_project(project.listid)
+
+            lookups.invalidate()
+            self.assertNotEqual(cache.get(lookups.GENERATION_KEY), 'other')
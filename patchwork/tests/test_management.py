@@ -17,15 +17,27 @@
 # along with Patchwork; if not, write to the Free Software
 # Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 
+import mailbox
 import os
+import shutil
+import subprocess
 import sys
+import tempfile
 
 from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
 from django.utils.six import StringIO
+from django.test import override_settings
 from django.test import TestCase
 
 from patchwork import models
+from patchwork.archive import open_archive
+from patchwork.fields import is_compressed
+from patchwork.importer import MsgidSet
+from patchwork.management.commands import parsearchive
 from patchwork.tests import TEST_MAIL_DIR
+from patchwork.tests import TEST_SERIES_DIR
 from patchwork.tests import utils
 
 
@@ -132,3 +144,451 @@ class ParsearchiveTest(TestCase):
 
         self.assertIn('Processed 1 messages -->', out.getvalue())
         self.assertIn('  1 dropped', out.getvalue())
+
+    def test_parallel(self):
+        project = utils.create_project()
+        utils.create_state()
+
+        out = StringIO()
+        call_command('parsearchive',
+                     os.path.join(TEST_SERIES_DIR, 'base-cover-letter.mbox'),
+                     list_id=project.listid, jobs=2, stdout=out)
+
+        self.assertIn('Processed 3 messages -->', out.getvalue())
+        self.assertIn('  1 cover letters', out.getvalue())
+        self.assertIn('  2 patches', out.getvalue())
+        self.assertIn('mails/sec', out.getvalue())
+
+        self.assertEqual(models.Series.objects.count(), 1)
+        series = models.Series.objects.first()
+        self.assertIsNotNone(series.cover_letter)
+        self.assertEqual(series.patches.count(), 2)
+
+    def test_parallel_bounded(self):
+        """Validate mails aren't read far ahead of those being saved."""
+        consumed = []
+
+        def reader():
+            for offset in range(1000):
+                consumed.append(offset)
+                yield offset, b'Subject: test\n\ntest\n'
+
+        command = parsearchive.Command()
+        results = command._extract(reader(), None, 2, False)
+
+        self.assertEqual(next(results)[:2], (0, 'dropped'))
+        self.assertLessEqual(len(consumed), 5 * parsearchive.CHUNK_SIZE)
+        self.assertEqual([result[0] for result in results],
+                         list(range(1, 1000)))
+
+    def test_batch_size(self):
+        project = utils.create_project()
+        utils.create_state()
+        path = os.path.join(TEST_SERIES_DIR, 'base-cover-letter.mbox')
+
+        out = StringIO()
+        call_command('parsearchive', path, list_id=project.listid,
+                     batch_size=2, stdout=out)
+
+        self.assertIn('Processed 3 messages -->', out.getvalue())
+        self.assertIn('  1 cover letters', out.getvalue())
+        self.assertIn('  2 patches', out.getvalue())
+
+        self.assertEqual(models.Series.objects.count(), 1)
+        series = models.Series.objects.first()
+        self.assertIsNotNone(series.cover_letter)
+        self.assertEqual(series.patches.count(), 2)
+
+        out = StringIO()
+        call_command('parsearchive', path, list_id=project.listid,
+                     batch_size=2, stdout=out)
+
+        self.assertIn('  3 duplicates', out.getvalue())
+        self.assertEqual(models.Submission.objects.count(), 3)
+
+    def test_known_duplicates(self):
+        project = utils.create_project()
+        utils.create_state()
+        path = os.path.join(TEST_SERIES_DIR, 'base-cover-letter.mbox')
+
+        out = StringIO()
+        call_command('parsearchive', path, list_id=project.listid,
+                     stdout=out)
+
+        self.assertIn('  0 known duplicates', out.getvalue())
+
+        # mails already stored are skipped without being saved, whether
+        # they were stored as submissions or comments
+        models.Comment.objects.create(
+            submission=models.Patch.objects.first(),
+            msgid=models.CoverLetter.objects.get().msgid,
+            submitter=utils.create_person())
+        models.CoverLetter.objects.all().delete()
+
+        out = StringIO()
+        call_command('parsearchive', path, list_id=project.listid,
+                     jobs=2, preload=True, stdout=out)
+
+        self.assertIn('  3 known duplicates', out.getvalue())
+        self.assertIn('  0 duplicates', out.getvalue())
+        self.assertIn('Total: 0 new entries', out.getvalue())
+
+    def test_known_duplicates_confirmed(self):
+        """Validate mails matching a preloaded message ID are confirmed."""
+        project = utils.create_project()
+        utils.create_state()
+        path = os.path.join(TEST_SERIES_DIR, 'base-cover-letter.mbox')
+        reader = open_archive(path)
+        self.addCleanup(reader.close)
+        messages = list(reader)
+
+        parsearchive._init_worker(project.listid, {
+            project.listid: project.linkname}, {
+            project.listid: MsgidSet(['<unrelated@example.com>'])})
+        self.assertEqual(parsearchive._extract_worker(messages[0])[1], 'ok')
+
+        # a mail which matches but isn't stored, such as one whose message
+        # ID has the same hash as a stored mail, is still parsed
+        msgid = parsearchive._extract_worker(messages[0])[2].msgid
+        parsearchive._init_worker(project.listid, {
+            project.listid: project.linkname}, {
+            project.listid: MsgidSet([msgid])})
+        extracted = [parsearchive._extract_worker(message)
+                     for message in messages]
+        self.assertEqual(extracted[0][1], 'known')
+
+        projects = {project.listid: project}
+        results = list(parsearchive.Command._confirm_known(
+            extracted, projects))
+        self.assertEqual([result[1] for result in results], ['ok'] * 3)
+
+        utils.create_cover(project=project, msgid=msgid)
+        results = list(parsearchive.Command._confirm_known(
+            extracted, projects))
+        self.assertEqual([result[1] for result in results],
+                         ['skipped', 'ok', 'ok'])
+
+    def test_resume(self):
+        project = utils.create_project()
+        utils.create_state()
+        path = os.path.join(TEST_SERIES_DIR, 'base-cover-letter.mbox')
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        checkpoint = os.path.join(tmpdir, 'checkpoint')
+
+        # resuming without a checkpoint imports everything
+        out = StringIO()
+        call_command('parsearchive', path, list_id=project.listid,
+                     checkpoint=checkpoint, resume=True, stdout=out)
+
+        self.assertIn('Processed 3 messages -->', out.getvalue())
+        self.assertEqual(models.Submission.objects.count(), 3)
+
+        out = StringIO()
+        call_command('parsearchive', path, list_id=project.listid,
+                     checkpoint=checkpoint, resume=True, stdout=out)
+
+        self.assertIn('Processed 0 messages -->', out.getvalue())
+
+        # mails are only skipped when resuming
+        out = StringIO()
+        call_command('parsearchive', path, list_id=project.listid,
+                     checkpoint=checkpoint, batch_size=2, stdout=out)
+
+        self.assertIn('Processed 3 messages -->', out.getvalue())
+        self.assertIn('  3 duplicates', out.getvalue())
+
+    def test_resume_maildir(self):
+        project = utils.create_project()
+        utils.create_state()
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, 'maildir')
+        checkpoint = os.path.join(tmpdir, 'checkpoint')
+
+        mbox = mailbox.mbox(
+            os.path.join(TEST_SERIES_DIR, 'base-cover-letter.mbox'))
+        maildir = mailbox.Maildir(path)
+        messages = list(mbox)
+        maildir.add(messages[0])
+
+        out = StringIO()
+        call_command('parsearchive', path, list_id=project.listid,
+                     checkpoint=checkpoint, batch_size=2, stdout=out)
+
+        self.assertIn('Processed 1 messages -->', out.getvalue())
+
+        for message in messages[1:]:
+            maildir.add(message)
+
+        out = StringIO()
+        call_command('parsearchive', path, list_id=project.listid,
+                     checkpoint=checkpoint, resume=True, batch_size=2,
+                     stdout=out)
+
+        self.assertIn('Processed 2 messages -->', out.getvalue())
+        self.assertIn('  2 patches', out.getvalue())
+        self.assertEqual(models.Submission.objects.count(), 3)
+
+    def test_resume_requires_checkpoint(self):
+        out = StringIO()
+        with self.assertRaises(SystemExit) as exc:
+            call_command('parsearchive',
+                         os.path.join(TEST_SERIES_DIR,
+                                      'base-cover-letter.mbox'),
+                         resume=True, stdout=out)
+        self.assertEqual(exc.exception.code, 1)
+
+    def test_since_offset(self):
+        project = utils.create_project()
+        utils.create_state()
+        path = os.path.join(TEST_SERIES_DIR, 'base-cover-letter.mbox')
+
+        reader = open_archive(path)
+        offsets = [offset for offset, _ in reader]
+        reader.close()
+
+        out = StringIO()
+        call_command('parsearchive', path, list_id=project.listid,
+                     since_offset=offsets[1], stdout=out)
+
+        self.assertIn('Processed 2 messages -->', out.getvalue())
+        self.assertIn('  2 patches', out.getvalue())
+
+    def test_stdin(self):
+        project = utils.create_project()
+        utils.create_state()
+
+        path = os.path.join(TEST_SERIES_DIR, 'base-cover-letter.mbox')
+        sys.stdin.close()
+        sys.stdin = open(path)
+        out = StringIO()
+        call_command('parsearchive', list_id=project.listid, stdout=out)
+        sys.stdin.close()
+
+        self.assertIn('Processed 3 messages -->', out.getvalue())
+        self.assertIn('  2 patches', out.getvalue())
+
+
+class UpdatecommitsTest(TestCase):
+
+    def setUp(self):
+        self.project = utils.create_project()
+        self.state = utils.create_state(name='Accepted')
+        self.repo = tempfile.mkdtemp()
+
+        self._git('init', '-q')
+        with open(os.path.join(self.repo, 'meep.text'), 'w') as f:
+            f.write('meep\n')
+        self._commit('Initial commit')
+        with open(os.path.join(self.repo, 'meep.text'), 'a') as f:
+            f.write('meep\n')
+        self.commit = self._commit('Add a line')
+
+    def tearDown(self):
+        shutil.rmtree(self.repo)
+
+    def _git(self, *args):
+        cmd = ['git', '-c', 'user.name=Test',
+               '-c', 'user.email=test@example.com'] + list(args)
+        return subprocess.check_output(
+            cmd, cwd=self.repo).decode('ascii').strip()
+
+    def _commit(self, message):
+        self._git('add', '-A')
+        self._git('commit', '-q', '-m', message)
+        return self._git('rev-parse', 'HEAD')
+
+    def test_update(self):
+        diff = utils.read_patch('0001-add-line.patch')
+        patch = utils.create_patch(project=self.project, diff=diff)
+        # a patch in another project with the same diff is left alone
+        other = utils.create_patch(diff=diff)
+
+        out = StringIO()
+        call_command('updatecommits', 'HEAD', repo=self.repo,
+                     project=self.project.linkname, stdout=out)
+
+        patch = models.Patch.objects.get(id=patch.id)
+        self.assertEqual(patch.state, self.state)
+        self.assertEqual(patch.commit_ref, self.commit)
+        self.assertNotEqual(models.Patch.objects.get(id=other.id).state,
+                            self.state)
+        self.assertIn('1 patch(es) updated to state Accepted, 1 commit(s) '
+                      'without a patch', out.getvalue())
+
+        # nothing is changed when run again
+        out = StringIO()
+        call_command('updatecommits', 'HEAD', repo=self.repo,
+                     project=self.project.linkname, stdout=out)
+        self.assertIn('0 patch(es) updated', out.getvalue())
+
+    def test_invalid_revspec(self):
+        with self.assertRaises(CommandError):
+            call_command('updatecommits', 'invalid..HEAD', repo=self.repo,
+                         project=self.project.linkname, stdout=StringIO())
+
+    def test_invalid_state(self):
+        with self.assertRaises(CommandError):
+            call_command('updatecommits', 'HEAD', repo=self.repo,
+                         project=self.project.linkname, state='invalid')
+
+
+class RehashTest(TestCase):
+
+    def setUp(self):
+        self.patches = utils.create_patches(3)
+        self.hashes = dict((patch.id, patch.hash) for patch in self.patches)
+
+    def _rehash(self, *args, **kwargs):
+        out = StringIO()
+        call_command('rehash', *args, stdout=out, **kwargs)
+        return out.getvalue()
+
+    def test_rehash(self):
+        models.Patch.objects.update(hash='invalid')
+
+        out = self._rehash(chunk_size=2)
+
+        for patch in models.Patch.objects.all():
+            self.assertEqual(patch.hash, self.hashes[patch.id])
+        self.assertIn('Rehashed 3 patches (3 changed)', out)
+
+        # unchanged hashes aren't written again
+        self.assertIn('Rehashed 3 patches (0 changed)', self._rehash())
+
+    def test_rehash_ids(self):
+        models.Patch.objects.update(hash='invalid')
+
+        out = self._rehash(str(self.patches[0].id))
+
+        self.assertEqual(models.Patch.objects.get(id=self.patches[0].id).hash,
+                         self.hashes[self.patches[0].id])
+        self.assertEqual(models.Patch.objects.filter(
+            hash='invalid').count(), 2)
+        self.assertIn('Rehashed 1 patches (1 changed)', out)
+
+    def test_rehash_parallel(self):
+        models.Patch.objects.update(hash='invalid')
+
+        out = self._rehash(jobs=2, chunk_size=1)
+
+        for patch in models.Patch.objects.all():
+            self.assertEqual(patch.hash, self.hashes[patch.id])
+        self.assertIn('Rehashed 3 patches (3 changed)', out)
+
+
+class ReindexTest(TestCase):
+
+    def setUp(self):
+        self.patches = utils.create_patches(3)
+        self.cover = utils.create_cover()
+
+    def _reindex(self, *args, **kwargs):
+        out = StringIO()
+        call_command('reindex', *args, stdout=out, **kwargs)
+        return out.getvalue()
+
+    def test_reindex(self):
+        models.SearchDocument.objects.all().delete()
+
+        out = self._reindex(chunk_size=2)
+
+        self.assertEqual(models.SearchDocument.objects.count(), 4)
+        self.assertEqual(
+            models.SearchDocument.objects.get(submission=self.cover).title,
+            self.cover.name)
+        self.assertIn('Reindexed 4 submissions', out)
+
+    def test_reindex_ids(self):
+        models.SearchDocument.objects.all().delete()
+
+        out = self._reindex(str(self.patches[0].id))
+
+        self.assertEqual(list(models.SearchDocument.objects.values_list(
+            'submission', flat=True)), [self.patches[0].id])
+        self.assertIn('Reindexed 1 submissions', out)
+
+
+class UpdateFilesTest(TestCase):
+
+    def setUp(self):
+        self.patches = utils.create_patches(
+            3, diff='--- a/foo.c\n+++ b/foo.c\n@@ -1 +1 @@\n-a\n+b\n')
+
+    def _update(self, *args, **kwargs):
+        out = StringIO()
+        call_command('updatefiles', *args, stdout=out, **kwargs)
+        return out.getvalue()
+
+    def test_update(self):
+        models.PatchFile.objects.all().delete()
+
+        out = self._update(chunk_size=2)
+
+        for patch in self.patches:
+            self.assertEqual(list(patch.patchfile_set.values_list(
+                'path', flat=True)), ['foo.c'])
+        self.assertIn('Updated 3 patches (3 files)', out)
+
+    def test_update_ids(self):
+        models.PatchFile.objects.all().delete()
+
+        out = self._update(str(self.patches[0].id))
+
+        self.assertEqual(list(models.PatchFile.objects.values_list(
+            'patch', flat=True)), [self.patches[0].id])
+        self.assertIn('Updated 1 patches (1 files)', out)
+
+    def test_update_diffstat(self):
+        models.Patch.objects.update(files_changed=None, lines_added=None,
+                                    lines_removed=None)
+
+        self._update(chunk_size=2)
+
+        self.assertEqual(
+            list(models.Patch.objects.values_list(
+                'files_changed', 'lines_added', 'lines_removed')),
+            [(1, 1, 1)] * 3)
+
+
+@override_settings(TEXT_COMPRESSION_MIN_LENGTH=100)
+class CompressTextTest(TestCase):
+
+    diff = '--- a/foo.c\n+++ b/foo.c\n@@ -1 +1 @@\n-a\n+b\n' * 10
+
+    def setUp(self):
+        self.patches = utils.create_patches(2, diff=self.diff)
+        self.patches.append(utils.create_patch(diff='short'))
+        # store the diffs as they were before compression was added, as
+        # text or as binary data, depending on the database
+        with connection.cursor() as cursor:
+            for patch, diff in zip(self.patches, [
+                    self.diff,
+                    connection.Database.Binary(self.diff.encode('ascii'))]):
+                cursor.execute('UPDATE patchwork_patch SET diff = %s WHERE '
+                               'submission_ptr_id = %s', [diff, patch.pk])
+
+    def _stored(self):
+        return [models.Patch.objects.filter(pk=patch.pk).extra(
+            select={'stored': 'patchwork_patch.diff'}).values_list(
+                'stored', flat=True)[0] for patch in self.patches]
+
+    def test_compress(self):
+        out = StringIO()
+        call_command('compresstext', chunk_size=1, stdout=out)
+
+        stored = self._stored()
+        self.assertTrue(is_compressed(stored[0]))
+        self.assertTrue(is_compressed(stored[1]))
+        self.assertEqual(bytes(stored[2]), b'short')
+        self.assertEqual([models.Patch.objects.get(pk=patch.pk).diff
+                          for patch in self.patches],
+                         [self.diff, self.diff, 'short'])
+        self.assertIn('Compressed 2 values', out.getvalue())
+
+        # compressed values are skipped when run again
+        out = StringIO()
+        call_command('compresstext', stdout=out)
+        self.assertEqual(self._stored(), stored)
+        self.assertIn('Compressed 0 values', out.getvalue())
@@ -0,0 +1,125 @@
+# Patchwork - automated patch tracking system
+#
+# This file is part of the Patchwork package.
+#
+# Patchwork is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Patchwork is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Patchwork; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+from email.utils import make_msgid
+
+from django.test import TestCase
+
+from patchwork.models import MessageIndex
+from patchwork.parser import find_submission_for_comment
+from patchwork.tests.utils import create_comment
+from patchwork.tests.utils import create_cover
+from patchwork.tests.utils import create_patch
+from patchwork.tests.utils import create_project
+from patchwork.tests.utils import create_series
+from patchwork.tests.utils import create_series_reference
+
+
+class MessageIndexTest(TestCase):
+
+    def setUp(self):
+        self.project = create_project()
+
+    def _entry(self, msgid):
+        return MessageIndex.objects.get(project=self.project, msgid=msgid)
+
+    def test_submissions(self):
+        patch = create_patch(project=self.project)
+        cover = create_cover(project=self.project)
+
+        self.assertEqual(self._entry(patch.msgid).submission_id, patch.id)
+        self.assertEqual(self._entry(cover.msgid).submission_id, cover.id)
+
+    def test_comment(self):
+        patch = create_patch(project=self.project)
+        comment = create_comment(submission=patch)
+
+        self.assertEqual(self._entry(comment.msgid).submission_id, patch.id)
+
+        comment.delete()
+        self.assertIsNone(self._entry(comment.msgid).submission)
+        self.assertEqual(self._entry(patch.msgid).submission_id, patch.id)
+
+    def test_submission_precedence(self):
+        """Validate a submission takes precedence over comments."""
+        patch_a = create_patch(project=self.project)
+        patch_b = create_patch(project=self.project)
+        comment = create_comment(submission=patch_b)
+
+        cover = create_cover(project=self.project, msgid=comment.msgid)
+        self.assertEqual(self._entry(comment.msgid).submission_id, cover.id)
+
+        create_comment(submission=patch_a, msgid=comment.msgid)
+        self.assertEqual(self._entry(comment.msgid).submission_id, cover.id)
+
+    def test_latest_comment(self):
+        """Validate the most recent comment with a msgid is used."""
+        patch_a = create_patch(project=self.project)
+        patch_b = create_patch(project=self.project)
+        comment = create_comment(submission=patch_a)
+
+        create_comment(submission=patch_b, msgid=comment.msgid)
+        self.assertEqual(self._entry(comment.msgid).submission_id,
+                         patch_b.id)
+
+    def test_series_reference(self):
+        series_a = create_series(project=self.project)
+        series_b = create_series(project=self.project)
+        patch = create_patch(project=self.project)
+
+        create_series_reference(series=series_a, msgid=patch.msgid)
+        entry = self._entry(patch.msgid)
+        self.assertEqual(entry.submission_id, patch.id)
+        self.assertEqual(entry.series_id, series_a.id)
+
+        # the first series to reference a msgid is used
+        create_series_reference(series=series_b, msgid=patch.msgid)
+        self.assertEqual(self._entry(patch.msgid).series_id, series_a.id)
+
+        series_a.delete()
+        self.assertIsNone(self._entry(patch.msgid).series)
+
+    def test_record_merges(self):
+        patch = create_patch(project=self.project)
+        series = create_series(project=self.project)
+        msgid = make_msgid()
+
+        MessageIndex.objects.record(self.project.id, [
+            (msgid, None, series.id, False),
+            (msgid, patch.id, None, False),
+        ])
+
+        entry = self._entry(msgid)
+        self.assertEqual(entry.submission_id, patch.id)
+        self.assertEqual(entry.series_id, series.id)
+
+    def test_lookup_queries(self):
+        """Validate references are resolved with a single query."""
+        patch = create_patch(project=self.project)
+        refs = [make_msgid() for _ in range(30)] + [patch.msgid]
+
+        with self.assertNumQueries(1):
+            submission = find_submission_for_comment(self.project, refs)
+
+        self.assertEqual(submission.id, patch.id)
+
+    def test_other_project(self):
+        patch = create_patch()
+
+        self.assertIsNone(
+            find_submission_for_comment(self.project, [patch.msgid]))
@@ -17,9 +17,17 @@
 # along with Patchwork; if not, write to the Free Software
 # Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 
+import unittest
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 
 from patchwork.compat import reverse
+from patchwork.models import Patch
+from patchwork.paginator import estimate_count
 from patchwork.tests.utils import create_patches
 from patchwork.tests.utils import create_project
 from patchwork.tests.utils import create_user
@@ -73,3 +81,112 @@ class PaginatorTest(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.context['page'].object_list[0].id,
                          self.patches[-1].id)
+
+
+class PaginatorCountTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.project = create_project()
+        create_patches(3, project=self.project)
+
+    def _count_queries(self):
+        url = reverse('patch-list', kwargs={
+            'project_id': self.project.linkname})
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len([q for q in ctx.captured_queries
+                    if 'COUNT(' in q['sql'].upper()])
+
+    def test_count(self):
+        self.assertEqual(self._count_queries(), 1)
+        self.assertEqual(self._count_queries(), 1)
+
+    @override_settings(PAGINATOR_COUNT_CACHE_TIMEOUT=60)
+    def test_count_cached(self):
+        self.assertEqual(self._count_queries(), 1)
+        self.assertEqual(self._count_queries(), 0)
+
+    @unittest.skipUnless(connection.vendor == 'postgresql',
+                         'requires PostgreSQL')
+    def test_estimate(self):
+        self.assertIsNotNone(estimate_count(Patch.objects.all()))
+
+    @unittest.skipIf(connection.vendor == 'postgresql',
+                     'estimates are supported by PostgreSQL')
+    def test_estimate_unsupported(self):
+        self.assertIsNone(estimate_count(Patch.objects.all()))
+
+
+@override_settings(PAGINATOR_MAX_OFFSET=2 * ITEMS_PER_PAGE)
+class PaginatorMaxOffsetTest(TestCase):
+
+    def setUp(self):
+        self.user = create_user()
+        self.user.profile.items_per_page = ITEMS_PER_PAGE
+        self.user.profile.save()
+        self.project = create_project()
+        self.patches = create_patches(10, project=self.project)
+        self.client.login(username=self.user.username,
+                          password=self.user.username)
+
+    def _get_page(self, params):
+        response = self.client.get(
+            reverse('patch-list', kwargs={
+                'project_id': self.project.linkname}),
+            params)
+        self.assertEqual(response.status_code, 200)
+        return response.context['page']
+
+    def _walk(self, page, forward, **params):
+        ids = [patch.id for patch in page.object_list]
+        while page.has_next() if forward else page.has_previous():
+            if forward:
+                params['page'] = page.next_page_number()
+                cursor = ('after', page.next_cursor)
+            else:
+                params['page'] = page.previous_page_number()
+                cursor = ('before', page.previous_cursor)
+            params.pop('after', None)
+            params.pop('before', None)
+            if cursor[1]:
+                params[cursor[0]] = cursor[1]
+            page = self._get_page(params)
+            ids.extend(patch.id for patch in page.object_list)
+        return ids
+
+    def test_next(self):
+        expected = [patch.id for patch in reversed(self.patches)]
+        self.assertEqual(self._walk(self._get_page({}), True), expected)
+
+    def test_previous(self):
+        expected = [patch.id for patch in self.patches]
+        page = self._get_page({'page': len(self.patches)})
+        self.assertEqual(page.object_list[0].id, self.patches[0].id)
+        self.assertEqual(self._walk(page, False), expected)
+
+    def test_order(self):
+        patches = sorted(self.patches, key=lambda patch: (patch.name,
+                                                          patch.id))
+        expected = [patch.id for patch in patches]
+        page = self._get_page({'order': 'name'})
+        self.assertEqual(self._walk(page, True, order='name'), expected)
+
+    def test_cursors(self):
+        page = self._get_page({'page': 3})
+        self.assertIsNone(page.previous_cursor)
+        self.assertIsNotNone(page.next_cursor)
+        self.assertEqual(page.paginator.adjacent_set, [1, 2, 3])
+
+        # the middle pages can only be reached from their neighbours
+        page = self._get_page({'page': 4, 'after': page.next_cursor})
+        self.assertEqual(page.object_list[0].id, self.patches[-4].id)
+        page = self._get_page({'page': 5, 'after': page.next_cursor})
+        self.assertEqual(page.paginator.adjacent_set, [5])
+        self.assertEqual(page.paginator.trailing_set, [1, 2])
+        self.assertEqual(page.paginator.leading_set, [9, 10])
+
+    def test_invalid_cursor(self):
+        page = self._get_page({'page': 5, 'after': 'foo'})
+        self.assertEqual(page.object_list[0].id, self.patches[-5].id)
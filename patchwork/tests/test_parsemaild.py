@@ -0,0 +1,186 @@
+# Patchwork - automated patch tracking system
+#
+# This file is part of the Patchwork package.
+#
+# Patchwork is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Patchwork is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Patchwork; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+import os
+import shutil
+import smtplib
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+
+from django.test import TestCase
+
+from patchwork.management.commands import parsemaild
+from patchwork.models import Patch
+from patchwork.tests import TEST_MAIL_DIR
+from patchwork.tests import utils
+
+CLIENT = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'bin',
+                      'parsemaild-client')
+
+
+def _read_mail(name='0001-git-pull-request.mbox'):
+    with open(os.path.join(TEST_MAIL_DIR, name), 'rb') as f:
+        return f.read()
+
+
+def _send(path, data):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(path)
+    sock.sendall(data)
+    sock.shutdown(socket.SHUT_WR)
+    response = sock.makefile('rb').read()
+    sock.close()
+    return response.decode('ascii').strip()
+
+
+class _Thread(threading.Thread):
+    """Call a function in a thread, saving the result."""
+
+    def __init__(self, fn, *args):
+        super(_Thread, self).__init__()
+        self.daemon = True
+        self.fn = fn
+        self.args = args
+        self.result = None
+
+    def run(self):
+        self.result = self.fn(*self.args)
+
+
+class ParsemaildTest(TestCase):
+
+    def setUp(self):
+        self.project = utils.create_project()
+        utils.create_state()
+
+        self.tmpdir = tempfile.mkdtemp()
+        self.socket = os.path.join(self.tmpdir, 'parsemaild.sock')
+        self.server = parsemaild.MailServer(self.project.listid,
+                                            queue_size=1, timeout=0.1)
+
+    def tearDown(self):
+        self.server.shutdown()
+        shutil.rmtree(self.tmpdir)
+
+    def _process(self, thread):
+        """Parse mails on this thread until the client is done."""
+        while thread.is_alive():
+            self.server.process(timeout=0.1)
+        thread.join()
+        return thread.result
+
+    def test_socket(self):
+        self.server.add_unix_listener(self.socket, parsemaild.SocketHandler,
+                                      0o660)
+        self.assertEqual(os.stat(self.socket).st_mode & 0o777, 0o660)
+
+        thread = _Thread(_send, self.socket, _read_mail())
+        thread.start()
+
+        self.assertEqual(self._process(thread), parsemaild.STATUS_OK)
+        self.assertEqual(Patch.objects.filter(project=self.project).count(),
+                         1)
+
+    def test_socket_dropped(self):
+        self.server.add_unix_listener(self.socket, parsemaild.SocketHandler)
+
+        # a mail without a patch, which isn't a reply to anything
+        mail = (b'Message-Id: <1@example.com>\n'
+                b'From: Test <test@example.com>\n'
+                b'Subject: Hello\n\n'
+                b'Hello\n')
+        thread = _Thread(_send, self.socket, mail)
+        thread.start()
+
+        self.assertEqual(self._process(thread), parsemaild.STATUS_DROPPED)
+        self.assertEqual(Patch.objects.count(), 0)
+
+    def test_stale_socket(self):
+        self.server.add_unix_listener(self.socket, parsemaild.SocketHandler)
+        self.server.shutdown()
+
+        # an existing socket is replaced, but other files are not
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(self.socket)
+        stale.close()
+        self.server.add_unix_listener(self.socket, parsemaild.SocketHandler)
+        self.server.shutdown()
+
+        path = os.path.join(self.tmpdir, 'file')
+        open(path, 'w').close()
+        with self.assertRaises(ValueError):
+            self.server.add_unix_listener(path, parsemaild.SocketHandler)
+
+    def test_busy(self):
+        # fill the queue, so the next mail can't be accepted
+        self.server.queue.put(parsemaild._Job(b''))
+        self.assertEqual(self.server.submit(_read_mail()),
+                         parsemaild.STATUS_BUSY)
+
+        self.assertTrue(self.server.process(timeout=0))
+        self.assertFalse(self.server.process(timeout=0))
+        self.assertEqual(Patch.objects.count(), 0)
+
+    def test_lmtp(self):
+        path = os.path.join(self.tmpdir, 'lmtp.sock')
+        self.server.add_unix_listener(path, parsemaild.LMTPHandler)
+
+        def deliver():
+            client = smtplib.LMTP(path)
+            try:
+                return client.sendmail('sender@example.com',
+                                       ['patchwork@example.com'],
+                                       _read_mail())
+            finally:
+                client.quit()
+
+        thread = _Thread(deliver)
+        thread.start()
+
+        # an empty dict means the recipient accepted the mail
+        self.assertEqual(self._process(thread), {})
+        self.assertEqual(Patch.objects.filter(project=self.project).count(),
+                         1)
+
+    def test_client(self):
+        self.server.add_unix_listener(self.socket, parsemaild.SocketHandler)
+
+        def run_client():
+            with open(os.path.join(TEST_MAIL_DIR,
+                                   '0001-git-pull-request.mbox')) as f:
+                return subprocess.call(
+                    [sys.executable, CLIENT, '--socket', self.socket],
+                    stdin=f)
+
+        thread = _Thread(run_client)
+        thread.start()
+
+        self.assertEqual(self._process(thread), 0)
+        self.assertEqual(Patch.objects.filter(project=self.project).count(),
+                         1)
+
+    def test_client_unavailable(self):
+        with open(os.devnull) as f, open(os.devnull, 'w') as devnull:
+            code = subprocess.call(
+                [sys.executable, CLIENT, '--socket', self.socket],
+                stdin=f, stderr=devnull)
+
+        self.assertEqual(code, 75)
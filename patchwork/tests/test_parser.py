@@ -23,12 +23,14 @@ from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.utils import make_msgid
 import os
+import pickle
 import unittest
 
 from django.test import TestCase
 from django.utils import six
 
 from patchwork.models import Comment
+from patchwork.models import DelegationRule
 from patchwork.models import Patch
 from patchwork.models import Person
 from patchwork.models import State
@@ -38,6 +40,8 @@ from patchwork.parser import find_patch_content as find_content
 from patchwork.parser import find_project_by_header
 from patchwork.parser import find_series
 from patchwork.parser import parse_mail as _parse_mail
+from patchwork.parser import ParsedMail
+from patchwork.parser import parse_patch
 from patchwork.parser import parse_pull_request
 from patchwork.parser import parse_series_marker
 from patchwork.parser import parse_version
@@ -401,6 +405,49 @@ class SeriesCorrelationTest(TestCase):
         self.assertEqual(series, ref_v2.series)
 
 
+class ParsedMailTest(unittest.TestCase):
+    """Validate correct behavior of ParsedMail."""
+
+    def _create_email(self):
+        mail = 'Message-Id: <abc@example.com>\n' + \
+               'From: =?utf-8?q?Test_Us=C3=A9r?= <user@example.com>\n' + \
+               'Subject: [test-project,PATCH v2 1/3] Tests\n' + \
+               'In-Reply-To: <def@example.com>\n\n' + \
+               'test\n\n' + SAMPLE_DIFF
+        return message_from_string(mail)
+
+    def test_values(self):
+        mail = ParsedMail(self._create_email(), 'test-project').parse()
+
+        self.assertEqual(mail.msgid, '<abc@example.com>')
+        self.assertEqual(mail.author, (u'Test Us\xe9r', 'user@example.com'))
+        self.assertEqual(mail.name, '[v2,1/3] Tests')
+        self.assertEqual(mail.series_marker, (1, 3))
+        self.assertEqual(mail.version, 2)
+        self.assertEqual(mail.refs, ['<def@example.com>'])
+        self.assertFalse(mail.is_comment)
+        self.assertEqual(mail.diff, SAMPLE_DIFF)
+
+    def test_linkname(self):
+        mail = ParsedMail(self._create_email())
+        self.assertEqual(mail.name, '[test-project,v2,1/3] Tests')
+
+        mail.linkname = 'test-project'
+        self.assertEqual(mail.name, '[v2,1/3] Tests')
+
+    def test_wrap(self):
+        mail = ParsedMail(self._create_email())
+        self.assertIs(ParsedMail.wrap(mail), mail)
+        self.assertIsNot(ParsedMail.wrap(mail.mail), mail)
+
+    def test_pickle(self):
+        mail = ParsedMail(self._create_email(), 'test-project').parse()
+        mail = pickle.loads(pickle.dumps(mail))
+
+        self.assertEqual(mail.name, '[v2,1/3] Tests')
+        self.assertEqual(mail.diff, SAMPLE_DIFF)
+
+
 class SubjectEncodingTest(TestCase):
     """Validate correct handling of encoded subjects."""
 
@@ -619,6 +666,41 @@ class PatchParseTest(PatchTest):
         self.assertTrue(message is not None)
 
 
+class SplitPatchTest(unittest.TestCase):
+    """Test splitting of content into a diff and comment."""
+
+    def test_empty(self):
+        self.assertEqual(parse_patch(''), (None, '\n'))
+
+    def test_no_trailing_newline(self):
+        self.assertEqual(parse_patch('comment'), (None, 'comment\n'))
+        self.assertEqual(parse_patch('comment\n'), (None, 'comment\n\n'))
+
+    def test_large_patch(self):
+        """Validate behavior with a patch touching many files."""
+        comment = 'Change a great many files\n\nSigned-off-by: A <a@b.c>\n'
+        diff = ''.join(SAMPLE_DIFF.replace('tree.c', 'tree%d.c' % i)
+                       for i in range(1000))
+
+        result = parse_patch(comment + '---\n' + diff)
+
+        self.assertEqual(result, (diff, comment + '---\n\n'))
+
+    def test_line_endings(self):
+        """Validate only newlines end lines of the diff."""
+        diff = ('--- a/a.c\n+++ b/a.c\n@@ -1,2 +1,2 @@\n'
+                '-a\r\n+\x0c\x1c\n b\n')
+
+        self.assertEqual(parse_patch(diff), (diff, '\n'))
+
+    def test_byte_string(self):
+        diff = b'--- a/a.c\n+++ b/a.c\n@@ -1 +1 @@\n-a\n+b\n'
+        if six.PY3:
+            diff = diff.decode('ascii')
+
+        self.assertEqual(parse_patch(diff), (diff, '\n'))
+
+
 class EncodingParseTest(TestCase):
     """Test parsing of patches with different encoding issues."""
 
@@ -688,6 +770,23 @@ class DelegateRequestTest(TestCase):
         parse_mail(email)
         self.assertDelegate(None)
 
+    def test_delegate_by_filename(self):
+        DelegationRule.objects.create(project=self.project, user=self.user,
+                                      path='*')
+        email = self._get_email()
+        parse_mail(email)
+        self.assertDelegate(self.user)
+
+    def test_delegate_by_filename_priority(self):
+        other_user = create_user()
+        DelegationRule.objects.create(project=self.project, user=self.user,
+                                      path='meep.*', priority=1)
+        DelegationRule.objects.create(project=self.project, user=other_user,
+                                      path='meep.text', priority=2)
+        email = self._get_email()
+        parse_mail(email)
+        self.assertDelegate(other_user)
+
 
 class InitialPatchStateTest(TestCase):
 
@@ -0,0 +1,109 @@
+# Patchwork - automated patch tracking system
+#
+# This file is part of the Patchwork package.
+#
+# Patchwork is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Patchwork is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Patchwork; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+from django.test import TestCase
+
+from patchwork.compat import reverse
+from patchwork.models import normalize_path
+from patchwork.models import Patch
+from patchwork.models import PatchFile
+from patchwork.tests.utils import create_patch
+from patchwork.tests.utils import create_project
+
+
+def make_diff(*paths):
+    return ''.join('--- a/%s\n+++ b/%s\n@@ -1 +1 @@\n-a\n+b\n' % (path, path)
+                   for path in paths)
+
+
+class PatchFileTest(TestCase):
+
+    def _paths(self, patch):
+        return sorted(PatchFile.objects.filter(patch=patch).values_list(
+            'path', flat=True))
+
+    def test_normalize_path(self):
+        self.assertEqual(normalize_path('/drivers//net/./'), 'drivers/net')
+        self.assertEqual(normalize_path('README'), 'README')
+        self.assertEqual(normalize_path(' / '), '')
+
+    def test_create(self):
+        patch = create_patch(diff=make_diff('drivers/net/foo.c',
+                                            'drivers/net/foo.h'))
+        self.assertEqual(self._paths(patch),
+                         ['drivers/net/foo.c', 'drivers/net/foo.h'])
+
+    def test_new_file(self):
+        diff = ('--- /dev/null\n+++ b/docs/new.rst\n@@ -0,0 +1 @@\n+a\n')
+        patch = create_patch(diff=diff)
+        self.assertEqual(self._paths(patch), ['docs/new.rst'])
+
+    def test_pull_request(self):
+        patch = create_patch(diff=None, pull_url='git://example.com/repo')
+        self.assertEqual(self._paths(patch), [])
+
+    def test_update(self):
+        patch = create_patch(diff=make_diff('a.c', 'b.c'))
+        patch = Patch.objects.get(pk=patch.pk)
+        patch.diff = make_diff('b.c', 'c.c')
+        patch.save()
+
+        self.assertEqual(self._paths(patch), ['b.c', 'c.c'])
+
+    def test_matching(self):
+        paths = ['drivers/net/foo.c', 'drivers/net/phy/bar.c',
+                 'drivers/netdev.c', 'drivers/net']
+        create_patch(diff=make_diff(*paths))
+
+        def match(path):
+            return sorted(PatchFile.objects.matching(path).values_list(
+                'path', flat=True))
+
+        self.assertEqual(match('drivers/net/'), ['drivers/net',
+                                                 'drivers/net/foo.c',
+                                                 'drivers/net/phy/bar.c'])
+        self.assertEqual(match('/drivers/net/phy'), ['drivers/net/phy/bar.c'])
+        self.assertEqual(match('drivers/netdev.c'), ['drivers/netdev.c'])
+        self.assertEqual(match('drivers/ne'), [])
+
+
+class PatchFileListTest(TestCase):
+
+    def setUp(self):
+        self.project = create_project()
+        self.net = create_patch(project=self.project,
+                                diff=make_diff('drivers/net/foo.c'))
+        self.docs = create_patch(project=self.project,
+                                 diff=make_diff('Documentation/foo.rst'))
+
+    def _get_patches(self, params):
+        response = self.client.get(
+            reverse('patch-list', kwargs={
+                'project_id': self.project.linkname}),
+            params)
+        self.assertEqual(response.status_code, 200)
+        return list(response.context['page'].object_list)
+
+    def test_filter(self):
+        self.assertEqual(self._get_patches({'path': 'drivers/'}), [self.net])
+        self.assertEqual(self._get_patches({'path': 'Documentation/foo.rst'}),
+                         [self.docs])
+        self.assertEqual(self._get_patches({'path': 'fs/'}), [])
+
+    def test_filter_empty(self):
+        self.assertEqual(len(self._get_patches({'path': '/'})), 2)
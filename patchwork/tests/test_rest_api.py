@@ -18,9 +18,12 @@
 # Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 
 from email.utils import make_msgid
+import re
 import unittest
 
 from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 from patchwork.compat import reverse
 from patchwork.models import Check
@@ -353,6 +356,90 @@ class TestPatchAPI(APITestCase):
         patch_rsp = resp.data[0]
         self.assertSerialized(patch_obj, patch_rsp)
 
+    def test_list_checks(self):
+        """Validate we can filter and order patches by check state."""
+        patches = [create_patch() for _ in range(3)]
+        create_check(patch=patches[0], state=Check.STATE_SUCCESS)
+        create_check(patch=patches[2], state=Check.STATE_FAIL)
+
+        resp = self.client.get(self.api_url(), {'check': 'fail'})
+        self.assertEqual([patches[2].id], [x['id'] for x in resp.data])
+        self.assertEqual('fail', resp.data[0]['check'])
+
+        resp = self.client.get(self.api_url(), {'order': '-check'})
+        self.assertEqual([patches[2].id, patches[0].id, patches[1].id],
+                         [x['id'] for x in resp.data])
+
+    def test_list_path(self):
+        """Validate we can filter patches by the files they change."""
+        patch = create_patch(
+            diff='--- a/drivers/net/foo.c\n+++ b/drivers/net/foo.c\n'
+            '@@ -1 +1 @@\n-a\n+b\n')
+        create_patch()
+
+        resp = self.client.get(self.api_url(), {'path': 'drivers/net/'})
+        self.assertEqual([patch.id], [x['id'] for x in resp.data])
+
+        resp = self.client.get(self.api_url(), {'path': 'drivers/ne'})
+        self.assertEqual([], resp.data)
+
+    def test_list_lines(self):
+        """Validate we can filter and order patches by their size."""
+        small = create_patch(
+            diff='--- a/foo.c\n+++ b/foo.c\n@@ -1 +1 @@\n-a\n+b\n')
+        large = create_patch(
+            diff='--- a/foo.c\n+++ b/foo.c\n@@ -1 +1,3 @@\n-a\n+b\n+c\n+d\n')
+
+        resp = self.client.get(self.api_url(), {'lines': '3'})
+        self.assertEqual([large.id], [x['id'] for x in resp.data])
+        self.assertEqual({'files': 1, 'added': 3, 'removed': 1},
+                         resp.data[0]['diffstat'])
+
+        resp = self.client.get(self.api_url(), {'order': '-lines'})
+        self.assertEqual([large.id, small.id], [x['id'] for x in resp.data])
+
+    def test_list_search(self):
+        """Validate we can search patches."""
+        patches = [create_patch(name='Add a widget',
+                                content='Fix the frobnicator'),
+                   create_patch(name='Fix the frobnicator'),
+                   create_patch(name='Other')]
+
+        resp = self.client.get(self.api_url(), {'search': 'frobnicator'})
+        self.assertEqual(set([patches[0].id, patches[1].id]),
+                         set(x['id'] for x in resp.data))
+
+        resp = self.client.get(self.api_url(), {'search': 'frobnicator',
+                                                'order': '-id'})
+        self.assertEqual([patches[1].id, patches[0].id],
+                         [x['id'] for x in resp.data])
+
+    def test_list_cursor(self):
+        """Validate we can page through patches using a cursor."""
+        patches = [create_patch() for _ in range(5)]
+
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.get(self.api_url(),
+                                   {'cursor': '', 'per_page': 2})
+        self.assertFalse([query['sql'] for query in queries
+                          if 'COUNT(' in query['sql'].upper()])
+
+        ids = [x['id'] for x in resp.data]
+        # patches added while paging are returned on the last page
+        patches.append(create_patch())
+
+        while 'next' in resp.get('Link', ''):
+            url = re.search(r'<([^>]*)>; rel="next"', resp['Link']).group(1)
+            resp = self.client.get(url)
+            self.assertIn('rel="prev"', resp['Link'])
+            ids.extend(x['id'] for x in resp.data)
+
+        self.assertEqual([patch.id for patch in patches], ids)
+
+        # the order can't be changed when using a cursor
+        resp = self.client.get(self.api_url(), {'cursor': '', 'order': 'name'})
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, resp.status_code)
+
     def test_detail(self):
         """Validate we can get a specific patch."""
         patch = create_patch(
@@ -364,7 +451,8 @@ class TestPatchAPI(APITestCase):
         self.assertEqual(patch.headers, resp.data['headers'] or '')
         self.assertEqual(patch.content, resp.data['content'])
         self.assertEqual(patch.diff, resp.data['diff'])
-        self.assertEqual(0, len(resp.data['tags']))
+        self.assertEqual({'Acked-by': 0, 'Reviewed-by': 1, 'Tested-by': 0},
+                         resp.data['tags'])
 
     def test_create(self):
         """Ensure creations are rejected."""
@@ -0,0 +1,221 @@
+# Patchwork - automated patch tracking system
+#
+# This file is part of the Patchwork package.
+#
+# Patchwork is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Patchwork is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Patchwork; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+import datetime
+
+from django.db import connection
+from django.test import override_settings
+from django.test import TestCase
+
+from patchwork.compat import reverse
+from patchwork.models import CoverLetter
+from patchwork.models import Patch
+from patchwork.models import SearchDocument
+from patchwork.models import Submission
+from patchwork.search import add_comments
+from patchwork.search import get_backend
+from patchwork.search import search_submissions
+from patchwork.search import SearchBackend
+from patchwork.search import SQLITE_FTS_TABLE
+from patchwork.search import SQLiteSearchBackend
+from patchwork.search import update_documents
+from patchwork.tests.utils import create_comment
+from patchwork.tests.utils import create_cover
+from patchwork.tests.utils import create_patch
+from patchwork.tests.utils import create_patches
+from patchwork.tests.utils import create_project
+from patchwork.tests.utils import create_state
+from patchwork.tests.utils import SAMPLE_DIFF
+
+
+class SearchDocumentTest(TestCase):
+
+    def setUp(self):
+        if type(get_backend()) is SearchBackend:
+            self.skipTest('requires full-text search')
+
+    def _document(self, submission):
+        return SearchDocument.objects.get(submission=submission)
+
+    def _search(self, query):
+        return list(search_submissions(Submission.objects.all(), query))
+
+    def test_create(self):
+        patch = create_patch(name='Fix the frobnicator',
+                             content='The widget was broken.')
+        cover = create_cover(name='Frobnicator fixes')
+
+        self.assertEqual(self._document(patch).title, patch.name)
+        self.assertEqual(self._document(cover).title, cover.name)
+        self.assertEqual(self._search('widget'), [patch.submission_ptr])
+
+    def test_update(self):
+        patch = create_patch()
+        patch = Patch.objects.get(pk=patch.pk)
+        patch.name = 'Fix the frobnicator'
+        patch.save()
+
+        self.assertEqual(self._document(patch).title, patch.name)
+
+    def test_update_unchanged(self):
+        """Validate changes to the state don't rewrite the document."""
+        patch = create_patch()
+        SearchDocument.objects.filter(submission=patch).update(title='stale')
+
+        patch = Patch.objects.get(pk=patch.pk)
+        patch.state = create_state()
+        patch.save()
+
+        self.assertEqual(self._document(patch).title, 'stale')
+
+    def test_diff(self):
+        patch = create_patch(content='Commit message',
+                             diff=SAMPLE_DIFF + '+frobnicator\n')
+        self.assertEqual(self._search('frobnicator'), [])
+
+        with self.settings(SEARCH_INDEX_DIFFS=True):
+            update_documents([patch.id])
+        self.assertEqual(self._search('frobnicator'), [patch.submission_ptr])
+        self.assertEqual(self._search('commit'), [patch.submission_ptr])
+
+    @override_settings(SEARCH_INDEX_COMMENTS=True)
+    def test_comments(self):
+        patch = create_patch(content='Commit message')
+        comment = create_comment(submission=patch, content='Looks good')
+        create_comment(submission=patch, content='Tested')
+        for query in ('commit', 'looks good', 'tested'):
+            self.assertEqual(self._search(query), [patch.submission_ptr])
+
+        comment.delete()
+        self.assertEqual(self._search('looks'), [])
+        self.assertEqual(self._search('tested'), [patch.submission_ptr])
+
+        create_comment(submission=patch)
+        patch.delete()
+        self.assertFalse(SearchDocument.objects.exists())
+
+    @override_settings(SEARCH_INDEX_COMMENTS=True)
+    def test_add_comments(self):
+        """Validate new comments don't rebuild the whole document."""
+        patch = create_patch(content='Commit message')
+        for _ in range(5):
+            create_comment(submission=patch)
+        comment = create_comment(submission=patch, content='Looks good')
+
+        with self.assertNumQueries(1):
+            add_comments([comment])
+
+    def test_delete(self):
+        if type(get_backend()) is not SQLiteSearchBackend:
+            self.skipTest('requires SQLite')
+
+        create_patch().delete()
+
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM %s' % SQLITE_FTS_TABLE)
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+
+class SearchTest(TestCase):
+
+    def setUp(self):
+        self.project = create_project()
+        self.title = create_patch(project=self.project,
+                                  name='Fix the frobnicator')
+        self.body = create_patch(project=self.project, name='Add a widget',
+                                 content='This uses the frobnicator.')
+        self.other = create_patch(project=self.project, name='Other')
+
+    def _search(self, query, queryset=None):
+        if queryset is None:
+            queryset = Patch.objects.all()
+        return list(search_submissions(queryset, query).order_by(
+            '-search_rank', 'id'))
+
+    def test_search(self):
+        self.assertEqual(self._search('frobnicator'), [self.title, self.body])
+        self.assertEqual(self._search('fix frobnicator'), [self.title])
+        self.assertEqual(self._search('widget'), [self.body])
+        self.assertEqual(self._search('nothing'), [])
+
+    def test_cover_letters(self):
+        cover = create_cover(project=self.project, name='Frobnicator fixes')
+        self.assertEqual(self._search('frobnicator', CoverLetter.objects),
+                         [cover])
+
+    def test_syntax(self):
+        """Validate characters in queries aren't treated as syntax."""
+        for query in ['"frobnicator', 'frobnicator AND', '* OR -(']:
+            self._search(query)
+
+    def test_rank(self):
+        if type(get_backend()) is SearchBackend:
+            self.skipTest('requires full-text search')
+
+        # matches in the title rank higher than those in the body
+        create_patches(10, project=self.project)
+        results = search_submissions(Patch.objects.all(), 'frobnicator')
+        ranks = dict((patch.id, patch.search_rank) for patch in results)
+        self.assertGreater(ranks[self.title.id], ranks[self.body.id])
+
+    def test_fallback(self):
+        """Validate databases without full-text search only match titles."""
+        backend = SearchBackend('default')
+        self.assertEqual(
+            list(Patch.objects.filter(backend.match('fix frobnicator'))),
+            [self.title])
+        self.assertFalse(Patch.objects.filter(backend.match('uses')).exists())
+
+    def test_unindexed(self):
+        """Validate submissions without a document match their title."""
+        if type(get_backend()) is SearchBackend:
+            self.skipTest('requires full-text search')
+
+        SearchDocument.objects.filter(submission=self.title).delete()
+        SearchDocument.objects.filter(submission=self.body).delete()
+        self.assertEqual(self._search('fix frobnicator'), [self.title])
+        self.assertEqual(self._search('uses'), [])
+
+    def test_list(self):
+        response = self.client.get(
+            reverse('patch-list', kwargs={
+                'project_id': self.project.linkname}),
+            {'q': 'frobnicator'})
+
+        self.assertEqual(set(response.context['page'].object_list),
+                         set([self.title, self.body]))
+
+    def test_list_rank(self):
+        """Validate search results are ordered by rank by default."""
+        if type(get_backend()) is SearchBackend:
+            self.skipTest('requires full-text search')
+
+        url = reverse('patch-list', kwargs={
+            'project_id': self.project.linkname})
+        # the title match is older, so is listed last by date
+        self.title.date = self.body.date - datetime.timedelta(days=1)
+        self.title.save()
+
+        response = self.client.get(url, {'q': 'frobnicator'})
+        self.assertEqual(list(response.context['page'].object_list),
+                         [self.title, self.body])
+
+        response = self.client.get(url, {'q': 'frobnicator',
+                                         'order': '-date'})
+        self.assertEqual(list(response.context['page'].object_list),
+                         [self.body, self.title])
@@ -24,12 +24,10 @@ from django.test import TestCase
 
 from patchwork import models
 from patchwork import parser
+from patchwork.tests import TEST_SERIES_DIR
 from patchwork.tests import utils
 
 
-TEST_SERIES_DIR = os.path.join(os.path.dirname(__file__), 'series')
-
-
 class _BaseTestCase(TestCase):
 
     def setUp(self):
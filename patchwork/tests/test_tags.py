@@ -17,12 +17,16 @@
 # along with Patchwork; if not, write to the Free Software
 # Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 
+from django.db import connection
 from django.test import TestCase
 from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
 
 from patchwork.models import Patch
 from patchwork.models import PatchTag
 from patchwork.models import Tag
+from patchwork.tags import retag_patches
+from patchwork.tags import TagMatcher
 from patchwork.tests.utils import create_comment
 from patchwork.tests.utils import create_patch
 
@@ -180,13 +184,70 @@ class PatchTagsTest(TransactionTestCase):
         c1.save()
         self.assertTagsEqual(self.patch, 1, 1, 0)
 
+    def test_comment_update_tag(self):
+        comment = self.create_tag_comment(self.patch, self.ACK)
+        self.assertTagsEqual(self.patch, 1, 0, 0)
+
+        comment.content = self.create_tag(self.REVIEW)
+        comment.save()
+        self.assertTagsEqual(self.patch, 0, 1, 0)
+
+    def test_comment_move(self):
+        patch = create_patch(project=self.patch.project)
+        comment = self.create_tag_comment(self.patch, self.ACK)
+
+        comment.submission = patch
+        comment.save()
+        self.assertTagsEqual(self.patch, 0, 0, 0)
+        self.assertTagsEqual(patch, 1, 0, 0)
+
+    def test_comment_queries(self):
+        """Validate existing comments aren't rescanned for a new comment."""
+        for _ in range(3):
+            self.create_tag_comment(self.patch, self.ACK)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.create_tag_comment(self.patch, self.ACK)
+
+        selects = [query['sql'] for query in queries
+                   if query['sql'].startswith('SELECT')]
+        self.assertFalse([sql for sql in selects
+                          if 'patchwork_comment' in sql])
+        self.assertTagsEqual(self.patch, 4, 0, 0)
+
+    def test_patch_content_update(self):
+        patch = Patch.objects.get(pk=self.patch.pk)
+        patch.content = self.create_tag(self.ACK)
+        patch.save()
+        self.assertTagsEqual(patch, 1, 0, 0)
+
+    def test_patch_state_update(self):
+        """Validate tags aren't recounted if the content is unchanged."""
+        self.create_tag_comment(self.patch, self.ACK)
+        PatchTag.objects.filter(patch=self.patch).update(count=5)
+        Patch.objects.filter(pk=self.patch.pk).update(
+            tag_counts={Tag.objects.get(name='Acked-by').id: 5})
+
+        patch = Patch.objects.get(pk=self.patch.pk)
+        patch.archived = True
+        patch.save()
+        self.assertTagsEqual(patch, 5, 0, 0)
+
+    def test_refresh(self):
+        """Validate a full recount repairs the counts."""
+        self.create_tag_comment(self.patch, self.ACK)
+        PatchTag.objects.filter(patch=self.patch).update(count=5)
+        Patch.objects.filter(pk=self.patch.pk).update(
+            tag_counts={Tag.objects.get(name='Acked-by').id: 5})
+
+        self.patch.refresh_tag_counts()
+        self.assertTagsEqual(self.patch, 1, 0, 0)
+
 
 class PatchTagManagerTest(PatchTagsTest):
 
     def assertTagsEqual(self, patch, acks, reviews, tests):  # noqa
-        tagattrs = {}
-        for tag in Tag.objects.all():
-            tagattrs[tag.name] = tag.attr_name
+        tags = dict((tag.name, tag.id) for tag in Tag.objects.all())
 
         # force project.tags to be queried outside of the assertNumQueries
         patch.project.tags
@@ -199,9 +260,98 @@ class PatchTagManagerTest(PatchTagsTest):
                 .get(pk=patch.pk)
 
             counts = (
-                getattr(patch, tagattrs['Acked-by']),
-                getattr(patch, tagattrs['Reviewed-by']),
-                getattr(patch, tagattrs['Tested-by']),
+                patch.tag_counts.get(tags['Acked-by'], 0),
+                patch.tag_counts.get(tags['Reviewed-by'], 0),
+                patch.tag_counts.get(tags['Tested-by'], 0),
             )
 
         self.assertEqual(counts, (acks, reviews, tests))
+
+
+class _Tag(object):
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+
+
+class TagMatcherTest(TestCase):
+
+    def test_many_tags(self):
+        """Validate tags are counted when split over several regexes."""
+        tags = [_Tag(r'^(Tag%d)-by:' % i) for i in range(100)]
+        matcher = TagMatcher(tags)
+
+        counts = matcher.count('Tag1-by: a\nTag99-by: b\nTag99-by: c\n')
+        self.assertEqual(counts, {tags[1]: 1, tags[99]: 2})
+
+    def test_backreference(self):
+        tags = [_Tag(r'^Acked-by:'), _Tag(r'^(\w+)-by: \1')]
+        matcher = TagMatcher(tags)
+
+        counts = matcher.count('Acked-by: me\nFoo-by: Foo\n')
+        self.assertEqual(counts, {tags[0]: 1, tags[1]: 1})
+
+
+class RetagTest(TestCase):
+
+    fixtures = ['default_tags']
+
+    def setUp(self):
+        self.patches = [create_patch(content='Acked-by: a <a@example.com>\n')
+                        for _ in range(3)]
+        create_comment(submission=self.patches[0],
+                       content='Reviewed-by: b <b@example.com>\n')
+        create_comment(submission=self.patches[0],
+                       content='Reviewed-by: c <c@example.com>\n'
+                       'Tested-by: c <c@example.com>\n')
+        self.expected = self._counts()
+
+    def _counts(self):
+        return sorted(PatchTag.objects.values_list(
+            'patch', 'tag__name', 'count'))
+
+    def test_retag(self):
+        tag_counts = sorted(Patch.objects.values_list('id', 'tag_counts'))
+        PatchTag.objects.all().delete()
+        Patch.objects.update(tag_counts={})
+        PatchTag.objects.create(patch=self.patches[1],
+                                tag=Tag.objects.get(name='Tested-by'))
+
+        chunks = []
+        retag_patches(Patch.objects.all(), chunk_size=2,
+                      progress=chunks.append)
+
+        self.assertEqual(self._counts(), self.expected)
+        self.assertEqual(sorted(Patch.objects.values_list(
+            'id', 'tag_counts')), tag_counts)
+        self.assertEqual(chunks, [2, 1])
+
+    def test_queries(self):
+        """Validate the number of queries doesn't grow with patches."""
+        PatchTag.objects.all().delete()
+
+        # tags, patches, comments, a savepoint around the delete, insert
+        # and update of the patches, and a final empty chunk
+        with self.assertNumQueries(9):
+            retag_patches(Patch.objects.all())
+
+        self.assertEqual(self._counts(), self.expected)
+
+    def test_parallel(self):
+        PatchTag.objects.all().delete()
+
+        retag_patches(Patch.objects.all(), chunk_size=1, jobs=2)
+
+        self.assertEqual(self._counts(), self.expected)
+
+    def test_use_tags(self):
+        """Validate patches of projects not using tags are left alone."""
+        project = self.patches[1].project
+        project.use_tags = False
+        project.save()
+        PatchTag.objects.all().delete()
+
+        retag_patches(Patch.objects.all())
+
+        self.assertEqual(self._counts(), [
+            count for count in self.expected if count[0] != project.id])
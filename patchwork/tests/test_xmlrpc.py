@@ -24,6 +24,7 @@ from django.test import LiveServerTestCase
 from django.utils.six.moves import xmlrpc_client
 
 from patchwork.compat import reverse
+from patchwork.models import Tag
 from patchwork.tests import utils
 
 
@@ -188,6 +189,35 @@ class XMLRPCPatchTest(XMLRPCTest, XMLRPCFilterModelTestMixin):
         result = self.rpc.patch_get_by_hash(patch.hash)
         self.assertEqual(result['id'], patch.id)
 
+    def test_list_path(self):
+        patch = self.create_single(
+            diff='--- a/drivers/net/foo.c\n+++ b/drivers/net/foo.c\n'
+            '@@ -1 +1 @@\n-a\n+b\n')
+        self.create_multiple(2)
+
+        result = self.list_endpoint({'path': 'drivers/net'})
+        self.assertEqual([patch.id], [x['id'] for x in result])
+        self.assertEqual([], self.list_endpoint({'path': 'fs'}))
+
+    def test_list_lines(self):
+        patch = self.create_single(
+            diff='--- a/foo.c\n+++ b/foo.c\n@@ -1 +1,2 @@\n-a\n+b\n+c\n')
+        self.create_multiple(2)
+
+        result = self.list_endpoint({'lines_added__gte': 2})
+        self.assertEqual([patch.id], [x['id'] for x in result])
+        self.assertEqual((1, 2, 1), (result[0]['files_changed'],
+                                     result[0]['lines_added'],
+                                     result[0]['lines_removed']))
+
+    def test_patch_tags(self):
+        Tag.objects.create(name='Reviewed-by', pattern=r'^Reviewed-by:',
+                           abbrev='R')
+        patch = self.create_single(
+            content='Reviewed-by: Test User <test@example.com>\n')
+        result = self.rpc.patch_get(patch.id)
+        self.assertEqual(result['tags'], {'Reviewed-by': 1})
+
 
 class XMLRPCPersonTest(XMLRPCTest, XMLRPCModelTestMixin):
 
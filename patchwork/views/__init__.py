@@ -23,6 +23,7 @@ from django.shortcuts import get_object_or_404
 from patchwork.compat import is_authenticated
 from patchwork.filters import Filters
 from patchwork.forms import MultiplePatchForm
+from patchwork.lookups import get_tags
 from patchwork.models import Bundle
 from patchwork.models import BundlePatch
 from patchwork.models import Patch
@@ -56,12 +57,18 @@ class Order(object):
         'state': 'state__ordering',
         'submitter': 'submitter__name',
         'delegate': 'delegate__username',
+        'check': 'check_state',
+        'lines': 'lines_changed',
     }
     default_order = ('date', True)
+    # prefix of orders by the count of a tag, like 'tag:R'
+    tag_prefix = 'tag:'
 
     def __init__(self, str=None, editable=False):
         self.reversed = False
         self.editable = editable
+        # whether an order was given, rather than using the default
+        self.requested = False
         (self.order, self.reversed) = self.default_order
 
         if self.editable:
@@ -75,11 +82,22 @@ class Order(object):
             str = str[1:]
             reversed = True
 
-        if str not in self.order_map:
+        if str not in self.order_map and self._get_tag(str) is None:
             return
 
         self.order = str
         self.reversed = reversed
+        self.requested = True
+
+    def _get_tag(self, name):
+        if not name.startswith(self.tag_prefix):
+            return None
+
+        abbrev = name[len(self.tag_prefix):]
+        for tag in get_tags():
+            if tag.abbrev == abbrev:
+                return tag
+        return None
 
     def __str__(self):
         str = self.order
@@ -101,8 +119,24 @@ class Order(object):
             return 'up'
         return 'down'
 
-    def apply(self, qs):
-        q = self.order_map[self.order]
+    def apply(self, qs, ranked=False):
+        # search results are ordered by how well they match, unless an
+        # order was requested
+        if ranked and not self.requested:
+            (default_name, default_reverse) = self.default_order
+            q = self.order_map[default_name]
+            if default_reverse:
+                q = '-' + q
+            return qs.order_by('-search_rank', q)
+
+        tag = self._get_tag(self.order)
+        if tag is not None:
+            qs = qs.with_tag_count(tag)
+            q = 'tag_count'
+        else:
+            if self.order == 'lines':
+                qs = qs.with_lines_changed()
+            q = self.order_map[self.order]
         if self.reversed:
             q = '-' + q
 
@@ -277,7 +311,7 @@ def generic_list(request, project, view, view_args=None, filter_settings=None,
 
     patches = context['filters'].apply(patches)
     if not editable_order:
-        patches = order.apply(patches)
+        patches = order.apply(patches, ranked=context['filters'].ranked)
 
     # we don't need the content, diff or headers for a list; they're text
     # fields that can potentially contain a lot of data
@@ -287,8 +321,8 @@ def generic_list(request, project, view, view_args=None, filter_settings=None,
     # rendering the list template
     patches = patches.select_related('state', 'submitter', 'delegate')
 
-    # we also need checks and series
-    patches = patches.prefetch_related('check_set', 'series')
+    # we also need series. The state of checks is stored on the patch
+    patches = patches.prefetch_related('series')
 
     paginator = Paginator(request, patches)
 
@@ -240,6 +240,13 @@ def person_to_dict(obj):
     }
 
 
+def _count_or_unknown(value):
+    # None can't be marshalled, so unknown counts are sent as -1
+    if value is None:
+        return -1
+    return value
+
+
 def patch_to_dict(obj):
     """Serialize a patch object.
 
@@ -263,8 +270,15 @@ def patch_to_dict(obj):
         'delegate_id': 1,
         'commit_ref': '',
         'hash': '',
+        'tags': {'Acked-by': 1, 'Reviewed-by': 0, 'Tested-by': 0},
+        'files_changed': 1,
+        'lines_added': 10,
+        'lines_removed': 2,
     }
 
+    The counts of files and lines changed are -1 for patches which
+    haven't had them recorded.
+
     Args:
         Patch object to serialize.
 
@@ -288,6 +302,11 @@ def patch_to_dict(obj):
         'delegate_id': obj.delegate_id or 0,
         'commit_ref': obj.commit_ref or '',
         'hash': obj.hash or '',
+        'tags': dict((tag.name, obj.tag_counts.get(tag.id, 0))
+                     for tag in obj.project.tags),
+        'files_changed': _count_or_unknown(obj.files_changed),
+        'lines_added': _count_or_unknown(obj.lines_added),
+        'lines_removed': _count_or_unknown(obj.lines_removed),
     }
 
 
@@ -485,6 +504,13 @@ def patch_list(filt=None):
      * commit_ref
      * hash
      * msgid
+     * files_changed
+     * lines_added
+     * lines_removed
+     * path
+
+    The ``path`` filter matches patches changing a file, or any file in
+    a directory, and doesn't take a lookup type.
 
     It is also possible to specify the number of patches returned via
     a ``max_count`` filter.
@@ -551,11 +577,16 @@ def patch_list(filt=None):
         'commit_ref',
         'hash',
         'msgid',
+        'files_changed',
+        'lines_added',
+        'lines_removed',
+        'path',
         'max_count',
     ]
 
     dfilter = {}
     max_count = 0
+    path = None
 
     for key in filt:
         parts = key.split('__')
@@ -577,6 +608,10 @@ def patch_list(filt=None):
                 dfilter['state'] = State.objects.get(id=filt[key])
             elif parts[0] == 'max_count':
                 max_count = filt[key]
+            elif parts[0] == 'path':
+                if len(parts) > 1:
+                    return []
+                path = filt[key]
             else:
                 dfilter[key] = filt[key]
         except (Project.DoesNotExist, Person.DoesNotExist, State.DoesNotExist):
@@ -584,6 +619,8 @@ def patch_list(filt=None):
             return []
 
     patches = Patch.objects.filter(**dfilter)
+    if path:
+        patches = patches.touching(path)
 
     return _get_objects(patch_to_dict, patches, max_count)
 
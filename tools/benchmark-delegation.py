@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+#
+# Patchwork - automated patch tracking system
+#
+# This file is part of the Patchwork package.
+#
+# Patchwork is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Patchwork is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Patchwork; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+"""Measure the cost of matching filenames against delegation rules.
+
+The compiled delegation matcher is compared with checking each rule in
+turn using fnmatch, for a synthetic project with many rules and a patch
+touching many files.
+"""
+
+from __future__ import print_function
+
+import argparse
+import collections
+import fnmatch
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from patchwork.delegation import DelegationMatcher  # noqa
+
+Rule = collections.namedtuple('Rule', ['path', 'user'])
+
+
+def make_rules(count):
+    """Build a mix of directory, file and wildcard rules."""
+    rules = []
+    for index in range(count):
+        kind = index % 4
+        if kind == 0:
+            path = 'drivers/subsys%d/*' % index
+        elif kind == 1:
+            path = 'include/linux/header%d.h' % index
+        elif kind == 2:
+            path = 'arch/*/mach%d/*' % index
+        else:
+            path = 'Documentation/*%d*.txt' % index
+        rules.append(Rule(path, index))
+
+    rules.append(Rule('*', None))
+    return rules
+
+
+def make_filenames(count, rules):
+    filenames = []
+    for index in range(count):
+        subsys = (index * 7) % len(rules)
+        filenames.append('drivers/subsys%d/file%d.c' % (subsys, index))
+    return filenames
+
+
+def match_loop(rules, filenames):
+    for filename in filenames:
+        for rule in rules:
+            if fnmatch.fnmatch(filename, rule.path):
+                break
+
+
+def match_compiled(rules, filenames):
+    matcher = DelegationMatcher(rules)
+    for filename in filenames:
+        matcher.match(filename)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--rules', type=int, default=500,
+                        help='number of delegation rules')
+    parser.add_argument('--files', type=int, default=500,
+                        help='number of files touched by the patch')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='number of times to run each benchmark. The '
+                        'best run is reported.')
+    args = parser.parse_args()
+
+    rules = make_rules(args.rules)
+    filenames = make_filenames(args.files, rules)
+
+    for name, fn in (('fnmatch', match_loop), ('compiled', match_compiled)):
+        best = min(timeit.repeat(lambda: fn(rules, filenames),
+                                 repeat=args.repeat, number=1))
+        print('%-10s %6d rules %6d files %10.3f s' % (
+            name, len(rules), len(filenames), best))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+#
+# Patchwork - automated patch tracking system
+#
+# This file is part of the Patchwork package.
+#
+# Patchwork is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Patchwork is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Patchwork; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+"""Measure the throughput of the patch parser.
+
+Synthetic patches of increasing size are split into their diff and
+comment parts, and the throughput is reported in MB/s. Throughput
+should stay roughly constant as the size of the patch grows.
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'patchwork.settings.dev')
+
+import django  # noqa
+django.setup()
+
+from patchwork.parser import parse_patch  # noqa
+
+SIZES = [
+    ('small', 10 * 1024),
+    ('medium', 1024 * 1024),
+    ('huge', 20 * 1024 * 1024),
+]
+
+COMMENT = """\
+This is a synthetic patch used to benchmark the parser. It modifies a
+number of files with a number of hunks each.
+
+Signed-off-by: Test User <test@example.com>
+---
+"""
+
+FILE = """\
+diff --git a/src/file%(index)d.c b/src/file%(index)d.c
+index 1234567..89abcde 100644
+--- a/src/file%(index)d.c
++++ b/src/file%(index)d.c
+"""
+
+HUNK = """\
+@@ -%(line)d,7 +%(line)d,7 @@ static int function_%(line)d(void)
+ \tint ret;
+ \tret = 0;
+ \tret = do_something();
+-\tif (ret)
++\tif (ret < 0)
+ \t\treturn ret;
+ \treturn 0;
+ }
+"""
+
+
+def make_patch(size, hunks_per_file=10):
+    """Build a patch of approximately the given size, in bytes."""
+    parts = [COMMENT]
+    length = len(COMMENT)
+    index = 0
+
+    while length < size:
+        parts.append(FILE % {'index': index})
+        for hunk in range(hunks_per_file):
+            parts.append(HUNK % {'line': hunk * 20 + 1})
+        length += sum(len(part) for part in parts[-hunks_per_file - 1:])
+        index += 1
+
+    parts.append('-- \n2.7.4\n')
+    return ''.join(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='number of times to run each benchmark. The '
+                        'best run is reported.')
+    args = parser.parse_args()
+
+    for name, size in SIZES:
+        content = make_patch(size)
+        megabytes = len(content.encode('utf-8')) / (1024.0 * 1024.0)
+        best = min(timeit.repeat(lambda: parse_patch(content),
+                                 repeat=args.repeat, number=1))
+        print('%-8s %10.2f MB %10.3f s %10.2f MB/s' % (
+            name, megabytes, best, megabytes / best))
+
+
+if __name__ == '__main__':
+    main()